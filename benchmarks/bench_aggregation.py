@@ -0,0 +1,94 @@
+"""
+Benchmark: FlightTable + FlightAggregator against the previous per-airline scans.
+
+Run from the repository root:
+    python -m benchmarks.bench_aggregation
+"""
+import datetime
+import time
+from collections import Counter
+
+from benchmarks.reference_aggregation import FlightAggregator, FlightTable, busiest_hours
+from scripts.synthetic import make_payload
+
+
+SIZES = [3500, 35000, 350000]
+REPEAT = 3
+
+
+def legacy_update_departured_flight(data, top_n=5):
+    """The FlightsManager departure analysis as it was before the aggregation engine."""
+
+    airlines = []
+    airCount = dict()
+    for line in data:
+        if line["lang"]["en"]["airlineName"] not in airlines:
+            airlineName = line["lang"]["en"]["airlineName"]
+            airlines.append(airlineName)
+            airCount[airlineName] = 1
+        else:
+            airlineName = line["lang"]["en"]["airlineName"]
+            airCount[airlineName] += 1
+    keys = dict(sorted(airCount.items(), key=lambda item: item[1], reverse=True)[:top_n]).keys()
+
+    flights_data  = dict()
+    busiest       = []
+    for airlineName in keys:
+        for airtrip in data:
+            if(airlineName == airtrip["lang"]["en"]["airlineName"]):
+                if(airlineName not in flights_data):
+                    flights_data[airlineName]                     = airtrip
+                    flights_data[airlineName]["recentDep"]        = dict()
+                    flights_data[airlineName]["flightsCountered"] = 1
+                else:
+                    if(airtrip["actualTimeOfDep"]):
+                        busiest.append(int(airtrip["actualTimeOfDep"]))
+                    flights_data[airlineName]["flightsCountered"] += 1
+                    flightsCountered = flights_data[airlineName]["flightsCountered"]
+                    recentDep        = flights_data[airlineName]["recentDep"]
+                    if(int(airtrip["scheduledTime"]) > int(flights_data[airlineName]["scheduledTime"])):
+                        flights_data[airlineName]                     = airtrip
+                        flights_data[airlineName]["flightsCountered"] = flightsCountered
+                        flights_data[airlineName]["recentDep"]        = recentDep
+                    if(airtrip["actualTimeOfDep"]):
+                        flights_data[airlineName]["recentDep"] = airtrip
+
+        hours = Counter(datetime.datetime.fromtimestamp(t).hour for t in busiest)
+        top_busiest_hours = [hour for hour, _ in sorted(hours.items(), key=lambda x: x[1], reverse=True)[:24]]
+
+    return flights_data, top_busiest_hours
+
+
+def new_update_departured_flight(data, top_n=5):
+    """The FlightsManager departure analysis through the columnar table and aggregation engine."""
+
+    table                     = FlightTable.from_flights(data, "depart")
+    flights_data, hour_counts = FlightAggregator("depart", top_n).aggregate(table)
+
+    return flights_data, busiest_hours(hour_counts)
+
+
+def best_of(func, *args):
+    """Returns the best wall time in seconds of REPEAT calls."""
+
+    best = float("inf")
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+
+    return best
+
+
+def main():
+    print("%10s %6s %12s %12s %9s" % ("rows", "top_n", "legacy (ms)", "engine (ms)", "speedup"))
+    for size in SIZES:
+        for top_n in (5, 20):
+            flights = make_payload(size, "depart", seed=size)["flights"]
+            new     = best_of(new_update_departured_flight, flights, top_n)
+            legacy  = best_of(legacy_update_departured_flight, flights, top_n)
+            print("%10d %6d %12.1f %12.1f %8.1fx" % (size, top_n, legacy * 1000, new * 1000, legacy / new))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark: backfilling 90 days of departures from a local stub server.
+
+The stub holds DAYS days of synthetic departures, between 1/3 and 5/3 of
+LIMIT flights a day, and answers each request after STUB_DELAY seconds
+like a distant server, at most LIMIT flights per answer; days above the
+limit must be split to come back whole. The range is backfilled one
+request at a time, then concurrently, then concurrently under a rate
+limit, each run into an empty history: every stored flight count must
+match the stub. Then a run is interrupted half way and resumed from its
+checkpoint, every day with a movement must then have its delay sketch,
+and a last run over the complete range must send no request.
+
+Run from the repository root:
+    python -m benchmarks.bench_backfill
+"""
+import asyncio
+import bisect
+import datetime
+import logging
+import os
+import random
+import tempfile
+import time
+
+from scripts.backfill import Backfill
+from scripts.history_store import HistoryStore
+from scripts.stub_server import StubFidsServer
+from scripts.synthetic import day_start, make_payload
+
+
+DAYS = 90
+LIMIT = 1500
+STUB_DELAY = 0.05
+RATE = 20
+
+
+class DaysStub(StubFidsServer):
+    """StubFidsServer over many days of departures, windows found by bisection."""
+
+    def __init__(self, first) -> None:
+        super().__init__(0, delay=STUB_DELAY)
+        rng     = random.Random(0)
+        flights = []
+        for index in range(DAYS):
+            day = first + datetime.timedelta(index)
+            flights += make_payload(rng.randrange(LIMIT // 3, LIMIT * 5 // 3), "depart", seed=index, start=day_start(day))["flights"]
+        flights.sort(key=lambda flight: int(flight["scheduledTime"]))
+        self.flights["depart"] = flights
+        self.times             = [int(flight["scheduledTime"]) for flight in flights]
+
+    def select(self, type, body):
+        low  = bisect.bisect_left(self.times, body["startTime"] // 1000)
+        high = bisect.bisect_left(self.times, body["endTime"] // 1000)
+
+        return self.flights[type][low:high][:body["limit"]]
+
+
+def stored_flights(history):
+    return history.connection.execute("SELECT COUNT(*) FROM flights WHERE type = 'depart'").fetchone()[0]
+
+
+def sketched_days(history):
+    """Returns the days with a movement and, of them, those with their delay sketch saved."""
+
+    moved    = {day for day, in history.connection.execute("SELECT DISTINCT day FROM flights WHERE type = 'depart' AND actualTime > 0")}
+    sketched = {day for day, in history.connection.execute("SELECT day FROM delay_sketches WHERE type = 'depart' AND kind = 'all'")}
+
+    return len(moved), len(moved & sketched)
+
+
+async def backfill(url, history, first, workers, rate=None, stop_after=None):
+    """Runs one backfill, cancelled after stop_after stored windows when given; returns it and its duration."""
+
+    def progress(backfill):
+        if stop_after is not None and backfill.stored >= stop_after:
+            task.cancel()
+
+    run     = Backfill(history, url, LIMIT, workers=workers, rate=rate, progress=progress)
+    started = time.perf_counter()
+    task    = asyncio.ensure_future(run.run(first, first + datetime.timedelta(DAYS), types=("depart",)))
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+    return run, time.perf_counter() - started
+
+
+async def main_async():
+    first  = datetime.date.today() - datetime.timedelta(DAYS)
+    stub   = DaysStub(first)
+    url    = await stub.start()
+    total  = len({(flight["flightNumber"], flight["scheduledTime"]) for flight in stub.flights["depart"]})
+    over   = sum(1 for index in range(DAYS) if stored_day_count(stub, first + datetime.timedelta(index)) >= LIMIT)
+    print("%d days, %d flights, %d days above the %d flights limit, %.0f ms per answer" % (DAYS, total, over, LIMIT, STUB_DELAY * 1000))
+    print()
+    print("%-24s %10s %10s %8s %10s %12s" % ("run", "seconds", "requests", "splits", "flights", "complete"))
+
+    for name, workers, rate in (("sequential", 1, None), ("8 workers", 8, None), ("8 workers, %d req/s" % RATE, 8, RATE)):
+        history   = HistoryStore(":memory:")
+        run, took = await backfill(url, history, first, workers, rate)
+        print("%-24s %10.2f %10d %8d %10d %12s" % (name, took, run.requests, run.split, stored_flights(history), stored_flights(history) == total))
+        history.close()
+
+    # The interrupted run drops the connections of its requests in flight, the stub would log each one
+    logging.getLogger("aiohttp.server").setLevel(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as directory:
+        path      = os.path.join(directory, "history.db")
+        history   = HistoryStore(path)
+        run, took = await backfill(url, history, first, 8, stop_after=DAYS // 2)
+        print("%-24s %10.2f %10d %8d %10d %12s" % ("interrupted", took, run.requests, run.split, stored_flights(history), stored_flights(history) == total))
+        history.close()
+
+        history   = HistoryStore(path)
+        run, took = await backfill(url, history, first, 8)
+        print("%-24s %10.2f %10d %8d %10d %12s" % ("resumed (%d skipped)" % run.skipped, took, run.requests, run.split, stored_flights(history),
+                                                   stored_flights(history) == total))
+        resumed   = sketched_days(history)
+        run, took = await backfill(url, history, first, 8)
+        print("%-24s %10.2f %10d %8d %10d %12s" % ("rerun (%d skipped)" % run.skipped, took, run.requests, run.split, stored_flights(history),
+                                                   stored_flights(history) == total))
+        history.close()
+
+    print()
+    print("days with a movement after the resume: %d, with their delay sketch: %d" % resumed)
+    await stub.stop()
+
+
+def stored_day_count(stub, day):
+    """Flights the stub holds for one day."""
+
+    start = day_start(day)
+
+    return bisect.bisect_left(stub.times, start + 86400) - bisect.bisect_left(stub.times, start)
+
+
+def main():
+    asyncio.run(main_async())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark: the country breakdown of a board, from precomputed counts against rescanning its flights.
+
+A simulated day of FLIGHTS departures, polled every 10 s, goes through a
+state store and a BreakdownIndex; the cost of keeping the index (apply and
+snapshot) is reported per poll. The final Breakdown must match a count of
+the stored flights. Then every filter of the panel (all airlines or one of
+the busiest, a few hour ranges) is answered from the Breakdown and by a
+Python pass over the board's flights, like a chart built on the payload
+would; both must agree. Last, a Dashboard with the breakdown panel runs
+on Agg and the filter callbacks are timed, the chart being blitted.
+
+Run from the repository root:
+    python -m benchmarks.bench_breakdown
+"""
+import time
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.gridspec as gridspec
+import matplotlib.pyplot as plt
+import numpy as np
+
+from scripts.breakdown import BreakdownIndex
+from scripts.matplot import Dashboard
+from scripts.models import qatar_hour
+from scripts.snapshot_channel import decode_snapshot, empty_board, encode_breakdown, encode_snapshot
+from scripts.state_store import FlightStateStore
+from scripts.synthetic import day_start, simulate_day
+
+
+FLIGHTS = 3500
+HOURS = [(0, 24), (6, 12), (18, 24), (9, 10)]
+
+
+def rescan(store, airline, hours, n=10):
+    """Top countries of a filter by one pass over the stored flights."""
+
+    counts = dict()
+    for key, flight in store.flights.items():
+        if (airline is None or flight.airline == airline) and hours[0] <= qatar_hour(key[1]) < hours[1]:
+            counts[flight.country] = counts.get(flight.country, 0) + 1
+
+    return sorted(counts.items(), key=lambda pair: -pair[1])[:n]
+
+
+def per_filter(function, filters):
+    started = time.perf_counter()
+    results = [function(*arguments) for arguments in filters]
+
+    return results, (time.perf_counter() - started) / len(filters) * 1e6
+
+
+class StaticReader():
+    """Stands in for SnapshotReader, always the same decoded snapshot."""
+
+    def __init__(self, snapshot) -> None:
+        self.snapshot = snapshot
+        self.read_at  = None
+        self.skipped  = 0
+
+    def latest(self):
+        return self.snapshot
+
+
+def panel_times(snapshot, airlines):
+    """Mean milliseconds of a direction, airline and hours filter switch on the live panel."""
+
+    fig     = plt.figure(figsize=(19, 7))
+    gs      = gridspec.GridSpec(2, 3, width_ratios=[2, 2, 1.6], height_ratios=[0.75, 1.25])
+    column  = gs[:, 2].subgridspec(3, 2, height_ratios=[2.2, 1, 0.12], hspace=0.35)
+    axes    = (fig.add_subplot(gs[0, 0]), fig.add_subplot(gs[0, 1]), fig.add_subplot(gs[1, :2]))
+    filters = (fig.add_subplot(column[0, :]), fig.add_subplot(column[1, 0]), fig.add_subplot(column[1, 1]), fig.add_subplot(column[2, :]))
+    dashboard = Dashboard(fig, *axes, StaticReader(snapshot), breakdown=filters)
+    fig.canvas.draw()
+    dashboard.update(0)
+    panel = dashboard.panels[3]
+
+    switches = {"direction": [lambda index=index: panel.direction.set_active(index % 2) for index in range(1, 41)],
+                "airline": [lambda index=index: panel.airline_buttons.set_active(index % (len(airlines) + 1)) for index in range(1, 41)],
+                "hours": [lambda hours=hours: panel.slider.set_val(hours) for hours in HOURS * 10]}
+    times = dict()
+    for name, calls in switches.items():
+        full    = dashboard.blitter.full_draws
+        started = time.perf_counter()
+        for call in calls:
+            call()
+        times[name] = ((time.perf_counter() - started) / len(calls) * 1000, dashboard.blitter.full_draws - full)
+    plt.close(fig)
+
+    return times
+
+
+def main():
+    polls  = list(simulate_day(FLIGHTS, "depart", start=day_start()))
+    store  = FlightStateStore("depart")
+    index  = BreakdownIndex()
+    times  = []
+    moved  = 0
+    for now, flights in polls:
+        delta   = store.apply(flights)
+        started = time.perf_counter()
+        if index.apply(store, delta):
+            breakdown = index.snapshot()
+            moved    += 1
+        times.append(time.perf_counter() - started)
+    times = np.sort(times) * 1000
+    print("%d polls, %d moved the breakdown: apply + snapshot p50 %.3f ms, p99 %.3f ms, max %.3f ms" % (
+        len(polls), moved, times[len(times) // 2], times[len(times) * 99 // 100], times[-1]))
+
+    airlines = [airline for airline, _ in sorted(((airline, int(count)) for airline, count in zip(breakdown.airlines, breakdown.status.sum(axis=1))),
+                                                 key=lambda pair: -pair[1])[:5]]
+    filters  = [(airline, hours) for airline in [None] + airlines for hours in HOURS]
+    assert all(sorted(breakdown.top_countries(*arguments, n=100)) == sorted(rescan(store, *arguments, n=100)) for arguments in filters)
+
+    print()
+    print("%-12s %16s" % ("filter", "us/filter"))
+    answers = dict()
+    for name, function in (("rescan", lambda airline, hours: rescan(store, airline, hours)), ("breakdown", breakdown.top_countries)):
+        answers[name], took = per_filter(function, filters)
+        print("%-12s %16.1f" % (name, took))
+    assert [[count for _, count in top] for top in answers["rescan"]] == [[count for _, count in top] for top in answers["breakdown"]]
+
+    snapshot = {"depart": dict(empty_board(), version=1, breakdown=breakdown), "arrival": dict(empty_board(), version=1, breakdown=breakdown)}
+    encoded  = encode_snapshot(snapshot)
+    print()
+    print("breakdown %d bytes per board (%d airlines, %d countries, %d statuses), snapshot %d bytes" % (
+        len(encode_breakdown(breakdown)), len(breakdown.airlines), len(breakdown.countries), len(breakdown.statuses), len(encoded)))
+
+    print()
+    print("%-12s %12s %14s" % ("switch", "ms/switch", "full redraws"))
+    for name, (took, full) in panel_times(decode_snapshot(encoded), airlines).items():
+        print("%-12s %12.2f %14d" % (name, took, full))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmark: polling a board through the ResponseCache against plain polling.
+
+The stub board changes one flight every CHANGE_EVERY polls. Compared:
+no cache (decode + analyze every poll), content-hash cache (server sends no
+ETag) and ETag revalidation (server answers 304 when unchanged).
+
+Run from the repository root:
+    python -m benchmarks.bench_cache
+"""
+import asyncio
+import time
+
+from scripts.fetcher import FidsClient
+from scripts.response_cache import ResponseCache
+from scripts.state_store import FlightStateStore
+from scripts.stub_server import StubFidsServer
+
+
+POLLS = 200
+CHANGE_EVERY = 10
+
+
+async def poll_board(etag, cached):
+    server = StubFidsServer(flights_per_board=3500, etag=etag)
+    url    = await server.start()
+    cache  = ResponseCache() if cached else None
+    store  = FlightStateStore("depart")
+
+    elapsed = 0
+    async with FidsClient() as client:
+        for poll in range(POLLS):
+            if poll % CHANGE_EVERY == 0:
+                flight = server.flights["depart"][poll % 3500]
+                flight["lang"]["en"]["flightStatus"] = "Departed" if flight["lang"]["en"]["flightStatus"] != "Departed" else "Boarding"
+
+            started = time.perf_counter()
+            data    = await client.post_json(url + "departures", {"limit": 3500}, cache)
+            if data is not None:
+                store.apply(data["flights"])
+            elapsed += time.perf_counter() - started
+
+    await server.stop()
+
+    return elapsed / POLLS, server.bytes_sent, cache.stats() if cache else None
+
+
+def main():
+    print("%-22s %14s %14s %8s %16s" % ("mode", "ms per poll", "MiB sent", "hits", "bytes saved MiB"))
+    for name, etag, cached in (("no cache", False, False), ("content hash", False, True), ("etag revalidation", True, True)):
+        per_poll, sent, stats = asyncio.run(poll_board(etag, cached))
+        print("%-22s %14.2f %14.1f %8s %16s" % (
+            name, per_poll * 1000, sent / 2 ** 20,
+            stats["hits"] if stats else "-",
+            "%.1f" % (stats["bytes_saved"] / 2 ** 20) if stats else "-",
+        ))
+
+
+if __name__ == "__main__":
+    main()
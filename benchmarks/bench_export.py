@@ -0,0 +1,119 @@
+"""
+Benchmark: exporting the dashboard as PNG, SVG and HTML off the reading process.
+
+Snapshots of both boards are built up front, a few flights moving between
+two versions. First the render of one export is timed in process, per
+format and for all three, the first one (which builds the figure) apart.
+Then an Exporter runs TICKS ticks against a reader publishing a new
+version every CHANGE_EVERY ticks, renders going to a worker process: the
+time a tick holds this process, the render wall and CPU time in the
+worker and the ticks skipped as unchanged are reported, then the CPU of
+an unchanged tick alone. From those, the CPU share of 1-minute exports
+is projected, the boards changing between every export or not at all.
+
+Run from the repository root:
+    python -m benchmarks.bench_export
+"""
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from scripts.exporter import EXPORT_FORMATS, Exporter, render_export
+from scripts.rolling import RollingWindow
+from scripts.snapshot_channel import empty_board, encode_snapshot
+from scripts.state_store import FlightStateStore
+from scripts.synthetic import make_payload
+
+
+VERSIONS = 12
+TICKS = 24
+CHANGE_EVERY = 2
+INTERVAL = 1.5
+
+
+def make_snapshots(count, top_n=5):
+    """count snapshots of both boards, versions 1 to count, five flights of each board moving between two."""
+
+    payloads  = {type: make_payload(3500, type, seed=index)["flights"] for index, type in enumerate(("depart", "arrival"))}
+    stores    = {type: FlightStateStore(type) for type in payloads}
+    windows   = {type: RollingWindow() for type in payloads}
+    rng       = np.random.default_rng(0)
+    snapshots = []
+    for version in range(1, count + 1):
+        snapshot = dict()
+        for type, flights in payloads.items():
+            for index in rng.integers(0, len(flights), 5):
+                flights[index] = dict(flights[index], flightNumber=flights[index]["flightNumber"] + "X")
+            for key, old, new in stores[type].apply(flights).moved:
+                if new:
+                    windows[type].add(new, int(key[1]))
+            snapshot[type] = dict(empty_board(), version=version, hours=list(stores[type].hour_counts),
+                                  airlines=list(stores[type].summaries(stores[type].top_airlines(top_n)).values()), rolling=windows[type].summary(time.time()))
+        snapshots.append(snapshot)
+
+    return snapshots
+
+
+class ChangingReader():
+    """Stands in for SnapshotReader: the next snapshot every change_every reads."""
+
+    def __init__(self, snapshots, change_every) -> None:
+        self.snapshots    = snapshots
+        self.change_every = change_every
+        self.reads        = 0
+
+    def latest(self):
+        self.reads += 1
+        return self.snapshots[min((self.reads - 1) // self.change_every, len(self.snapshots) - 1)]
+
+
+def main():
+    snapshots = make_snapshots(VERSIONS)
+    encoded   = [encode_snapshot(snapshot) for snapshot in snapshots]
+
+    print("%-16s %12s %12s %12s" % ("in process", "ms/export", "cpu ms", "bytes"))
+    files, seconds, cpu = render_export(encoded[0], tuple(EXPORT_FORMATS))
+    print("%-16s %12.1f %12.1f %12d" % ("first (build)", seconds * 1000, cpu * 1000, sum(len(data) for data in files.values())))
+    for formats in (("png",), ("svg",), ("html",), tuple(EXPORT_FORMATS)):
+        runs = [render_export(data, formats) for data in encoded[1:]]
+        print("%-16s %12.1f %12.1f %12d" % ("+".join(formats), np.mean([run[1] for run in runs]) * 1000, np.mean([run[2] for run in runs]) * 1000,
+                                             np.mean([sum(len(data) for data in run[0].values()) for run in runs])))
+
+    print()
+    with tempfile.TemporaryDirectory() as directory:
+        exporter = Exporter(ChangingReader(snapshots, CHANGE_EVERY), directory, interval=INTERVAL, workers=1)
+        ticks    = []
+        parent   = time.process_time()
+        for tick in range(TICKS):
+            started = time.perf_counter()
+            exporter.export()
+            ticks.append(time.perf_counter() - started)
+            deadline = time.monotonic() + INTERVAL
+            while exporter.pending and time.monotonic() < deadline:
+                exporter.collect(timeout=max(deadline - time.monotonic(), 0))
+            time.sleep(max(deadline - time.monotonic(), 0))
+        exporter.close()
+        parent = (time.process_time() - parent) / TICKS
+        files  = sorted(os.listdir(directory))
+        counts = dict(exporter.counts)
+
+        # The reader stays on the last version from here, every tick is an unchanged one
+        idle = time.process_time()
+        for _ in range(1000):
+            exporter.export()
+        idle = (time.process_time() - idle) / 1000
+
+    renders = np.array(exporter.render_times) * 1000
+    print("%d ticks every %.1f s, a new version every %d: %s, wrote %s" % (TICKS, INTERVAL, CHANGE_EVERY, counts, ", ".join(files)))
+    print("tick in this process: p50 %.2f ms, max %.2f ms; this process %.1f ms CPU per tick" % (np.median(ticks) * 1000, max(ticks) * 1000, parent * 1000))
+    print("render in the worker: p50 %.0f ms wall, %.0f ms CPU" % (np.median(renders[1:, 0]), np.median(renders[1:, 1])))
+    changing = parent + np.median(renders[1:, 1]) / 1000
+    print("unchanged tick: %.3f ms CPU" % (idle * 1000))
+    print("1-minute exports: %.2f%% of one CPU when every export has a new version, %.2g%% when nothing changes" % (
+        changing / 60 * 100, idle / 60 * 100))
+
+
+if __name__ == "__main__":
+    main()
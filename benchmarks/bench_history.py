@@ -0,0 +1,84 @@
+"""
+Benchmark: HistoryStore range queries against rescanning the raw JSON of each day.
+
+Records DAYS synthetic departures boards, with a second poll per day where
+a tenth of the flights changed status, then asks "hourly departures of one
+airline over the whole range" both ways and checks they agree.
+
+Run from the repository root:
+    python -m benchmarks.bench_history
+"""
+import datetime
+import json
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.reference_aggregation import FlightTable
+from scripts.history_store import HistoryStore
+from scripts.models import QATAR_UTC_OFFSET, Flight
+from scripts.synthetic import STATUSES, day_start, make_payload
+
+
+DAYS = 30
+FLIGHTS = 3500
+AIRLINE = "Emirates"
+
+
+def rescan(raw_days, airline):
+    """Hourly movements of one airline, decoding every day's JSON again."""
+
+    counts = np.zeros((len(raw_days), 24), dtype=np.int64)
+    for index, raw in enumerate(raw_days):
+        table = FlightTable.from_flights(json.loads(raw)["flights"], "depart")
+        if airline in table.airlines:
+            rows          = (table.airline == table.airlines.index(airline)) & (table.actual > 0)
+            counts[index] = np.bincount((table.actual[rows] + QATAR_UTC_OFFSET) // 3600 % 24, minlength=24)
+
+    return counts
+
+
+def main():
+    first    = datetime.date(2026, 1, 1)
+    rng      = random.Random(0)
+    raw_days = []
+    polls    = []
+    for offset in range(DAYS):
+        flights = make_payload(FLIGHTS, "depart", seed=offset, start=day_start(first + datetime.timedelta(offset)))["flights"]
+        moved   = [dict(flight, lang={"en": dict(flight["lang"]["en"], flightStatus=rng.choice(STATUSES))}) for flight in rng.sample(flights, FLIGHTS // 10)]
+        polls  += [[Flight.from_record(flight, "depart") for flight in poll] for poll in (flights, moved, moved)]  # the last poll repeats the previous one and is deduplicated
+        raw_days.append(json.dumps({"flights": flights}))
+
+    with tempfile.TemporaryDirectory() as directory:
+        store   = HistoryStore(os.path.join(directory, "history.db"))
+        started = time.perf_counter()
+        events  = sum(store.record("depart", flights) for flights in polls)
+        ingest  = time.perf_counter() - started
+        size   = os.path.getsize(os.path.join(directory, "history.db"))
+
+        end     = first + datetime.timedelta(DAYS)
+        started = time.perf_counter()
+        for _ in range(20):
+            stored = store.hourly("depart", first, end, AIRLINE)
+        query   = (time.perf_counter() - started) / 20
+
+        started = time.perf_counter()
+        scanned = rescan(raw_days, AIRLINE)
+        scan    = time.perf_counter() - started
+
+        started = time.perf_counter()
+        store.hourly("depart", first, end)
+        store.daily_airlines("depart", first, end)
+        overall = time.perf_counter() - started
+        store.close()
+
+    print("days %d, flights/day %d, events %d, db %.1f MB, ingest %.2f s" % (DAYS, FLIGHTS, events, size / 1e6, ingest))
+    print("hourly %s over %d days: store %.2f ms, rescan %.0f ms, same counts: %s" % (AIRLINE, DAYS, query * 1000, scan * 1000, bool((stored == scanned).all())))
+    print("all airlines hourly + per airline totals: %.2f ms" % (overall * 1000))
+
+
+if __name__ == "__main__":
+    main()
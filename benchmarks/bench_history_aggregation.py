@@ -0,0 +1,142 @@
+"""
+Benchmark: per-airline and per-hour statistics over a year of history, 1 to N processes.
+
+Fills a HistoryStore with FLIGHTS synthetic departures spread over DAYS
+days (built once and kept with --db), then aggregates the whole range
+with a Python loop over every row (what one process did before), inline
+through the shards and with 2, 4 ... up to --max-workers worker processes.
+Every result must be identical: the loop is the reference, the hourly
+counts are also checked against HistoryStore.hourly.
+
+Run from the repository root:
+    python -m benchmarks.bench_history_aggregation
+    python -m benchmarks.bench_history_aggregation --db /tmp/history-10m.db --max-workers 8
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from scripts.history_aggregation import HistoryPartial, ShardedAggregator
+from scripts.history_store import HistoryStore, day_number
+from scripts.models import QATAR_UTC_OFFSET
+from scripts.synthetic import AIRLINES, COUNTRIES, STATUSES, day_start
+
+
+FLIGHTS = 10000000
+DAYS = 365
+FIRST = datetime.date(2025, 1, 1)
+BATCH = 500000
+
+
+def fill(history, flights):
+    """Stores flights synthetic departures over DAYS days in time order, as recording them would, BATCH rows per transaction."""
+
+    rng   = np.random.default_rng(0)
+    start = day_start(FIRST)
+    span  = DAYS * 86400 * BATCH // flights
+    for first in range(0, flights, BATCH):
+        size      = min(BATCH, flights - first)
+        airline   = np.minimum(rng.exponential(4, size).astype(np.int64), len(AIRLINES) - 1)
+        country   = rng.integers(0, len(COUNTRIES), size)
+        status    = rng.integers(0, len(STATUSES), size)
+        scheduled = start + first // BATCH * span + np.sort(rng.integers(0, span, size))
+        actual    = np.where(rng.random(size) < 0.85, scheduled + rng.integers(-600, 3600, size), 0)
+        rows      = zip(("%s%d" % (AIRLINES[line][:2].upper(), first + index) for index, line in enumerate(airline.tolist())),
+                        scheduled.tolist(), ((scheduled + QATAR_UTC_OFFSET) // 86400).tolist(), (AIRLINES[line] for line in airline.tolist()),
+                        (COUNTRIES[index] for index in country.tolist()), (STATUSES[index] for index in status.tolist()), actual.tolist(),
+                        np.where(actual > 0, (actual + QATAR_UTC_OFFSET) // 3600 % 24, -1).tolist())
+        with history.connection:
+            history.connection.executemany("""
+                INSERT INTO flights (type, flightNumber, scheduledTime, day, airline, country, status, actualTime, hour)
+                VALUES ('depart', ?, ?, ?, ?, ?, ?, ?, NULLIF(?, -1))""", rows)
+
+
+def row_loop(history, start, end):
+    """The whole range in one process, one Python pass over every row; returns (airlines, partial)."""
+
+    first   = day_number(start)
+    counts  = dict()
+    hours   = np.zeros((day_number(end) - first, 24), dtype=np.int64)
+    by_hour = dict()
+    latest  = dict()
+    recent  = dict()
+    for id, airline, scheduled, actual, day, hour in history.connection.execute(
+            "SELECT id, airline, scheduledTime, actualTime, day, hour FROM flights WHERE type = 'depart' AND day >= ? AND day < ?", (first, day_number(end))):
+        counts[airline] = counts.get(airline, 0) + 1
+        if airline not in latest or scheduled > latest[airline][0] or (scheduled == latest[airline][0] and id < latest[airline][1]):
+            latest[airline] = (scheduled, id)
+        if hour is not None:
+            hours[day - first, hour] += 1
+            if airline not in by_hour:
+                by_hour[airline] = [0] * 24
+            by_hour[airline][hour] += 1
+        if actual > 0 and (airline not in recent or actual > recent[airline][0] or (actual == recent[airline][0] and id > recent[airline][1])):
+            recent[airline] = (actual, id)
+
+    airlines = sorted(counts)
+    partial  = HistoryPartial.empty(first, len(hours), len(airlines))
+    partial.hours[:] = hours
+    for airline_id, airline in enumerate(airlines):
+        partial.counts[airline_id]        = counts[airline]
+        partial.airline_hours[airline_id] = by_hour.get(airline, [0] * 24)
+        partial.latest[airline_id]        = latest[airline]
+        partial.recent[airline_id]        = recent.get(airline, (-1, -1))
+
+    return airlines, partial
+
+
+def same(one, other):
+    return one[0] == other[0] and one[1].first_day == other[1].first_day and all(
+        np.array_equal(getattr(one[1], name), getattr(other[1], name)) for name in HistoryPartial.ARRAYS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--flights", type=int, default=FLIGHTS)
+    parser.add_argument("--db", help="database file, built when missing and kept (a temporary one by default)")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count(), help="largest number of worker processes timed")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path    = args.db or os.path.join(directory, "history.db")
+        history = HistoryStore(path)
+        stored  = history.connection.execute("SELECT COUNT(*) FROM flights").fetchone()[0]
+        if stored == 0:
+            started = time.perf_counter()
+            fill(history, args.flights)
+            stored  = args.flights
+            print("filled %d flights in %.1f s, %.0f MB" % (stored, time.perf_counter() - started, os.path.getsize(path) / 1e6))
+        start, end = FIRST, FIRST + datetime.timedelta(DAYS)
+        print("%d flights over %d days, %d CPUs" % (stored, DAYS, os.cpu_count()))
+        print()
+
+        started   = time.perf_counter()
+        reference = row_loop(history, start, end)
+        looped    = time.perf_counter() - started
+        print("%-22s %10s %10s %10s" % ("run", "seconds", "speedup", "identical"))
+        print("%-22s %10.2f %10s %10s" % ("row loop", looped, "", ""))
+        assert np.array_equal(reference[1].hours, history.hourly("depart", start, end))
+
+        inline = None
+        counts = [1] + [workers for workers in (2, 4, 8, 16, 32, 64) if workers <= max(args.max_workers, 1)]
+        for workers in counts:
+            with ShardedAggregator(history, workers=workers) as aggregator:
+                started = time.perf_counter()
+                result  = aggregator.aggregate("depart", start, end)
+                took    = time.perf_counter() - started
+            inline = inline or took
+            print("%-22s %10.2f %9.2fx %10s" % ("inline" if workers == 1 else "%d workers" % workers, took, inline / took, same(result, reference)))
+
+        print()
+        for airline, summary in aggregator.summaries(*result).items():
+            print("%-20s %8d flights, latest %s, most recent movement %s" % (airline, summary.flightsCountered, summary.flightNumber,
+                                                                             summary.recent.flightNumber if summary.recent else None))
+        history.close()
+
+
+if __name__ == "__main__":
+    main()
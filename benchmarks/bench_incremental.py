@@ -0,0 +1,73 @@
+"""
+Benchmark: incremental FlightStateStore polls against a full recomputation per poll.
+
+Each simulated poll changes the status of a handful of flights, as happens
+between two 10 s polls of the live board. Both sides include publishing:
+the full path pickles the top airline summaries every poll (what the
+Queue did), the incremental path only when a top airline moved.
+
+Run from the repository root:
+    python -m benchmarks.bench_incremental
+"""
+import copy
+import pickle
+import random
+import time
+
+from benchmarks.reference_aggregation import FlightAggregator, FlightTable
+from scripts.state_store import FlightStateStore
+from scripts.synthetic import make_payload
+
+
+POLLS = 200
+SIZES = [3500, 35000]
+CHANGES_PER_POLL = [5, 50]
+
+
+def make_polls(flights, changes, seed=0):
+    """Returns POLLS successive "flights" lists, each moving `changes` flights of the previous one."""
+
+    rng   = random.Random(seed)
+    polls = []
+    for _ in range(POLLS):
+        flights = list(flights)
+        for index in rng.sample(range(len(flights)), changes):
+            flight = copy.deepcopy(flights[index])
+            flight["lang"]["en"]["flightStatus"] = "Departed"
+            flight["actualTimeOfDep"]            = str(int(flight["scheduledTime"]) + rng.randrange(0, 1800))
+            flights[index] = flight
+        polls.append(flights)
+
+    return polls
+
+
+def main():
+    print("%8s %8s %16s %16s %9s" % ("rows", "changes", "full (ms/poll)", "delta (ms/poll)", "speedup"))
+    for size in SIZES:
+        for changes in CHANGES_PER_POLL:
+            polls = make_polls(make_payload(size, "depart", seed=size)["flights"], changes)
+
+            aggregator = FlightAggregator("depart")
+            started    = time.perf_counter()
+            for flights in polls:
+                flights_data, _ = aggregator.aggregate(FlightTable.from_flights(flights, "depart"))
+                pickle.dumps(flights_data)
+            full = (time.perf_counter() - started) / POLLS
+
+            store = FlightStateStore("depart")
+            store.apply(polls[0])
+            published = []
+            started   = time.perf_counter()
+            for flights in polls[1:]:
+                delta = store.apply(flights)
+                top   = store.top_airlines(5)
+                if top != published or not delta.airlines.isdisjoint(top):
+                    published = top
+                    pickle.dumps(store.summaries(top))
+            incremental = (time.perf_counter() - started) / (POLLS - 1)
+
+            print("%8d %8d %16.2f %16.2f %8.1fx" % (size, changes, full * 1000, incremental * 1000, full / incremental))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark: memory of the names of every language, and switching the language shown.
+
+FLIGHTS synthetic records carrying English and Arabic names are held four
+ways, each measured with tracemalloc: the raw records, projected to one
+language, projected to every language, and as the Flights of a state
+store, whose names are ids into the shared LocalizedStrings table (its
+size is reported apart, it is held once per process). Then a
+FlightsManager is fed both boards and its language is switched back and
+forth: each switch rebuilds the summaries and breakdowns of both boards
+and publishes them, against rebuilding a board from its payload as a
+switch by fetching again would (the request itself not counted). The
+published names must follow the language.
+
+Run from the repository root:
+    python -m benchmarks.bench_localization
+"""
+import gc
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+from scripts.flight_stream import project
+from scripts.flights import FlightsManager
+from scripts.localization import LocalizedStrings
+from scripts.state_store import FlightStateStore
+from scripts.synthetic import make_payload
+
+
+FLIGHTS = 10000
+BOARD = 3500
+SWITCHES = 200
+
+
+def traced(build):
+    """Returns what build() returns and the bytes it left allocated."""
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    after  = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return result, after - before
+
+
+def build_store(records, type="depart"):
+    store = FlightStateStore(type)
+    store.apply(records)
+
+    return store
+
+
+def build_table(records):
+    table = LocalizedStrings()
+    for record in records:
+        for field in ("airlineName", "flightStatus", "destinationCountry"):
+            table.intern_record(record["lang"], field)
+
+    return table
+
+
+def main():
+    data = json.dumps(make_payload(FLIGHTS, "depart"))
+
+    # The table of the process is filled first, so the store below only pays for its own flights
+    records           = json.loads(data)["flights"]
+    table, table_size = traced(lambda: build_table(records))
+    build_store(records)
+
+    print("%-28s %12s %12s" % ("%d flights" % FLIGHTS, "MB", "bytes/flight"))
+    for name, build in (("raw records", lambda: json.loads(data)["flights"]),
+                        ("projected, en only", lambda: [project(record, "depart", "en") for record in records]),
+                        ("projected, every language", lambda: [project(record, "depart") for record in records]),
+                        ("state store (ids)", lambda: build_store(records))):
+        _, size = traced(build)
+        print("%-28s %12.2f %12.0f" % (name, size / 1e6, size / FLIGHTS))
+    print("%-28s %12.3f %12s" % ("table, once per process", table_size / 1e6, "%d names" % len(table.keys)))
+    print("languages: %s" % ", ".join(table.languages()))
+
+    manager = FlightsManager(None, "http://127.0.0.1:1/")
+    for seed, board in enumerate(manager.scheduler.boards.values()):
+        board.listeners.clear()
+        manager.__analyze_flights__(board, board.store.apply(make_payload(BOARD, board.source.type, seed=seed)["flights"]))
+    shown = lambda: [summary.airline for summary in manager.snapshot["depart"]["airlines"]]
+    english = shown()
+
+    times = []
+    for index in range(SWITCHES):
+        started = time.perf_counter()
+        manager.set_language("ar" if index % 2 == 0 else "en")
+        times.append(time.perf_counter() - started)
+        if index == 0:
+            arabic = shown()
+            assert arabic == ["ar:" + name for name in english] and all(country.startswith("ar:") for country in manager.snapshot["depart"]["breakdown"].countries)
+    assert shown() == english
+
+    payloads = {board.source.type: make_payload(BOARD, board.source.type, seed=seed)["flights"] for seed, board in enumerate(manager.scheduler.boards.values())}
+    rebuild  = []
+    for _ in range(5):
+        started = time.perf_counter()
+        for type, flights in payloads.items():
+            store = build_store(flights, type)
+            store.summaries(store.top_airlines(manager.TOP_AIRLINES))
+        rebuild.append(time.perf_counter() - started)
+
+    times = np.array(times) * 1000
+    print()
+    print("%s -> %s" % (", ".join(english[:3]), ", ".join(arabic[:3])))
+    print("switch, both boards republished: p50 %.3f ms, max %.3f ms (%d switches)" % (np.median(times), times.max(), SWITCHES))
+    print("rebuilding both boards of %d flights from their payloads: %.1f ms" % (BOARD, np.median(rebuild) * 1000))
+
+
+if __name__ == "__main__":
+    main()
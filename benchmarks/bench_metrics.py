@@ -0,0 +1,77 @@
+"""
+Benchmark: cost of the instrumentation, off and on.
+
+Per call: a stage timer and a labelled counter increment on NullMetrics
+(what every instrumented class gets by default) and on Metrics. Pipeline:
+the first HOURS simulated hours of both boards, polled every 10 s, are
+fed straight into a FlightsManager with metrics off, then on, and the
+rendered /metrics text of the second run is sized and timed.
+
+Run from the repository root:
+    python -m benchmarks.bench_metrics
+"""
+import asyncio
+import itertools
+import time
+
+from scripts.flights import FlightsManager
+from scripts.metrics import NULL_METRICS, Metrics
+from scripts.replay import ReplayClock, replay_into, simulated_recording
+
+
+CALLS = 200000
+HOURS = 2
+ROUNDS = 3
+
+
+def per_call(metrics):
+    """Nanoseconds of one timed stage and of one counter increment."""
+
+    started = time.perf_counter()
+    for _ in range(CALLS):
+        with metrics.time("stage_seconds", stage="apply", board="depart"):
+            pass
+    timer = (time.perf_counter() - started) / CALLS
+
+    started = time.perf_counter()
+    for _ in range(CALLS):
+        metrics.inc("records_processed_total", 3500, board="depart")
+    counter = (time.perf_counter() - started) / CALLS
+
+    return timer * 1e9, counter * 1e9
+
+
+def replay(metrics, payloads):
+    """Seconds to feed payloads into a new FlightsManager measured into metrics."""
+
+    clock   = ReplayClock(0)
+    manager = FlightsManager(None, clock=clock, metrics=metrics)
+    started = time.perf_counter()
+    asyncio.run(replay_into(manager, payloads, clock=clock))
+
+    return time.perf_counter() - started
+
+
+def main():
+    print("%-12s %14s %14s" % ("metrics", "timer ns", "counter ns"))
+    for name, metrics in (("off", NULL_METRICS), ("on", Metrics())):
+        print("%-12s %14.0f %14.0f" % ((name,) + per_call(metrics)))
+
+    payloads = list(itertools.islice(simulated_recording(3500), HOURS * 360 * 2))
+    print()
+    print("%d payloads (%d simulated hours of both boards), best of %d:" % (len(payloads), HOURS, ROUNDS))
+    off     = min(replay(NULL_METRICS, payloads) for _ in range(ROUNDS))
+    metrics = Metrics()
+    on      = min(replay(metrics, payloads) for _ in range(ROUNDS))
+    print("%-12s %14.1f ms" % ("off", off * 1000))
+    print("%-12s %14.1f ms  (%+.1f%%)" % ("on", on * 1000, (on - off) / off * 100))
+
+    started = time.perf_counter()
+    text    = metrics.render()
+    print()
+    print("/metrics: %d series lines, %d bytes, rendered in %.2f ms" % (
+        sum(1 for line in text.splitlines() if not line.startswith("#")), len(text), (time.perf_counter() - started) * 1000))
+
+
+if __name__ == "__main__":
+    main()
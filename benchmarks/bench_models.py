@@ -0,0 +1,73 @@
+"""
+Benchmark: memory per 10k flights and pickle size, raw dicts against the slotted model.
+
+Memory side: what a state store holds per flight. Before, the raw record
+of the webservice, every language of "lang" included; after, one Flight
+with int timestamps and interned strings. Measured with tracemalloc
+while the records are the only thing alive.
+
+Pickle side: the top airlines of one board as they crossed the process
+boundary. Before, the raw record of the last flight with
+"flightsCountered" and a "recentDep" key that pointed back at the record
+itself; then the summary dicts; after, AirlineSummary objects.
+
+Run from the repository root:
+    python -m benchmarks.bench_models
+"""
+import copy
+import gc
+import json
+import pickle
+import tracemalloc
+
+from benchmarks.reference_aggregation import FlightAggregator, FlightTable
+from scripts.models import Flight
+from scripts.synthetic import make_payload
+
+
+FLIGHTS = 10000
+
+
+def traced(build):
+    """Returns what build() allocates and keeps, in bytes."""
+
+    gc.collect()
+    tracemalloc.start()
+    kept = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+
+    return size
+
+
+def main():
+    raw = json.dumps(make_payload(FLIGHTS, "depart", seed=7))
+
+    raw_size  = traced(lambda: json.loads(raw)["flights"])
+    flights   = json.loads(raw)["flights"]
+    slot_size = traced(lambda: [Flight.from_record(flight, "depart") for flight in flights])
+
+    print("%-28s %12s %14s" % ("per %d flights" % FLIGHTS, "MiB", "bytes/flight"))
+    print("%-28s %12.2f %14.0f" % ("raw dicts", raw_size / 2 ** 20, raw_size / FLIGHTS))
+    print("%-28s %12.2f %14.0f" % ("Flight (__slots__)", slot_size / 2 ** 20, slot_size / FLIGHTS))
+
+    print()
+    print("%-28s %12s" % ("top airlines pickle", "bytes"))
+    for top_n in (5, 20):
+        flights_data, _ = FlightAggregator("depart", top_n).aggregate(FlightTable.from_flights(flights, "depart"))
+        by_number       = {flight["flightNumber"]: flight for flight in flights}
+        legacy          = dict()
+        for airline, summary in flights_data.items():
+            record                     = copy.deepcopy(by_number[summary.flightNumber])
+            record["flightsCountered"] = summary.flightsCountered
+            record["recentDep"]        = record  # the self reference the old code published
+            legacy[airline]            = record
+
+        print("%-28s %12d" % ("raw records, top %d" % top_n, len(pickle.dumps(legacy))))
+        print("%-28s %12d" % ("summary dicts, top %d" % top_n, len(pickle.dumps({airline: summary.to_dict() for airline, summary in flights_data.items()}))))
+        print("%-28s %12d" % ("AirlineSummary, top %d" % top_n, len(pickle.dumps(flights_data))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Benchmark: matching status and time change events against 10k subscriptions.
+
+A simulated day of departures, polled every 10 s, is applied to a state
+store and every poll's events are collected. SUBSCRIPTIONS rules (by
+flight number, airline, country or status, most with a status too) are
+matched against every event with the SubscriptionIndex and with a scan
+of every rule; both must agree. Then the whole day is replayed into a
+scheduler Board with a Notifier delivering to stdout (a buffer), a file
+and a local webhook receiver, and the time of the notify stage per poll
+is reported.
+
+Run from the repository root:
+    python -m benchmarks.bench_notifications
+"""
+import asyncio
+import io
+import os
+import random
+import tempfile
+import time
+
+from scripts.notifications import Notifier, StdoutSink, Subscription, SubscriptionIndex, detect_events
+from scripts.scheduler import BoardScheduler, SourceRegistry
+from scripts.state_store import FlightStateStore
+from scripts.stub_server import WebhookReceiver
+from scripts.synthetic import AIRLINES, COUNTRIES, STATUSES, day_start, simulate_day
+
+
+FLIGHTS = 3500
+SUBSCRIPTIONS = 10000
+WATCHED = ["Delayed", "Cancelled", "Departed", "Landed"]
+
+
+def make_subscriptions(count, numbers, seed=0):
+    """Random rules: half by flight number, then by airline, country or both, 1% by status only, a few matching everything."""
+
+    rng   = random.Random(seed)
+    rules = []
+    for index in range(count):
+        draw   = rng.random()
+        status = rng.choice(WATCHED + [None])
+        if draw < 0.5:
+            rule = Subscription(index, flightNumber=rng.choice(numbers), status=status)
+        elif draw < 0.75:
+            rule = Subscription(index, airline=rng.choice(AIRLINES), status=rng.choice(WATCHED))
+        elif draw < 0.9:
+            rule = Subscription(index, country=rng.choice(COUNTRIES), airline=rng.choice(AIRLINES), status=rng.choice(WATCHED))
+        elif draw < 0.99:
+            rule = Subscription(index, country=rng.choice(COUNTRIES), status=rng.choice(WATCHED))
+        elif draw < 0.9995:
+            rule = Subscription(index, status=rng.choice(STATUSES), kind="status")
+        else:
+            rule = Subscription(index, kind="status")
+        rules.append(rule)
+
+    return rules
+
+
+def day_events(polls):
+    """Every event of a simulated day, poll by poll through a state store."""
+
+    store  = FlightStateStore("depart")
+    events = []
+    for now, flights in polls:
+        events += detect_events("depart", store, store.apply(flights), now)
+
+    return events
+
+
+def per_second(function, events):
+    started = time.perf_counter()
+    matched = sum(len(function(event)) for event in events)
+
+    return matched, len(events) / (time.perf_counter() - started)
+
+
+async def notify_day(polls, rules, directory):
+    """Replays the day into a scheduler Board, a Notifier on three sinks after each poll; returns per-poll notify seconds."""
+
+    receiver = WebhookReceiver()
+    url      = await receiver.start()
+    specs    = ["stdout", "file:" + os.path.join(directory, "events.jsonl"), url]
+    for rule in rules:
+        rule.sink = specs[rule.id % 3]
+    registry  = SourceRegistry()
+    registry.airport("http://127.0.0.1:1/")
+    scheduler = BoardScheduler(registry)
+    board     = scheduler.boards["depart"]
+    notifier  = Notifier(rules, sinks={"stdout": StdoutSink(io.StringIO())}, clock=lambda: now)
+
+    times = []
+    for now, flights in polls:
+        delta   = board.store.apply(flights)
+        started = time.perf_counter()
+        notifier(board, delta)
+        times.append(time.perf_counter() - started)
+        await asyncio.sleep(0)
+    await notifier.close()
+    await receiver.stop()
+
+    print("%d events, %d notifications: %d to stdout, %d lines in the file, %d webhook items in %d POSTs (%d dropped)" % (
+        notifier.events, notifier.delivered, notifier.sinks["stdout"].stream.getvalue().count("\n"),
+        sum(1 for _ in open(specs[1][len("file:"):])), len(receiver.received), receiver.requests, notifier.sinks[url].dropped))
+
+    return times
+
+
+def main():
+    polls   = list(simulate_day(FLIGHTS, "depart", start=day_start()))
+    numbers = sorted({flight["flightNumber"] for flight in polls[-1][1]})
+    events  = day_events(polls)
+    rules   = make_subscriptions(SUBSCRIPTIONS, numbers)
+    print("%d polls, %d events (%d status, %d time), %d subscriptions" % (len(polls), len(events), sum(1 for event in events if event.kind == "status"),
+                                                                        sum(1 for event in events if event.kind == "time"), len(rules)))
+
+    started = time.perf_counter()
+    index   = SubscriptionIndex(rules)
+    print("index built in %.1f ms" % ((time.perf_counter() - started) * 1000))
+
+    def scan(event):
+        return [rule for rule in rules if rule.matches(event)]
+
+    assert all(sorted(rule.id for rule in index.match(event)) == sorted(rule.id for rule in scan(event)) for event in events[::50])
+    print()
+    print("%-12s %14s %14s" % ("matching", "events/s", "matches"))
+    for name, function, sample in (("scan", scan, events[::20]), ("index", index.match, events)):
+        matched, rate = per_second(function, sample)
+        print("%-12s %14.0f %14d" % (name, rate, matched * len(events) // len(sample)))
+
+    print()
+    with tempfile.TemporaryDirectory() as directory:
+        times = sorted(asyncio.run(notify_day(polls, rules, directory)))
+    print("notify stage per poll: p50 %.3f ms, p99 %.3f ms, max %.3f ms" % (times[len(times) // 2] * 1000, times[len(times) * 99 // 100] * 1000,
+                                                                          times[-1] * 1000))
+
+
+if __name__ == "__main__":
+    main()
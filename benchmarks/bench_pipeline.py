@@ -0,0 +1,226 @@
+"""
+Benchmark: the whole pipeline, from a board answer to a rendered frame.
+
+Fetch to aggregate: a simulated day of departures is served by a
+ReplayServer, its clock moved LATENCY_STEP simulated seconds before each
+poll, and BoardScheduler.poll is timed end to end (request, decode,
+state store, rolling windows, delay sketches, publish) next to the part
+spent in BoardScheduler.apply, at 1x and 10x the board's usual volume.
+Aggregate to render: every publish of those polls is encoded to a
+SnapshotChannel, read back and drawn by an Agg Dashboard, timed apart.
+Memory: a simulated day of both boards polled every MEMORY_INTERVAL
+seconds is fed straight into a FlightsManager, traced memory sampled
+every simulated hour; it grows with the delays recorded, never with the
+polls. Throughput: flights per second through BoardScheduler.apply at
+10x and 100x volume, one flight in a hundred changing at each poll.
+
+--json writes the results, --baseline compares them to an earlier --json
+and exits 1 when one is worse by more than --tolerance, so a regression
+on the hot path fails the run.
+
+Run from the repository root:
+    python -m benchmarks.bench_pipeline [--json results.json] [--baseline baseline.json]
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+
+from benchmarks.bench_render import make_figure
+from scripts.flights import FlightsManager
+from scripts.matplot import Dashboard
+from scripts.replay import ReplayClock, ReplayServer, replay_into, simulated_recording
+from scripts.snapshot_channel import SnapshotChannel, SnapshotReader
+from scripts.synthetic import make_payload, simulate_day
+
+
+BOARD = 3500
+LATENCY_POLLS = 48
+LATENCY_STEP = 1800
+MEMORY_INTERVAL = 60
+THROUGHPUT_POLLS = 5
+CHURN = 0.01
+
+
+def timed(function, times):
+    """Wraps function so each call appends its duration to times."""
+
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            times.append(time.perf_counter() - started)
+
+    return wrapper
+
+
+async def latency(scale):
+    """Fetch to aggregate and aggregate to render, milliseconds per poll."""
+
+    count   = BOARD * scale
+    day     = ((at, "depart", "depart", flights) for at, flights in simulate_day(count, "depart", interval=LATENCY_STEP))
+    server  = ReplayServer(day, speed=0)
+    url     = await server.start()
+    channel = SnapshotChannel(size=1 << 24)
+    manager = FlightsManager(channel, url, top_n=5, clock=server.clock)
+
+    fig, axes = make_figure()
+    reading   = SnapshotChannel(channel.name)
+    dashboard = Dashboard(fig, *axes, SnapshotReader(reading), top_n=5)
+    fig.canvas.draw()
+
+    polls, applies, publishes, renders = [], [], [], []
+    scheduler            = manager.scheduler
+    scheduler.apply      = timed(scheduler.apply, applies)
+    manager.__publish__  = timed(manager.__publish__, publishes)
+    scheduler.semaphore  = asyncio.Semaphore(1)
+    board                = scheduler.boards["depart"]
+    board.source.limit   = count
+    async with manager.client:
+        for poll in range(LATENCY_POLLS):
+            if server.clock.origin is not None:
+                server.clock.seek(server.clock.origin + LATENCY_STEP)
+            published = len(publishes)
+            started   = time.perf_counter()
+            await scheduler.poll(board)
+            polls.append(time.perf_counter() - started)
+            if len(publishes) > published:
+                started = time.perf_counter()
+                dashboard.update(poll)
+                renders.append(publishes[-1] + time.perf_counter() - started)
+
+    plt.close(fig)
+    await server.stop()
+    reading.close()
+    channel.close()
+
+    return {"fetch_to_aggregate_ms": np.median(polls) * 1000, "aggregate_ms": np.median(applies) * 1000,
+            "aggregate_to_render_ms": np.median(renders) * 1000}
+
+
+def memory_day():
+    """Traced memory every simulated hour of a day of both boards fed straight into a FlightsManager."""
+
+    clock   = ReplayClock(0)
+    manager = FlightsManager(None, clock=clock)
+    samples = []
+    hours   = set()
+
+    def sampled(payloads):
+        for payload in payloads:
+            hour = int(payload[0] - first) // 3600
+            if hour not in hours:
+                hours.add(hour)
+                samples.append(tracemalloc.get_traced_memory()[0])
+            yield payload
+
+    payloads = simulated_recording(BOARD, interval=MEMORY_INTERVAL)
+    head     = next(payloads)
+    first    = head[0]
+
+    def everything():
+        yield head
+        yield from payloads
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    applied = asyncio.run(replay_into(manager, sampled(everything()), clock=clock))
+    elapsed = time.perf_counter() - started
+    samples.append(tracemalloc.get_traced_memory()[0])
+    tracemalloc.stop()
+
+    return samples, applied, elapsed
+
+
+def throughput(scale):
+    """Flights per second through BoardScheduler.apply at scale times the usual board."""
+
+    count    = BOARD * scale
+    manager  = FlightsManager(None)
+    flights  = make_payload(count, "depart", seed=scale)["flights"]
+    board    = manager.scheduler.boards["depart"]
+    rng      = np.random.default_rng(scale)
+    manager.scheduler.apply(board, flights)
+
+    times = []
+    for poll in range(THROUGHPUT_POLLS):
+        flights = list(flights)
+        for index in rng.integers(0, count, int(count * CHURN)):
+            flights[index] = dict(flights[index], flightNumber=flights[index]["flightNumber"] + "X")
+        started = time.perf_counter()
+        manager.scheduler.apply(board, flights)
+        times.append(time.perf_counter() - started)
+
+    return count / np.median(times), np.median(times) * 1000
+
+
+def compare(results, baseline, tolerance):
+    """Returns the metrics worse than the baseline by more than tolerance (a fraction)."""
+
+    worse = []
+    for name, (value, better) in results.items():
+        if name not in baseline:
+            continue
+        reference = baseline[name][0]
+        if (better == "lower" and value > reference * (1 + tolerance)) or (better == "higher" and value < reference * (1 - tolerance)):
+            worse.append((name, reference, value))
+
+    return worse
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--json", default=None, help="write the results to this file")
+    parser.add_argument("--baseline", default=None, help="results of an earlier --json run to compare to")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="how much worse than the baseline a result may be")
+    args = parser.parse_args()
+
+    results = dict()
+
+    print("%6s %14s %14s %16s" % ("volume", "poll ms", "aggregate ms", "publish+draw ms"))
+    for scale in (1, 10):
+        stats = asyncio.run(latency(scale))
+        print("%5dx %14.2f %14.2f %16.2f" % (scale, stats["fetch_to_aggregate_ms"], stats["aggregate_ms"], stats["aggregate_to_render_ms"]))
+        for name, value in stats.items():
+            results["%s_%dx" % (name, scale)] = (value, "lower")
+
+    samples, applied, elapsed = memory_day()
+    print()
+    print("24 simulated hours: %d payloads in %.1f s, traced MB at hours 1, 6, 12, 18, 24: %s" % (
+        applied, elapsed, " ".join("%.1f" % (samples[hour] / 1e6) for hour in (1, 6, 12, 18, 24))))
+    print("growth over the last 6 hours: %.2f MB" % ((samples[24] - samples[18]) / 1e6))
+    results["memory_day_mb"] = (samples[24] / 1e6, "lower")
+    results["replay_day_s"]  = (elapsed, "lower")
+
+    print()
+    print("%6s %10s %16s %12s" % ("volume", "flights", "flights/s", "poll ms"))
+    for scale in (10, 100):
+        rate, poll = throughput(scale)
+        print("%5dx %10d %16.0f %12.2f" % (scale, BOARD * scale, rate, poll))
+        results["throughput_%dx" % scale] = (rate, "higher")
+
+    if args.json is not None:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            worse = compare(results, json.load(file), args.tolerance)
+        print()
+        for name, reference, value in worse:
+            print("REGRESSION %s: %.2f -> %.2f" % (name, reference, value))
+        if worse:
+            sys.exit(1)
+        print("No regression beyond %d%% of %s" % (args.tolerance * 100, args.baseline))
+
+
+if __name__ == "__main__":
+    main()
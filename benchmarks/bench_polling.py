@@ -0,0 +1,172 @@
+"""
+Benchmark: timetable-driven poll planning against the fixed 10 s loop on a replayed day.
+
+Both boards of a day are replayed second by second: a simulated day of
+FLIGHTS flights per board scheduled in hub waves (synthetic.HUB_WAVES),
+or a recording given with --recording. Every strategy polls the replay
+like the live boards: a poll sees the last payload at or before its
+time, an unchanged payload counts as a fetch that brought nothing, and
+adaptive strategies feed each poll to a PollPlanner and wait the interval
+it plans. A change is detected by the first poll at or after it; per
+strategy, the fetches of the day, the share of them that brought nothing
+and the detection delay of the changes are reported, then the fetches in
+a quiet hour and in a wave hour (Asia/Qatar), and the cost of planning a
+poll.
+
+Run from the repository root:
+    python -m benchmarks.bench_polling
+"""
+import argparse
+import time
+
+import numpy as np
+
+from scripts.models import QATAR_UTC_OFFSET
+from scripts.poll_planner import PollPlanner
+from scripts.replay import read_recording, simulated_recording
+from scripts.state_store import FlightStateStore
+from scripts.synthetic import HUB_WAVES, day_start
+
+
+FLIGHTS = 3500
+QUIET_HOUR = 5
+WAVE_HOUR = 19
+
+# name, fixed interval or None, PollPlanner arguments
+STRATEGIES = (
+    ("fixed 10 s", 10, None),
+    ("fixed 5 s", 5, None),
+    ("adaptive 5-60 s", None, {"base_interval": 10, "min_interval": 5, "max_interval": 60}),
+    ("adaptive 3-30 s", None, {"base_interval": 7, "min_interval": 3, "max_interval": 30}),
+    ("adaptive 10-120 s", None, {"base_interval": 20, "min_interval": 10, "max_interval": 120}),
+)
+
+
+class Poller():
+    """One strategy polling one board of the replay."""
+
+    def __init__(self, type, interval, planner, start) -> None:
+        self.store     = FlightStateStore(type)
+        self.interval  = interval
+        self.planner   = PollPlanner(**planner) if planner is not None else None
+        self.next_poll = start
+        self.seen      = None
+        self.polls     = []
+        self.unchanged = 0
+        self.planning  = 0.0
+
+    def run_until(self, until, flights):
+        """Polls every planned time before until, each seeing flights."""
+
+        while self.next_poll < until:
+            now = self.next_poll
+            self.polls.append(now)
+            delta = None
+            if flights is self.seen:
+                self.unchanged += 1
+            else:
+                delta     = self.store.apply(flights)
+                self.seen = flights
+            if self.planner is None:
+                self.next_poll = now + self.interval
+                continue
+            started         = time.perf_counter()
+            self.planner.observe(now, self.store, delta)
+            self.next_poll  = now + self.planner.next_interval(now)
+            self.planning  += time.perf_counter() - started
+
+
+def replay(payloads, start, end):
+    """Runs every strategy on every board of the payloads; returns ({board: change times and counts}, {board: {strategy: Poller}})."""
+
+    truth   = dict()
+    pollers = dict()
+    current = dict()
+    for at, name, type, flights in payloads:
+        if name not in truth:
+            truth[name]   = (FlightStateStore(type), [], [])
+            pollers[name] = {strategy: Poller(type, interval, planner, start) for strategy, interval, planner in STRATEGIES}
+        elif flights is current[name]:
+            continue
+        else:
+            for poller in pollers[name].values():
+                poller.run_until(at, current[name])
+
+        store, times, counts = truth[name]
+        delta                = store.apply(flights)
+        changes              = len(delta.inserted) + len(delta.changed) + len(delta.removed)
+        if changes and name in current:
+            times.append(at)
+            counts.append(changes)
+        current[name] = flights
+
+    for name, flights in current.items():
+        for poller in pollers[name].values():
+            poller.run_until(end, flights)
+
+    return {name: (np.array(times), np.array(counts)) for name, (_, times, counts) in truth.items()}, pollers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--recording", help="replay this recording (see scripts/replay.py) instead of a simulated day")
+    parser.add_argument("--flights", type=int, default=FLIGHTS, help="flights per board of the simulated day")
+    args = parser.parse_args()
+
+    if args.recording:
+        times    = [at for at, _, _, _ in read_recording(args.recording)]
+        start    = times[0]
+        end      = times[-1]
+        payloads = read_recording(args.recording)
+    else:
+        start    = day_start()
+        end      = start + 86400
+        payloads = simulated_recording(args.flights, interval=1, start=start, weights=HUB_WAVES)
+
+    started        = time.perf_counter()
+    truth, pollers = replay(payloads, start, end)
+    print("%s: %d boards, %d changes over %.1f h, replayed in %.0f s" % (
+        args.recording or "simulated day in waves", len(truth), sum(int(counts.sum()) for _, counts in truth.values()), (end - start) / 3600,
+        time.perf_counter() - started))
+
+    print()
+    print("%-18s %8s %10s %10s %8s %8s %8s %8s" % ("strategy", "fetches", "unchanged", "mean (s)", "p50", "p90", "p99", "max"))
+    for strategy, _, _ in STRATEGIES:
+        delays  = []
+        weights = []
+        fetches = 0
+        idle    = 0
+        for name, (times, counts) in truth.items():
+            poller   = pollers[name][strategy]
+            polls    = np.array(poller.polls)
+            fetches += len(polls)
+            idle    += poller.unchanged
+            after    = np.searchsorted(polls, times, side="left")
+            seen     = after < len(polls)
+            delays.append(polls[after[seen]] - times[seen])
+            weights.append(counts[seen])
+        delays  = np.concatenate(delays)
+        weights = np.concatenate(weights)
+        order   = np.argsort(delays)
+        share   = np.cumsum(weights[order]) / weights.sum()
+        p50, p90, p99 = (delays[order][np.searchsorted(share, q)] for q in (0.5, 0.9, 0.99))
+        print("%-18s %8d %9.0f%% %10.2f %8.0f %8.0f %8.0f %8.0f" % (strategy, fetches, 100.0 * idle / fetches, np.average(delays, weights=weights),
+                                                                  p50, p90, p99, delays.max()))
+
+    print()
+    print("%-18s %14s %14s %16s" % ("strategy", "fetches %02d:00" % QUIET_HOUR, "fetches %02d:00" % WAVE_HOUR, "us/planned poll"))
+    for strategy, _, planner in STRATEGIES:
+        hours    = [0, 0]
+        planning = 0.0
+        planned  = 0
+        for boards in pollers.values():
+            poller = boards[strategy]
+            polls     = (np.array(poller.polls) + QATAR_UTC_OFFSET) // 3600 % 24
+            hours     = [hours[0] + int((polls == QUIET_HOUR).sum()), hours[1] + int((polls == WAVE_HOUR).sum())]
+            planning += poller.planning
+            planned  += len(poller.polls)
+        print("%-18s %14d %14d %16s" % (strategy, hours[0], hours[1], "%.1f" % (planning / planned * 1e6) if planner is not None else "-"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Benchmark: blitting Dashboard against the clear-and-redraw panels it replaced.
+
+Both sides render on the Agg backend, one frame per second, the boards
+moving every tenth frame like a 10s poll. Clear side: what the three
+FuncAnimations used to do on each poll, ax.clear(), new artists, a new
+mplcursors cursor and a full canvas.draw(). Dashboard side: one update()
+per frame, idle frames included. Memory is traced over the whole run, a
+growing "last - first" column is a leak. Both run with the top 5 and the
+top 50 airlines; the clear side builds every tooltip on each poll, the
+Dashboard none, so the hover cost is timed apart: a cold hover builds the
+text, a warm one finds it in the tooltip cache.
+
+Run from the repository root:
+    python -m benchmarks.bench_render
+"""
+import time
+import tracemalloc
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.gridspec as gridspec
+import matplotlib.pyplot as plt
+import mplcursors
+import numpy as np
+
+from benchmarks.reference_aggregation import busiest_hours
+from scripts.matplot import Dashboard, dayHours, describe_airline
+from scripts.rolling import RollingWindow
+from scripts.state_store import FlightStateStore
+from scripts.synthetic import make_payload
+
+
+FRAMES = 600
+POLL_EVERY = 10
+
+
+class ScriptedReader():
+    """Stands in for SnapshotReader: a new snapshot every POLL_EVERY frames, a few flights moving each time.
+
+    Snapshots are built up front so the timings hold rendering only.
+    """
+
+    def __init__(self, top_n=5) -> None:
+        payloads       = {type: make_payload(3500, type, seed=index)["flights"] for index, type in enumerate(("depart", "arrival"))}
+        stores         = {type: FlightStateStore(type) for type in payloads}
+        windows        = {type: RollingWindow() for type in payloads}
+        rng            = np.random.default_rng(0)
+        self.frame     = 0
+        self.snapshots = []
+        for version in range(1, FRAMES // POLL_EVERY + 2):
+            snapshot = dict()
+            for type, flights in payloads.items():
+                for index in rng.integers(0, len(flights), 5):
+                    flights[index] = dict(flights[index], flightNumber=flights[index]["flightNumber"] + "X")
+                for key, old, new in stores[type].apply(flights).moved:
+                    if new:
+                        windows[type].add(new, int(key[1]))
+                snapshot[type] = {"version": version, "hours": list(stores[type].hour_counts),
+                                  "airlines": list(stores[type].summaries(stores[type].top_airlines(top_n)).values()),
+                                  "rolling": windows[type].summary(time.time())}
+            self.snapshots.append(snapshot)
+
+    def latest(self):
+        self.frame += 1
+        return self.snapshots[self.frame // POLL_EVERY]
+
+
+def make_figure():
+    fig = plt.figure(figsize=(15, 7))
+    gs  = gridspec.GridSpec(2, 2, width_ratios=[2, 2], height_ratios=[0.75, 1.25])
+    axes = (fig.add_subplot(gs[0, 0]), fig.add_subplot(gs[0, 1]), fig.add_subplot(gs[1, :]))
+    fig.canvas.draw()
+    return fig, axes
+
+
+def clear_frame(fig, axes, snapshot):
+    """One poll of the previous renderer: every panel cleared and rebuilt, then a full draw."""
+
+    for ax, type, color in zip(axes, ("depart", "arrival"), ("red", "blue")):
+        airlines = snapshot[type]["airlines"]
+        ax.clear()
+        scatter = ax.scatter([summary.airline for summary in airlines], [summary.flightsCountered for summary in airlines], marker='2', s=75, c=color)
+        labels  = [describe_airline(summary, type) for summary in airlines]
+        mplcursors.cursor(scatter, hover=True).connect("add", lambda sel, labels=labels: sel.annotation.set_text(labels[sel.index]))
+
+    ax = axes[2]
+    ax.clear()
+    dep = busiest_hours(snapshot["depart"]["hours"])
+    arr = busiest_hours(snapshot["arrival"]["hours"])
+    ax.plot(dayHours[:len(arr)], arr, marker='o', label="Arrival", color='blue')
+    ax.plot(dayHours[:len(dep)], dep, marker='o', label="Departure", color='red')
+    ax.legend()
+    fig.canvas.draw()
+
+
+def run(name, top_n, render):
+    tracemalloc.start()
+    times = []
+    first = None
+    for frame in range(FRAMES):
+        started = time.perf_counter()
+        render(frame)
+        times.append(time.perf_counter() - started)
+        if frame == POLL_EVERY * 2:
+            first = tracemalloc.get_traced_memory()[0]
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    times = np.array(times) * 1000
+    busy  = times[POLL_EVERY - 1::POLL_EVERY]
+    print("%-10s %6d %12.2f %12.2f %12.3f %14.1f %14.1f" % (name, top_n, times.sum() / FRAMES, busy.mean(), np.median(times), peak / 1e6, (current - first) / 1e6))
+
+
+def hover_times(panel):
+    """Mean microseconds of one hover over every airline of a panel, cold cache then warm."""
+
+    times = []
+    for _ in range(2):
+        started = time.perf_counter()
+        for summary in panel.airlines:
+            panel.tooltips.get(summary)
+        times.append((time.perf_counter() - started) / max(len(panel.airlines), 1) * 1e6)
+    return times
+
+
+def main():
+    print("%-10s %6s %12s %12s %12s %14s %14s" % ("renderer", "top_n", "ms/frame", "ms/poll", "median ms", "peak MB", "last-first MB"))
+
+    hovers = []
+    for top_n in (5, 50):
+        fig, axes = make_figure()
+        reader    = ScriptedReader(top_n)
+        run("clear", top_n, lambda frame: clear_frame(fig, axes, reader.latest()) if (frame + 1) % POLL_EVERY == 0 else reader.latest())
+        plt.close(fig)
+
+        fig, axes = make_figure()
+        dashboard = Dashboard(fig, *axes, ScriptedReader(top_n), top_n=top_n)
+        fig.canvas.draw()
+        run("dashboard", top_n, dashboard.update)
+        panel = dashboard.panels[0]
+        hovers.append((top_n, dashboard.blitter.full_draws, panel.tooltips.misses, *hover_times(panel)))
+        plt.close(fig)
+
+    print()
+    print("%6s %14s %22s %16s %16s" % ("top_n", "full redraws", "tooltips built/frames", "cold hover us", "warm hover us"))
+    for top_n, full_draws, built, cold, warm in hovers:
+        print("%6d %14d %22s %16.1f %16.1f" % (top_n, full_draws, "%d/%d" % (built, FRAMES), cold, warm))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark: RollingWindow against rescanning every movement per query.
+
+A day of movements is fed one by one, like the actual time transitions
+of successive polls; after every POLL_EVERY movements the 15 min, 1 h and
+24 h stats are asked for. The rescan side keeps every (actual, scheduled)
+pair and recomputes the same stats with numpy from all of them, which is
+what answering from the board or the history would cost. Both sides must
+give the same movements and on-time counts.
+
+Run from the repository root:
+    python -m benchmarks.bench_rolling
+"""
+import random
+import time
+
+import numpy as np
+
+from scripts.rolling import ON_TIME, ROLLING_WINDOWS, RollingWindow
+from scripts.synthetic import day_start
+
+
+POLL_EVERY = 10
+SIZES = (3500, 35000)
+
+
+def make_movements(count, seed=0):
+    """Returns count (actual, scheduled) pairs over one day, in actual time order."""
+
+    rng   = random.Random(seed)
+    start = day_start()
+    pairs = []
+    for _ in range(count):
+        scheduled = start + rng.randrange(86400)
+        pairs.append((scheduled + int(rng.expovariate(1 / 600)) - 300, scheduled))
+
+    return sorted(pairs)
+
+
+def rescan(actuals, scheduled, now):
+    """Movements and on-time counts of every window, from all the movements (same minute buckets as RollingWindow)."""
+
+    actuals = np.asarray(actuals)
+    on_time = (actuals - np.asarray(scheduled)) <= ON_TIME
+    last    = now // 60
+    results = dict()
+    for name, window in ROLLING_WINDOWS:
+        inside        = (actuals >= (last - window // 60 + 1) * 60) & (actuals < (last + 1) * 60)
+        results[name] = (int(inside.sum()), int((inside & on_time).sum()))
+
+    return results
+
+
+def main():
+    print("%8s %16s %16s %16s %18s" % ("moves", "add (us/move)", "query (us)", "rescan (us)", "query speedup"))
+    for count in SIZES:
+        movements = make_movements(count, seed=count)
+
+        window  = RollingWindow()
+        adds    = 0.0
+        queries = []
+        for index, (actual, scheduled) in enumerate(movements):
+            started = time.perf_counter()
+            window.add(actual, scheduled)
+            adds   += time.perf_counter() - started
+            if index % POLL_EVERY == POLL_EVERY - 1:
+                started = time.perf_counter()
+                window.summary(actual)
+                queries.append(time.perf_counter() - started)
+
+        actuals   = []
+        scheduled = []
+        rescans   = []
+        for index, (actual, schedule) in enumerate(movements):
+            actuals.append(actual)
+            scheduled.append(schedule)
+            if index % POLL_EVERY == POLL_EVERY - 1:
+                started = time.perf_counter()
+                expected = rescan(actuals, scheduled, actual)
+                rescans.append(time.perf_counter() - started)
+
+        now     = movements[-1][0]
+        summary = window.summary(now)
+        for name, _ in ROLLING_WINDOWS:
+            stats = summary[name]
+            assert (stats["movements"], round(stats["on_time"] * stats["movements"] / 100)) == expected[name], name
+
+        query  = np.mean(queries) * 1e6
+        scan   = np.mean(rescans) * 1e6
+        print("%8d %16.2f %16.1f %16.1f %17.1fx" % (count, adds / count * 1e6, query, scan, scan / query))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Benchmark: BoardScheduler polling 50 boards against one local stub server.
+
+Every board has its own URL, state store and cache; the stub answers each
+request after STUB_DELAY seconds, like a distant server. Boards poll back
+to back (interval 0) for SECONDS, with a growing worker pool sharing one
+connection pool of the same size. One board is rate limited to RATE
+requests per second and must stay there whatever the pool size.
+
+Run from the repository root:
+    python -m benchmarks.bench_scheduler
+"""
+import asyncio
+import time
+
+from scripts.fetcher import FidsClient
+from scripts.scheduler import BoardScheduler, BoardSource, SourceRegistry
+from scripts.stub_server import StubFidsServer
+
+
+BOARDS = 50
+SECONDS = 5
+STUB_DELAY = 0.02
+RATE = 2
+
+
+async def run(url, workers):
+    registry = SourceRegistry()
+    for index in range(BOARDS):
+        type = "depart" if index % 2 == 0 else "arrival"
+        path = "departures" if type == "depart" else "arrivals"
+        registry.register(BoardSource("board%d" % index, type, "%s%s?board=%d" % (url, path, index), poll_interval=0,
+                                      rate=RATE if index == 0 else None))
+
+    scheduler = BoardScheduler(registry, FidsClient(pool_size=workers), workers)
+    stop      = asyncio.Event()
+    asyncio.get_running_loop().call_later(SECONDS, stop.set)
+    started   = time.perf_counter()
+    await scheduler.run(stop)
+    elapsed   = time.perf_counter() - started
+
+    polls = [board.polls for name, board in scheduler.boards.items() if name != "board0"]
+    return sum(polls) / elapsed, min(polls), max(polls), scheduler.boards["board0"].polls / elapsed
+
+
+async def main():
+    server = StubFidsServer(flights_per_board=200, delay=STUB_DELAY)
+    url    = await server.start()
+
+    print("%8s %12s %18s %18s" % ("workers", "polls/s", "min/max per board", "limited board/s"))
+    for workers in (1, 4, 8, 16, 32):
+        throughput, low, high, limited = await run(url, workers)
+        print("%8d %12.1f %18s %18.2f" % (workers, throughput, "%d/%d" % (low, high), limited))
+
+    await server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+"""
+Benchmark: DelaySketch update cost, accuracy, size and merging.
+
+Update side: a day of movements goes through DelayBook.record, which
+feeds the airline, country and overall sketches of each flight, against
+keeping every delay in per-group lists (what exact percentiles need).
+Accuracy side: p50/p90/p99 of the sketches against numpy on the exact
+delays, overall and for the busiest airline. Merge side: 30 daily
+overall sketches serialized, then unpacked and merged into a month, as
+HistoryStore.sketches does, against concatenating 30 days of delays.
+
+Run from the repository root:
+    python -m benchmarks.bench_sketch
+"""
+import time
+
+import numpy as np
+
+from scripts.delay_sketch import QUANTILES, DelayBook, DelaySketch
+from scripts.history_store import airport_day
+from scripts.models import Flight
+from scripts.synthetic import make_payload
+
+
+DAYS = 30
+
+
+def moved_flights(count, seed):
+    """Returns the (key, Flight) of the flights of a synthetic board that moved."""
+
+    flights = [Flight.from_record(record, "depart") for record in make_payload(count, "depart", seed=seed)["flights"]]
+
+    return [((flight.flightNumber, flight.scheduledTime), flight) for flight in flights if flight.actualTime]
+
+
+def main():
+    print("%8s %14s %14s %14s" % ("moved", "sketch us/fl", "lists us/fl", "sketch bytes"))
+    for count in (3500, 35000):
+        moved = moved_flights(count, seed=count)
+
+        book    = DelayBook()
+        started = time.perf_counter()
+        for key, flight in moved:
+            book.record(key, flight)
+        sketch_time = (time.perf_counter() - started) / len(moved)
+
+        lists   = dict()
+        started = time.perf_counter()
+        for key, flight in moved:
+            delay = flight.actualTime - flight.scheduledTime
+            for group in (("airline", flight.airline), ("country", flight.country), ("all", "")):
+                lists.setdefault(group, []).append(delay)
+        list_time = (time.perf_counter() - started) / len(moved)
+
+        day   = airport_day(moved[0][1].scheduledTime)
+        every = book.sketches[(day, "all", "")]
+        print("%8d %14.2f %14.2f %14d" % (len(moved), sketch_time * 1e6, list_time * 1e6, len(every.to_bytes())))
+
+    print()
+    print("%-22s %8s %12s %12s %10s" % ("group", "q", "exact min", "sketch min", "rel err"))
+    busiest = max((group for group in lists if group[0] == "airline"), key=lambda group: len(lists[group]))
+    for group in (("all", ""), busiest):
+        exact  = np.array([delay for key, flight in moved for delay in [flight.actualTime - flight.scheduledTime]
+                           if group[0] == "all" or flight.airline == group[1]])
+        sketch = book.sketches[(day,) + group]
+        for name, q in QUANTILES:
+            truth    = np.quantile(exact, q, method="lower")
+            estimate = sketch.quantile(q)
+            print("%-22s %8s %12.2f %12.2f %9.2f%%" % (group[1] or "all", name, truth / 60, estimate / 60,
+                                                       abs(estimate - truth) / max(abs(truth), 1) * 100))
+
+    daily = []
+    delays = []
+    for index in range(DAYS):
+        sketch  = DelaySketch()
+        flights = moved_flights(3500, seed=index)
+        for key, flight in flights:
+            sketch.add(flight.actualTime - flight.scheduledTime)
+        daily.append(sketch.to_bytes())
+        delays.append(np.array([flight.actualTime - flight.scheduledTime for key, flight in flights]))
+
+    started = time.perf_counter()
+    month   = DelaySketch()
+    for data in daily:
+        month.merge(DelaySketch.from_bytes(data))
+    stats   = month.stats()
+    merge   = time.perf_counter() - started
+
+    started = time.perf_counter()
+    exact   = np.concatenate(delays)
+    truth   = np.quantile(exact, [q for _, q in QUANTILES], method="lower")
+    concat  = time.perf_counter() - started
+
+    print()
+    print("%d days: %d delays, sketches %d bytes (exact delays %d bytes)" % (DAYS, month.count, sum(map(len, daily)), exact.nbytes))
+    print("merge + stats %.2f ms, concatenate + quantiles %.2f ms" % (merge * 1000, concat * 1000))
+    print("month p50/p90/p99 sketch %s, exact %s (min)" % ("/".join("%.1f" % stats[name] for name, _ in QUANTILES),
+                                                          "/".join("%.1f" % (value / 60) for value in truth)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark: SnapshotChannel against the four multiprocessing Queues it replaced.
+
+Queue side: what the fetch process used to put every cycle, the top airline
+dicts holding whole raw flight records plus the busiest hours list, pickled
+through a multiprocessing.Queue. Channel side: the compact binary snapshot
+of both boards through shared memory.
+
+Run from the repository root:
+    python -m benchmarks.bench_snapshot
+"""
+import copy
+import multiprocessing as mp
+import pickle
+import time
+
+from benchmarks.reference_aggregation import FlightAggregator, FlightTable, busiest_hours
+from scripts.snapshot_channel import SnapshotChannel, decode_snapshot, empty_board, encode_snapshot
+from scripts.synthetic import make_payload
+
+
+ROUNDS = 500
+
+
+def legacy_queue_payloads(flights, type, top_n):
+    """Rebuilds the dicts the fetch process used to put on its queues: raw records with recentDep/flightsCountered keys."""
+
+    table                     = FlightTable.from_flights(flights, type)
+    flights_data, hour_counts = FlightAggregator(type, top_n).aggregate(table)
+    legacy                    = dict()
+    by_number                 = {flight["flightNumber"]: flight for flight in flights}
+    for airline, summary in flights_data.items():
+        record                     = copy.deepcopy(by_number[summary.flightNumber])
+        record["flightsCountered"] = summary.flightsCountered
+        record["recentDep"]        = copy.deepcopy(by_number[summary.recent.flightNumber]) if summary.recent else dict()
+        legacy[airline]            = record
+
+    return legacy, busiest_hours(hour_counts), flights_data, hour_counts
+
+
+def main():
+    print("%6s %16s %16s %18s %18s" % ("top_n", "queue bytes", "channel bytes", "queue us/cycle", "channel us/cycle"))
+    for top_n in (5, 20, 50):
+        boards = dict()
+        legacy = []
+        for type in ("depart", "arrival"):
+            flights = make_payload(3500, type, seed=top_n)["flights"]
+            data, busiest, flights_data, hour_counts = legacy_queue_payloads(flights, type, top_n)
+            legacy += [data, busiest]
+            boards[type] = dict(empty_board(), version=1, hours=hour_counts.tolist(), airlines=list(flights_data.values()))
+
+        queue_bytes   = sum(len(pickle.dumps(item)) for item in legacy)
+        channel_bytes = len(encode_snapshot(boards))
+
+        queues  = [mp.Queue() for _ in legacy]
+        started = time.perf_counter()
+        for _ in range(ROUNDS):
+            for queue, item in zip(queues, legacy):
+                queue.put(item)
+            for queue in queues:
+                queue.get()
+        queue_time = (time.perf_counter() - started) / ROUNDS
+
+        producer = SnapshotChannel()
+        consumer = SnapshotChannel(producer.name)
+        started  = time.perf_counter()
+        for round in range(ROUNDS):
+            boards["depart"]["version"] = round + 2
+            producer.publish(encode_snapshot(boards))
+            decode_snapshot(consumer.read())
+        channel_time = (time.perf_counter() - started) / ROUNDS
+        consumer.close()
+        producer.close()
+
+        print("%6d %16d %16d %18.1f %18.1f" % (top_n, queue_bytes, channel_bytes, queue_time * 1e6, channel_time * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark: streaming flights decoder against decoding the whole body.
+
+File side: each mode runs in a fresh interpreter on a fixture file of
+3.5k and 50k records, so peak RSS is its own. "json" reads the body and
+json.loads it, like response.json(); "stream" reads 64 KiB blocks through
+flight_stream.iter_flights and keeps the compact records.
+
+Socket side: FidsClient.post_json against post_flights on the stub
+server, with the traced memory peak of one fetch.
+
+Run from the repository root:
+    python -m benchmarks.bench_stream
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+SIZES = (3500, 50000)
+
+
+def peak_rss():
+    """Peak RSS of this process in KiB. ru_maxrss can carry the forking parent's peak over on Linux, VmHWM does not."""
+
+    try:
+        with open("/proc/self/status") as f:
+            return int(next(line for line in f if line.startswith("VmHWM:")).split()[1])
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def child(mode, path):
+    """Decodes one fixture and prints seconds and RSS growth (KiB) as JSON."""
+
+    from scripts.flight_stream import iter_flights
+
+    before  = peak_rss()
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        if mode == "json":
+            flights = json.loads(f.read())["flights"]
+        else:
+            flights = list(iter_flights(iter(lambda: f.read(1 << 16), b""), "depart"))
+    elapsed = time.perf_counter() - started
+
+    print(json.dumps({"records": len(flights), "seconds": elapsed, "rss": peak_rss() - before}))
+
+
+async def socket_side(count):
+    from scripts.fetcher import FidsClient
+    from scripts.stub_server import StubFidsServer
+
+    server  = StubFidsServer(flights_per_board=count)
+    url     = await server.start()
+    results = dict()
+    async with FidsClient(timeout=120) as client:
+        for mode in ("json", "stream"):
+            tracemalloc.start()
+            started = time.perf_counter()
+            if mode == "json":
+                data = await client.post_json(url + "departures", {})
+            else:
+                data = await client.post_flights(url + "departures", {}, "depart")
+            elapsed = time.perf_counter() - started
+            peak    = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results[mode] = (len(data["flights"]), elapsed, peak)
+            del data
+    await server.stop()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "PATH"))
+    args = parser.parse_args()
+    if args.child:
+        return child(*args.child)
+
+    from scripts.synthetic import make_payload
+
+    print("%-8s %8s %8s %12s %14s" % ("side", "records", "mode", "seconds", "peak MiB"))
+    with tempfile.TemporaryDirectory() as directory:
+        for count in SIZES:
+            path = os.path.join(directory, "flights.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(make_payload(count, "depart", seed=count), f, ensure_ascii=False)
+            for mode in ("json", "stream"):
+                out    = subprocess.run([sys.executable, "-m", "benchmarks.bench_stream", "--child", mode, path],
+                                        capture_output=True, text=True, check=True).stdout
+                result = json.loads(out)
+                print("%-8s %8d %8s %12.3f %14.1f" % ("file", result["records"], mode, result["seconds"], result["rss"] / 1024))
+
+    for count in SIZES:
+        for mode, (records, elapsed, peak) in asyncio.run(socket_side(count)).items():
+            print("%-8s %8d %8s %12.3f %14.1f" % ("socket", records, mode, elapsed, peak / 2 ** 20))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Reference aggregation of one payload, the per-fetch path the live tracker used before its state stores.
+
+FlightTable is a columnar view of a "flights" list and FlightAggregator
+computes the top airline summaries and the hourly counts from it in
+vectorized passes; busiest_hours orders those counts. Nothing in scripts/
+uses them: the live path aggregates incrementally in
+state_store.FlightStateStore, and the benchmarks compare it against this
+full rebuild for speed and parity.
+"""
+import numpy as np
+
+from scripts.models import DIRECTIONS, QATAR_UTC_OFFSET, Flight, make_summary
+
+
+def busiest_hours(hour_counts):
+    """
+    Orders the hours of the day by how many movements they had.
+
+    Args:
+        hour_counts: 24 counts, index is the hour of day.
+
+    Returns:
+        Hours with at least one movement, busiest first.
+    """
+
+    hour_counts = np.asarray(hour_counts)
+    hours       = np.flatnonzero(hour_counts)
+
+    return hours[np.argsort(-hour_counts[hours], kind="stable")].tolist()
+
+
+class FlightAggregator():
+    """
+    Aggregation engine shared by departures and arrivals.
+
+    Works on the FlightTable built once per fetch: per-airline counts, the
+    latest scheduled flight, the most recent actual movement and the hourly
+    histogram of actual movements are all vectorized, so the cost is O(N)
+    whatever the number of top airlines.
+
+    Attributes:
+        type: Type of flight data, either "depart" or "arrival".
+        top_n: How many airlines to keep, busiest first.
+    """
+
+    def __init__(self, type, top_n=5) -> None:
+        """
+        Initializes a FlightAggregator instance.
+
+        Args:
+            type: Type of flight data, either "depart" or "arrival".
+            top_n: How many airlines to keep, busiest first.
+        """
+
+        self.type  = type
+        self.top_n = top_n
+
+    def aggregate(self, table):
+        """
+        Aggregates one payload.
+
+        Args:
+            table: The FlightTable of the payload.
+
+        Returns:
+            A (flights_data, hour_counts) tuple. flights_data maps each top
+            airline to its summary (see make_summary). hour_counts is an
+            array of the 24 hourly movement counts in Asia/Qatar time.
+        """
+
+        counts  = table.airline_counts()
+        top     = table.top_airlines(self.top_n)
+        latest  = table.latest_scheduled()
+        recent  = table.most_recent_movement()
+        records = table.records
+
+        flights_data = dict()
+        for airline_id in top.tolist():
+            airline               = table.airlines[airline_id]
+            latest_flight         = Flight.from_record(records[latest[airline_id]], self.type)
+            recent_flight         = Flight.from_record(records[recent[airline_id]], self.type) if recent[airline_id] >= 0 else None
+            flights_data[airline] = make_summary(airline, counts[airline_id], latest_flight, recent_flight)
+
+        return flights_data, table.hour_counts()
+
+
+class FlightTable():
+    """
+    Columnar view of one webservice "flights" list.
+
+    Built once per fetch, so every statistic afterwards is a NumPy
+    operation over typed arrays instead of a Python loop over nested dicts.
+    Airline names and statuses are interned: the arrays hold small integer
+    ids and the names live once in `airlines` / `statuses`.
+
+    Attributes:
+        type: Type of flight data, either "depart" or "arrival".
+        records: The raw flight dicts, row i of every array is records[i].
+        scheduled: Scheduled time of each flight (int64, UNIX seconds).
+        actual: Actual departure/arrival time (int64, 0 when not moved yet).
+        status: Interned flight status id (int16).
+        airline: Interned airline id (int32), ids follow first appearance.
+        airlines: Airline names, indexed by airline id.
+        statuses: Flight status names, indexed by status id.
+    """
+
+    def __init__(self, type, records, scheduled, actual, status, airline, airlines, statuses) -> None:
+        """
+        Initializes a FlightTable instance, use from_flights() to build one.
+        """
+
+        self.type      = type
+        self.records   = records
+        self.scheduled = scheduled
+        self.actual    = actual
+        self.status    = status
+        self.airline   = airline
+        self.airlines  = airlines
+        self.statuses  = statuses
+
+    @classmethod
+    def from_flights(cls, flights, type, lanCode="en"):
+        """
+        Builds a table from the "flights" list of a webservice payload.
+
+        Args:
+            flights: The "flights" list.
+            type: Type of flight data, either "depart" or "arrival".
+            lanCode: The language code used to read airline names and statuses.
+
+        Returns:
+            A FlightTable.
+        """
+
+        actual_key  = DIRECTIONS[type][0]
+        airline_ids = dict()
+        status_ids  = dict()
+        scheduled   = []
+        actual      = []
+        status      = []
+        airline     = []
+
+        for flight in flights:
+            lang = flight["lang"][lanCode]
+            scheduled.append(int(flight["scheduledTime"]))
+            actual.append(int(flight[actual_key] or 0))
+            status.append(status_ids.setdefault(lang["flightStatus"], len(status_ids)))
+            airline.append(airline_ids.setdefault(lang["airlineName"], len(airline_ids)))
+
+        return cls(
+            type,
+            flights if isinstance(flights, list) else list(flights),
+            np.array(scheduled, dtype=np.int64),
+            np.array(actual, dtype=np.int64),
+            np.array(status, dtype=np.int16),
+            np.array(airline, dtype=np.int32),
+            list(airline_ids),
+            list(status_ids),
+        )
+
+    def __len__(self):
+        return len(self.scheduled)
+
+    def airline_counts(self):
+        """Returns the number of flights per airline id."""
+
+        return np.bincount(self.airline, minlength=len(self.airlines))
+
+    def top_airlines(self, n):
+        """
+        Returns the ids of the n airlines with the most flights.
+
+        Ties keep first appearance order, the same as a stable sort of
+        the per-airline counts.
+        """
+
+        counts = self.airline_counts()
+
+        return np.argsort(-counts, kind="stable")[:n]
+
+    def hour_counts(self):
+        """Returns the 24 hourly counts of actual movements in Asia/Qatar time."""
+
+        moved = self.actual[self.actual > 0]
+
+        return np.bincount((moved + QATAR_UTC_OFFSET) // 3600 % 24, minlength=24)
+
+    def latest_scheduled(self):
+        """
+        Returns the row of the latest scheduled flight of every airline.
+
+        Index is the airline id. On equal scheduled times the first row wins.
+        """
+
+        rows  = np.arange(len(self))
+        order = np.lexsort((-rows, self.scheduled, self.airline))
+
+        return self.__last_per_airline__(order, np.full(len(self.airlines), -1, dtype=np.int64))
+
+    def most_recent_movement(self):
+        """
+        Returns the row of the most recent actual movement of every airline.
+
+        Index is the airline id, -1 for airlines without a movement yet. On
+        equal actual times the last row wins.
+        """
+
+        rows  = np.flatnonzero(self.actual > 0)
+        order = rows[np.lexsort((rows, self.actual[rows], self.airline[rows]))]
+
+        return self.__last_per_airline__(order, np.full(len(self.airlines), -1, dtype=np.int64))
+
+    def __last_per_airline__(self, order, out):
+        """Scatters the last row of each airline group of a sorted row order into out."""
+
+        if len(order):
+            grouped = self.airline[order]
+            last    = np.flatnonzero(np.append(grouped[1:] != grouped[:-1], True))
+            out[grouped[last]] = order[last]
+
+        return out
@@ -0,0 +1,74 @@
+"""
+Soak test: FlightsManager polling a local stub server at a fast rate.
+
+Runs thousands of poll cycles (a day of 10 s polls is 8640) against the
+stub with injected failures and reports traced memory and stack depth,
+which must stay flat, plus how closely ticks kept their fixed rate.
+
+Run from the repository root:
+    python -m benchmarks.soak_poller [--polls 10000] [--interval 0.005]
+"""
+import argparse
+import asyncio
+import sys
+import time
+import tracemalloc
+
+from scripts.flights import FlightsManager
+from scripts.snapshot_channel import SnapshotChannel
+from scripts.stub_server import StubFidsServer
+
+
+async def soak(polls, interval):
+    server = StubFidsServer(flights_per_board=100, fail_every=50)
+    url    = await server.start()
+
+    channel = SnapshotChannel()
+    manager = FlightsManager(channel, fids_url=url, poll_interval=interval)
+    manager.client.backoff_base = 0.001
+
+    samples = []
+    poll    = manager.scheduler.poll
+
+    async def sampled_poll(board):
+        depth = 0
+        frame = sys._getframe()
+        while frame is not None:
+            depth += 1
+            frame  = frame.f_back
+        samples.append((time.perf_counter(), depth, tracemalloc.get_traced_memory()[0]))
+        if len(samples) >= polls:
+            manager.stop_event.set()
+        await poll(board)
+
+    # Every poll is sampled, unchanged boards included: the cache skips their analysis
+    manager.scheduler.poll = sampled_poll
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    await manager.__run__()
+    elapsed = time.perf_counter() - started
+    tracemalloc.stop()
+    await server.stop()
+    channel.close()
+
+    return samples, elapsed, server.requests
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--polls", type=int, default=10000)
+    parser.add_argument("--interval", type=float, default=0.005)
+    args = parser.parse_args()
+
+    samples, elapsed, requests = asyncio.run(soak(args.polls, args.interval))
+
+    tenth = max(1, len(samples) // 10)
+    print("polls sampled    %d (%d requests, failures retried)" % (len(samples), requests))
+    print("elapsed          %.1f s, %.1f ms per board tick (interval %.1f ms)" % (elapsed, elapsed * 2000 / len(samples), args.interval * 1000))
+    print("stack depth      first %d, last %d, max %d" % (samples[0][1], samples[-1][1], max(s[1] for s in samples)))
+    print("traced memory    " + ", ".join("%d%%: %.2f MiB" % (10 * i, samples[min(i * tenth, len(samples) - 1)][2] / 2 ** 20) for i in (1, 3, 5, 7, 10)))
+
+
+if __name__ == "__main__":
+    main()
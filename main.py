@@ -1,22 +1,43 @@
-import multiprocessing as mp
-from multiprocessing import Queue
 import time
-from scripts.flights import getFlightsData 
-from matplotlib.animation import FuncAnimation
-from datetime import datetime
-import matplotlib
-matplotlib.use('TkAgg')
-import matplotlib.pyplot as plt
+
+# Taken before any other import, --profile-startup reports from here
+STARTED = time.perf_counter()
+
+import argparse
+import multiprocessing as mp
 import os
 import platform
-import matplotlib.gridspec as gridspec
 
-# Import functions from the custom module
-from scripts.matplot import update_depart_plot, update_busiest_hours_plot, update_arriv_plot
+# Only the standard library is imported up front: the fetch process starts from this module
+# (re-imported as is by the "spawn" start method) before the GUI stack is loaded
+
+# How many airlines the departures and arrivals panels show, up to 50
+TOP_AIRLINES = 5
+
+# FIDS webservices polled, point HAMAD_FIDS_URL at a replay server (python -m scripts.replay serve) to run on a recording
+FIDS_URL = os.environ.get("HAMAD_FIDS_URL", "https://dohahamadairport.com/webservices/fids/")
+
+# Metrics: HAMAD_METRICS_PORT serves GET /metrics of the fetch process on that port and of the GUI on the next one,
+# HAMAD_METRICS_LOG appends polls, frames and errors of both as JSON lines; neither set keeps metrics off
+METRICS_PORT = int(os.environ["HAMAD_METRICS_PORT"]) if os.environ.get("HAMAD_METRICS_PORT") else None
+METRICS_LOG  = os.environ.get("HAMAD_METRICS_LOG") or None
+
+# Milliseconds between two reads of the snapshot channel, until the first snapshot arrives and after
+FIRST_FRAME_INTERVAL = 50
+FRAME_INTERVAL = 1000
+
+# Seconds between two exports of the --export mode, a snapshot already exported is not rendered again
+EXPORT_INTERVAL = 60
+
+# Languages the "l" key of the window cycles through; the fetch process renames without fetching again
+UI_LANGUAGES = ("en", "ar")
 
 # Global variable to store the data fetching process PID
 data_fetch_process_pid = None
 
+# Global variable to store the snapshot channel shared with the data fetching process
+snapshot_channel = None
+
 def on_close(returned):
     """Handle the close event of the main window.
 
@@ -25,58 +46,154 @@ def on_close(returned):
     pid = os.getpid()
     current_platform = platform.system()
 
+    snapshot_channel.close()
+
     if current_platform == "Windows":
         os.system(f"taskkill /F /PID {data_fetch_process_pid}")
         os.system(f"taskkill /F /PID {pid}")
     else:
         os.system(f"kill -9 {data_fetch_process_pid}")
         os.system(f"kill -9 {pid}")
-    
+
     exit()
 
-def main():
-    global data_fetch_process_pid
+def fetch_worker(*args, profile=False):
+    """Entry point of the data fetching process: imports the fetch stack only, then polls (see getFlightsData)."""
+    started = time.time()
+    from scripts.flights import getFlightsData
+    if profile:
+        print("startup: fetch process imports %.3f s" % (time.time() - started))
+    getFlightsData(*args)
 
-    # Create the main figure and axis
-    fig, ax = plt.subplots(figsize=(15, 7))
+class StartupProfile():
+    """Times from process start to each step of the startup, printed once the first frame is drawn.
 
-    # Create a 2x2 grid specification
-    gs = gridspec.GridSpec(2, 2, width_ratios=[2, 2], height_ratios=[0.75, 1.25])
+    Attributes:
+        enabled: False records nothing.
+        marks: (step, seconds since STARTED) in order.
+    """
 
-    # Create subplots
-    ax1 = plt.subplot(gs[0, 0])
-    ax2 = plt.subplot(gs[0, 1])
-    ax3 = plt.subplot(gs[1, :])
+    def __init__(self, enabled) -> None:
+        self.enabled = enabled
+        self.marks   = []
+
+    def mark(self, step):
+        if self.enabled:
+            self.marks.append((step, time.perf_counter() - STARTED))
+
+    def report(self):
+        previous = 0.0
+        for step, at in self.marks:
+            print("startup: %-28s %7.3f s  (+%.3f s)" % (step, at, at - previous))
+            previous = at
+
+def export(args, reader, data_fetch_process):
+    """Export mode: no GUI stack, the Agg renders run in worker processes until interrupted."""
+    from scripts.exporter import Exporter
+
+    metrics = dict()
+    if METRICS_PORT is not None or METRICS_LOG is not None:
+        from scripts.metrics import Metrics, serve_metrics
+        metrics["metrics"] = Metrics(log=METRICS_LOG)
+        if METRICS_PORT is not None:
+            serve_metrics(metrics["metrics"], port=METRICS_PORT + 1)
+
+    exporter = Exporter(reader, args.export, formats=args.export_formats.split(","), interval=args.export_interval, top_n=TOP_AIRLINES,
+                        title="Hamad International Airport", workers=args.export_workers, **metrics)
+    try:
+        exporter.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        exporter.close()
+        data_fetch_process.terminate()
+        snapshot_channel.close()
 
-    # Set labels and titles for subplots
-    ax1.set(xlim=[-7000, 100000], xlabel="Today(Departure)", ylabel="Flights Countered", title=f"Departures Today ({datetime.today().strftime('%Y-%m-%d %H:%M:%S')}) (updates every 10s)")
-    ax2.set(xlim=[-7000, 100000], xlabel="Today(Arrival)", ylabel="Flights Countered", title=f"Arrivals Today ({datetime.today().strftime('%Y-%m-%d %H:%M:%S')}) (updates every 10s)")
-    ax3.set(ylabel="Number of Flights",
-               xlabel="(Busiest Hours for Departure/Arrival Flights) Today(" + datetime.today().strftime('%Y-%m-%d %H:%M:%S') + ") (updates every 10s)")
+def main():
+    global data_fetch_process_pid, snapshot_channel
+
+    parser = argparse.ArgumentParser(description="Live departures and arrivals of Hamad International Airport.")
+    parser.add_argument("--profile-startup", action="store_true", help="print import times and the time to the first frame")
+    parser.add_argument("--export", metavar="DIR", help="no window: write the dashboard to DIR as image files and an HTML page on a schedule")
+    parser.add_argument("--export-interval", type=float, default=EXPORT_INTERVAL, help="seconds between two exports (default %(default)s)")
+    parser.add_argument("--export-formats", default="png,svg,html", help="comma separated formats among png, svg, html (default %(default)s)")
+    parser.add_argument("--export-workers", type=int, default=1, help="processes rendering the exports (default %(default)s)")
+    parser.add_argument("--adaptive", action="store_true", help="plan polls from the timetable instead of every 10 s, see scripts/poll_planner.py")
+    parser.add_argument("--language", default=UI_LANGUAGES[0], help="language names are shown in at start, the \"l\" key switches (default %(default)s)")
+    args = parser.parse_args()
+
+    profile = StartupProfile(args.profile_startup)
+    profile.mark("standard library")
+
+    # Create the latest-snapshot channel and start the data fetching process first, its first poll overlaps the GUI imports
+    from scripts.snapshot_channel import SnapshotChannel, SnapshotReader
+    snapshot_channel = SnapshotChannel()
+    reader           = SnapshotReader(snapshot_channel)
+    profile.mark("snapshot channel")
+
+    data_fetch_process = mp.Process(target=fetch_worker, args=(snapshot_channel.name, TOP_AIRLINES, FIDS_URL, METRICS_PORT, METRICS_LOG, args.language, args.adaptive),
+                                    kwargs={"profile": args.profile_startup})
+    data_fetch_process.start()
 
-    # Initialize legend for ax3
-    ax3.legend()
+    # Store the data fetching process PID
+    data_fetch_process_pid = data_fetch_process.pid
+    profile.mark("fetch process started")
 
-    # Create data queues for communication between processes
-    data_queue           = Queue()
-    data_queue2          = Queue()
-    depBusiestHoursQueue = Queue()
-    arrBusiestHoursQueue = Queue()
+    if args.export is not None:
+        export(args, reader, data_fetch_process)
+        return
 
-    # Sleep to allow time for initialization
-    time.sleep(2)
+    import matplotlib
+    matplotlib.use('TkAgg')
+    # "l" switches the language, not the y scale
+    matplotlib.rcParams["keymap.yscale"] = [key for key in matplotlib.rcParams["keymap.yscale"] if key != "l"]
+    import matplotlib.pyplot as plt
+    import matplotlib.gridspec as gridspec
+    profile.mark("matplotlib imported")
 
-    # Create animation objects for updating plots
-    ani = FuncAnimation(fig, update_depart_plot, cache_frame_data=False, fargs=(fig, ax1, data_queue), interval=10000)
-    ani2 = FuncAnimation(fig, update_arriv_plot, cache_frame_data=False, fargs=(fig, ax2, data_queue2), interval=10000)
-    ani3 = FuncAnimation(fig, update_busiest_hours_plot, cache_frame_data=False, fargs=(fig, ax3, depBusiestHoursQueue, arrBusiestHoursQueue), interval=10000)
+    # Import functions from the custom module
+    from scripts.matplot import Dashboard
+    profile.mark("dashboard imported")
 
-    # Start the data fetching process
-    data_fetch_process = mp.Process(target=getFlightsData, args=(data_queue, data_queue2, depBusiestHoursQueue, arrBusiestHoursQueue))
-    data_fetch_process.start()
+    options = dict()
+    if METRICS_PORT is not None or METRICS_LOG is not None:
+        from scripts.metrics import Metrics, serve_metrics
+        options["metrics"] = Metrics(log=METRICS_LOG)
+        if METRICS_PORT is not None:
+            serve_metrics(options["metrics"], port=METRICS_PORT + 1)
 
-    # Store the data fetching process PID
-    data_fetch_process_pid = data_fetch_process.pid
+    # Create the main figure, the panels are laid out on a grid below
+    fig = plt.figure(figsize=(19, 7))
+
+    # Create a 2x3 grid specification, the third column holds the countries breakdown and its filters
+    gs = gridspec.GridSpec(2, 3, width_ratios=[2, 2, 1.6], height_ratios=[0.75, 1.25])
+
+    # Create subplots
+    ax1 = plt.subplot(gs[0, 0])
+    ax2 = plt.subplot(gs[0, 1])
+    ax3 = plt.subplot(gs[1, :2])
+
+    # Breakdown: the chart on top, under it the direction and airline buttons side by side, then the hours slider
+    breakdown = gs[:, 2].subgridspec(3, 2, height_ratios=[2.2, 1, 0.12], hspace=0.35)
+    ax4       = fig.add_subplot(breakdown[0, :])
+    filters   = (fig.add_subplot(breakdown[1, 0]), fig.add_subplot(breakdown[1, 1]), fig.add_subplot(breakdown[2, :]))
+
+    # The panels own their labels and artists, one timer polls the channel and blits what moved
+    dashboard = Dashboard(fig, ax1, ax2, ax3, reader, top_n=TOP_AIRLINES, title="Hamad International Airport (LIVE)", breakdown=(ax4, *filters), **options)
+    profile.mark("figure built")
+
+    # The channel is read every FIRST_FRAME_INTERVAL ms until the first snapshot is drawn, then every FRAME_INTERVAL ms;
+    # a canvas timer rather than a FuncAnimation, whose every frame would also ask for a full draw of the figure
+    def on_timer():
+        dashboard.update(None)
+        if timer.interval == FIRST_FRAME_INTERVAL and dashboard.frame_times:
+            timer.interval = FRAME_INTERVAL
+            profile.mark("first frame")
+            profile.report()
+
+    timer = fig.canvas.new_timer(interval=FIRST_FRAME_INTERVAL)
+    timer.add_callback(on_timer)
+    timer.start()
 
     # Configure the figure window
     canvas = fig.canvas
@@ -86,6 +203,15 @@ def main():
     # Connect the close event to the on_close function
     canvas.mpl_connect('close_event', on_close)
 
+    # "l" asks the fetch process for the next language, the panels redraw with the version it publishes
+    languages = [args.language] + [language for language in UI_LANGUAGES if language != args.language]
+    def on_key(event):
+        if event.key == "l":
+            languages.append(languages.pop(0))
+            snapshot_channel.request_language(languages[0])
+
+    canvas.mpl_connect('key_press_event', on_key)
+
     # Show the main plot
     plt.show()
 
@@ -0,0 +1,383 @@
+import argparse
+import asyncio
+import datetime
+import json
+import time
+
+from aiohttp import web
+
+from scripts.flights import FlightsManager
+from scripts.history_store import EPOCH, airport_day
+from scripts.metrics import NULL_METRICS, Metrics
+from scripts.snapshot_channel import BOARDS
+
+
+def board_json(board):
+    """Returns the JSON shape of a board, its summaries as dicts (see AirlineSummary.to_dict)."""
+
+    return {"version": board["version"], "hours": board["hours"], "airlines": [summary.to_dict() for summary in board["airlines"]],
+            "rolling": board["rolling"]}
+
+
+def board_delta(previous, board):
+    """
+    Computes what an SSE client holding previous needs to reach board.
+
+    Args:
+        previous: The board as last published, None for a client that has nothing yet.
+        board: The board just published.
+
+    Returns:
+        A dict with "version", "order" (airlines, busiest first), "airlines"
+        (summaries that are new or changed, as dicts), "hours" ({hour:
+        count} for the hours whose count changed) and "rolling" (stats of
+        the rolling windows that changed, by window name).
+    """
+
+    if previous is None:
+        old_airlines = dict()
+        old_hours    = [None] * 24
+        old_rolling  = dict()
+    else:
+        old_airlines = {summary.airline: summary for summary in previous["airlines"]}
+        old_hours    = previous["hours"]
+        old_rolling  = previous["rolling"]
+
+    return {
+        "version": board["version"],
+        "order": [summary.airline for summary in board["airlines"]],
+        "airlines": [summary.to_dict() for summary in board["airlines"] if old_airlines.get(summary.airline) != summary],
+        "hours": {hour: count for hour, count in enumerate(board["hours"]) if old_hours[hour] != count},
+        "rolling": {name: stats for name, stats in board["rolling"].items() if old_rolling.get(name) != stats},
+    }
+
+
+def recent_movements(board):
+    """Returns the most recent movement of every airline of a board, newest first."""
+
+    recent = [dict(summary.to_dict()["recent"], airline=summary.airline) for summary in board["airlines"] if summary.recent]
+
+    return sorted(recent, key=lambda movement: movement["actualTime"], reverse=True)
+
+
+def delay_stats(manager, type, kind, days):
+    """
+    Delay stats of one board by airline or country, today or over the last days.
+
+    Today comes from the manager's DelayBook; longer ranges merge the daily
+    sketches of its HistoryStore and need one.
+
+    Args:
+        manager: The FlightsManager.
+        type: Type of flight data, either "depart" or "arrival".
+        kind: "airline" or "country".
+        days: Number of days ending today.
+
+    Returns:
+        A dict with "days", "all" (stats of every flight) and "groups"
+        (stats by name in the current language, most flights first), see
+        DelaySketch.stats.
+    """
+
+    today = airport_day(time.time())
+    if days <= 1:
+        book   = manager.delays[type]
+        groups = book.table(today, kind)
+        every  = book.stats(today, "all")
+    else:
+        start  = EPOCH + datetime.timedelta(days=today - days + 1)
+        end    = EPOCH + datetime.timedelta(days=today + 1)
+        groups = {name: sketch.stats() for name, sketch in manager.history.sketches(type, start, end, kind).items() if sketch.count > 0}
+        every  = manager.history.sketches(type, start, end, "all").get("")
+        every  = every.stats() if every is not None else None
+
+    translate = manager.strings.translate
+
+    return {"days": days, "all": every, "groups": {translate(name): stats for name, stats in sorted(groups.items(), key=lambda item: -item[1]["count"])}}
+
+
+class AggregatesServer():
+    """
+    Headless HTTP/JSON and Server-Sent Events front of a FlightsManager.
+
+    The manager polls on the same event loop and notifies the server of
+    every board it publishes. Responses are encoded once per board version
+    and shared by every client asking for that version; SSE clients get a
+    full "snapshot" event on connect, then one "delta" event per published
+    board holding only what moved, encoded once for all of them.
+
+    Endpoints:
+        GET /api/snapshot: Both boards.
+        GET /api/{type}: One board, type is "depart" or "arrival".
+        GET /api/{type}/hours: The 24 hourly counts of one board.
+        GET /api/{type}/recent: Most recent movement per top airline, newest first.
+        GET /api/{type}/rolling: Movements, on-time % and delays over the last 15 min, 1 h and 24 h.
+        GET /api/{type}/delays?by=airline|country&days=N: Delay distributions by airline or
+            country, today or merged over the last N days (needs --history).
+        GET /api/language: The language names are shown in, and the languages the records carried.
+        POST /api/language: Switches to the language of the JSON body {"language": code}; both
+            boards are republished in it, without fetching.
+        GET /api/stream: The SSE stream.
+        GET /api/stats: Served against encoded responses, and the scheduler stats per board.
+        GET /metrics: Prometheus text of the manager's Metrics, when they are on.
+
+    Attributes:
+        manager: The FlightsManager polled.
+        queue_size: Events an SSE client may lag behind before it is dropped.
+        keepalive: Seconds between SSE keep-alive comments on a quiet stream.
+        clients: Event queue of every connected SSE client.
+        encoded: Encoded responses, {key: (versions, bytes)}.
+        encodes: Number of responses actually encoded, see stats().
+        served: Number of responses served.
+    """
+
+    def __init__(self, manager, queue_size=64, keepalive=15) -> None:
+        """
+        Initializes an AggregatesServer instance.
+
+        Args:
+            manager: The FlightsManager polled, created with channel=None.
+            queue_size: Events an SSE client may lag behind before it is dropped.
+            keepalive: Seconds between SSE keep-alive comments on a quiet stream.
+        """
+
+        self.manager    = manager
+        self.queue_size = queue_size
+        self.keepalive  = keepalive
+        self.clients    = set()
+        self.encoded    = dict()
+        self.encodes    = 0
+        self.served     = 0
+        self.published  = {type: None for type in BOARDS}
+        self.runner     = None
+        manager.listeners.append(self.__on_publish__)
+        manager.metrics.gauge("sse_clients", lambda: len(self.clients))
+        manager.metrics.gauge("sse_queue_depth", lambda: max((queue.qsize() for queue in self.clients), default=0))
+
+    def versions(self):
+        """Returns the (depart, arrival) versions of the current snapshot."""
+
+        return tuple(self.manager.snapshot[type]["version"] for type in BOARDS)
+
+    def __encode__(self, key, versions, build):
+        """Returns the encoded response for key, built once per versions."""
+
+        cached = self.encoded.get(key)
+        if cached is None or cached[0] != versions:
+            self.encodes     += 1
+            cached            = (versions, json.dumps(build()).encode())
+            self.encoded[key] = cached
+
+        return cached[1]
+
+    def __respond__(self, request, key, versions, build):
+        """Answers with the cached encoding of key, or 304 when the client already holds these versions."""
+
+        etag = '"%s-%s"' % (key, "-".join(map(str, versions)))
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+
+        self.served += 1
+        return web.Response(body=self.__encode__(key, versions, build), content_type="application/json",
+                            headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    async def snapshot_handler(self, request):
+        return self.__respond__(request, "snapshot", self.versions(), lambda: {type: board_json(self.manager.snapshot[type]) for type in BOARDS})
+
+    async def board_handler(self, request):
+        type  = self.__board_type__(request)
+        board = self.manager.snapshot[type]
+        view  = request.match_info.get("view", "")
+        if view == "hours":
+            build = lambda: board["hours"]
+        elif view == "recent":
+            build = lambda: recent_movements(board)
+        elif view == "rolling":
+            build = lambda: board["rolling"]
+        elif view == "delays":
+            kind = request.query.get("by", "airline")
+            days = request.query.get("days", "1")
+            if kind not in ("airline", "country") or not days.isdigit() or (int(days) > 1 and self.manager.history is None):
+                raise web.HTTPBadRequest(text="by must be airline or country, days a number, and days > 1 needs a history store")
+            view  = "delays/%s/%s" % (kind, days)
+            build = lambda: delay_stats(self.manager, type, kind, int(days))
+        elif view == "":
+            build = lambda: board_json(board)
+        else:
+            raise web.HTTPNotFound()
+
+        return self.__respond__(request, type + "/" + view, (board["version"],), build)
+
+    def __board_type__(self, request):
+        type = request.match_info["type"]
+        if type not in BOARDS:
+            raise web.HTTPNotFound()
+        return type
+
+    def __on_publish__(self, type, board):
+        """Manager listener: fans the delta of a published board out to every SSE client."""
+
+        event                = self.__event__("delta", dict(board_delta(self.published[type], board), type=type))
+        self.published[type] = dict(board)
+        for queue in list(self.clients):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # A client that lags this far is dropped, it gets a full snapshot when it reconnects
+                self.clients.discard(queue)
+                queue.get_nowait()
+                queue.put_nowait(None)
+
+    def __event__(self, name, data):
+        """Encodes one SSE event, its id is the (depart, arrival) versions."""
+
+        self.encodes += 1
+        return ("id: %s\nevent: %s\ndata: %s\n\n" % ("-".join(map(str, self.versions())), name, json.dumps(data))).encode()
+
+    async def stream_handler(self, request):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+        await response.prepare(request)
+
+        queue = asyncio.Queue(self.queue_size)
+        queue.put_nowait(self.__snapshot_event__())
+        self.clients.add(queue)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), self.keepalive)
+                except asyncio.TimeoutError:
+                    event = b": keepalive\n\n"
+                if event is None:
+                    break
+                await response.write(event)
+        except ConnectionResetError:
+            pass
+        finally:
+            self.clients.discard(queue)
+
+        return response
+
+    def __snapshot_event__(self):
+        """Returns the "snapshot" event a new SSE client starts from, encoded once per versions."""
+
+        versions = self.versions()
+        cached   = self.encoded.get("stream")
+        if cached is None or cached[0] != versions:
+            cached                 = (versions, self.__event__("snapshot", {type: board_json(self.manager.snapshot[type]) for type in BOARDS}))
+            self.encoded["stream"] = cached
+
+        return cached[1]
+
+    async def language_handler(self, request):
+        if request.method == "POST":
+            try:
+                lanCode = (await request.json())["language"]
+            except (ValueError, KeyError, TypeError):
+                raise web.HTTPBadRequest(text='expected a JSON body {"language": code}')
+            if not isinstance(lanCode, str) or not lanCode.isalpha():
+                raise web.HTTPBadRequest(text="language must be a language code, e.g. ar")
+            self.manager.set_language(lanCode)
+
+        strings = self.manager.strings
+
+        return web.json_response({"language": strings.language, "languages": strings.languages()})
+
+    async def metrics_handler(self, request):
+        return web.Response(text=self.manager.metrics.render(), content_type="text/plain", headers={"Cache-Control": "no-cache"})
+
+    async def stats_handler(self, request):
+        return web.json_response(self.stats())
+
+    def stats(self):
+        """Returns how many responses were served against how many were encoded."""
+
+        return {"versions": self.versions(), "clients": len(self.clients), "served": self.served,
+                "encodes": self.encodes, "boards": self.manager.scheduler.stats()}
+
+    def app(self):
+        """Returns the aiohttp application."""
+
+        app = web.Application()
+        app.router.add_get("/api/snapshot", self.snapshot_handler)
+        app.router.add_get("/api/stream", self.stream_handler)
+        app.router.add_get("/api/stats", self.stats_handler)
+        app.router.add_get("/api/language", self.language_handler)
+        app.router.add_post("/api/language", self.language_handler)
+        if self.manager.metrics.enabled:
+            app.router.add_get("/metrics", self.metrics_handler)
+        app.router.add_get("/api/{type}", self.board_handler)
+        app.router.add_get("/api/{type}/{view}", self.board_handler)
+        app.on_shutdown.append(self.__close_streams__)
+
+        return app
+
+    async def __close_streams__(self, app):
+        for queue in list(self.clients):
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    async def start(self, host="127.0.0.1", port=0):
+        """
+        Starts serving in the running event loop, without polling.
+
+        Args:
+            host: Interface to bind.
+            port: Port to bind, 0 picks a free one.
+
+        Returns:
+            The base URL of the API.
+        """
+
+        self.runner = web.AppRunner(self.app())
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+
+        return "http://%s:%d/api/" % (host, self.runner.addresses[0][1])
+
+    async def stop(self):
+        """Stops serving."""
+
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def serve(self, host="127.0.0.1", port=8000):
+        """Serves and polls until the manager's stop_event is set."""
+
+        url = await self.start(host, port)
+        print("Serving " + url)
+        try:
+            await self.manager.__run__()
+        finally:
+            await self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless Hamad airport tracker serving its aggregates over HTTP/JSON and SSE.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--fids-url", default="https://dohahamadairport.com/webservices/fids/", help="base URL of the FIDS webservices")
+    parser.add_argument("--poll-interval", type=float, default=10, help="seconds between two polls of a board")
+    parser.add_argument("--adaptive", action="store_true", help="plan polls from the timetable: faster around dense waves, slower when quiet")
+    parser.add_argument("--min-interval", type=float, default=5, help="shortest seconds between two polls of a board with --adaptive")
+    parser.add_argument("--max-interval", type=float, default=60, help="longest seconds between two polls of a board with --adaptive, the latency bound")
+    parser.add_argument("--cache-ttl", type=float, default=0, help="seconds a board answer is reused without asking")
+    parser.add_argument("--history", default=None, help="SQLite file to record flight history to")
+    parser.add_argument("--stream", action="store_true", help="decode board answers while they stream in")
+    parser.add_argument("--language", default="en", help="language names are shown in, switched with POST /api/language")
+    parser.add_argument("--record", default=None, help="file to record every changed board answer to, see scripts/replay.py")
+    parser.add_argument("--watch", default=None, help="JSON list of subscription rules notified of status and time changes, see scripts/notifications.py")
+    parser.add_argument("--metrics", action="store_true", help="measure every stage and serve GET /metrics")
+    parser.add_argument("--metrics-log", default=None, help="JSON lines file polls and errors are logged to, implies --metrics")
+    args = parser.parse_args()
+
+    metrics = Metrics(log=args.metrics_log) if args.metrics or args.metrics_log else NULL_METRICS
+    manager = FlightsManager(None, args.fids_url, args.poll_interval, args.cache_ttl, args.history, lanCode=args.language, stream=args.stream,
+                             record=args.record, watch=args.watch, metrics=metrics, adaptive=args.adaptive, min_interval=args.min_interval,
+                             max_interval=args.max_interval)
+    asyncio.run(AggregatesServer(manager).serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+import argparse
+import asyncio
+import datetime
+import time
+
+from scripts.delay_sketch import DelaySketch
+from scripts.fetcher import FidsClient
+from scripts.history_store import HistoryStore, airport_day, day_number
+from scripts.metrics import NULL_METRICS
+from scripts.models import QATAR_UTC_OFFSET, Flight
+from scripts.scheduler import RateLimiter
+
+
+SPANS = {"day": 86400, "hour": 3600}
+
+PATHS = {"depart": "departures?", "arrival": "arrivals?"}
+
+
+def split_range(start, end, span=86400):
+    """
+    Splits a range of airport days into windows aligned on Asia/Qatar midnight.
+
+    Args:
+        start: First day, a datetime.date.
+        end: Day after the last one, a datetime.date.
+        span: Window length in seconds, a divisor of a day.
+
+    Returns:
+        (start, end) windows in UNIX seconds, end excluded, in time order.
+    """
+
+    first = day_number(start) * 86400 - QATAR_UTC_OFFSET
+    last  = day_number(end) * 86400 - QATAR_UTC_OFFSET
+
+    return [(window, window + span) for window in range(first, last, span)]
+
+
+def rebuild_sketches(history, type, days):
+    """
+    Rebuilds the daily delay sketches of some days from the flights stored for them.
+
+    Args:
+        history: The HistoryStore.
+        type: Type of flight data, either "depart" or "arrival".
+        days: Airport days to rebuild.
+    """
+
+    rows = []
+    for day in sorted(days):
+        sketches = dict()
+        for airline, country, delay in history.delays(type, day):
+            for group in (("airline", airline), ("country", country), ("all", "")):
+                sketch = sketches.get(group)
+                if sketch is None:
+                    sketch = sketches[group] = DelaySketch()
+                sketch.add(delay)
+        rows += [(day, kind, name, sketch.to_bytes()) for (kind, name), sketch in sketches.items()]
+    history.save_sketches(type, rows)
+
+
+class Backfill():
+    """
+    Fills a HistoryStore with the flights of past days, window by window.
+
+    A date range is split into day or hour windows per board, fetched
+    concurrently by at most workers requests at a time and at most rate
+    requests per second. The webservice answers at most limit flights per
+    request: a window that comes back full is split in two and both
+    halves are fetched, down to min_span, so nothing is silently cut off.
+    Each window's flights and its "stored" mark are written in one
+    transaction, which is the checkpoint: a run that stops half way
+    resumes where it was, windows already stored are skipped without a
+    request. Delay sketches of the days touched are rebuilt at the end,
+    and so are those of the days of skipped windows that have none saved
+    yet, the days a stopped run stored but never got to.
+
+    Attributes:
+        history: The HistoryStore written to.
+        fids_url: Base URL of the FIDS webservices.
+        limit: Most flights the webservice answers per request.
+        min_span: Shortest window in seconds, a full one is stored as is (and counted as truncated).
+        workers: Most requests in flight at once.
+        limiter: RateLimiter of the requests, None for no limit.
+        client: FidsClient the requests go through.
+        progress: Callable run with the Backfill after each window, None for no report.
+        metrics: Metrics the failed fetches are counted and logged to.
+        windows: Windows to do in the current run.
+        stored: Windows fetched and stored.
+        skipped: Windows already stored by an earlier run.
+        split: Windows that hit the limit and were split.
+        failed: Windows that failed, left for the next run: the fetch failed after every retry, or the answer or one of its records was malformed.
+        failed_windows: (type, start, end) of the failed windows.
+        truncated: Windows still full at min_span.
+        requests: Requests sent.
+        flights: Flights stored.
+    """
+
+    def __init__(self, history, fids_url, limit=3500, min_span=60, workers=4, rate=None, client=None, progress=None, metrics=NULL_METRICS) -> None:
+        """
+        Initializes a Backfill instance.
+
+        Args:
+            history: The HistoryStore written to.
+            fids_url: Base URL of the FIDS webservices.
+            limit: Most flights the webservice answers per request.
+            min_span: Shortest window in seconds.
+            workers: Most requests in flight at once.
+            rate: Most requests per second, None for no limit.
+            client: FidsClient the requests go through, a default one when None.
+            progress: Callable run with the Backfill after each window, None for no report.
+            metrics: Metrics the failed fetches are counted and logged to, printed only by default.
+        """
+
+        self.history   = history
+        self.fids_url  = fids_url
+        self.limit     = limit
+        self.min_span  = min_span
+        self.workers   = workers
+        self.limiter   = RateLimiter(rate) if rate else None
+        self.client    = client if client is not None else FidsClient(pool_size=workers)
+        self.progress  = progress
+        self.metrics   = metrics
+        self.windows        = 0
+        self.stored         = 0
+        self.skipped        = 0
+        self.split          = 0
+        self.failed         = 0
+        self.failed_windows = []
+        self.truncated      = 0
+        self.requests       = 0
+        self.flights        = 0
+        self.semaphore      = None
+
+    async def run(self, start, end, span=86400, types=("depart", "arrival")):
+        """
+        Backfills a range of days.
+
+        Args:
+            start: First day, a datetime.date.
+            end: Day after the last one, a datetime.date.
+            span: Window length in seconds, see SPANS.
+            types: Boards to backfill.
+
+        Returns:
+            True when every window is stored, False when some failed and a rerun is needed.
+        """
+
+        self.semaphore = asyncio.Semaphore(self.workers)
+        windows        = split_range(start, end, span)
+        self.windows  += len(windows) * len(types)
+        touched        = {type: set() for type in types}
+
+        async with self.client:
+            jobs = []
+            for type in types:
+                stored  = self.history.stored_windows(type)
+                skipped = set()
+                for window in windows:
+                    if window in stored:
+                        self.skipped += 1
+                        skipped.add(airport_day(window[0]))
+                        self.__report__()
+                    else:
+                        jobs.append(self.__window__(type, window[0], window[1], stored, touched[type], True))
+                touched[type].update(self.history.unsketched_days(type, skipped))
+            await asyncio.gather(*jobs)
+
+        for type, days in touched.items():
+            if days:
+                rebuild_sketches(self.history, type, days)
+
+        return self.failed == 0
+
+    async def __fetch__(self, type, start, end):
+        """Returns the flight records scheduled in [start, end) of one board."""
+
+        if self.limiter is not None:
+            await self.limiter.acquire()
+        async with self.semaphore:
+            self.requests += 1
+            payload        = {"limit": self.limit, "startTime": start * 1000, "endTime": end * 1000}
+            data           = await self.client.post_json(self.fids_url + PATHS[type], payload)
+
+        flights = data.get("flights") if isinstance(data, dict) else None
+        if not isinstance(flights, list):
+            raise ValueError("answer has no \"flights\" list: %.200r" % (data,))
+
+        return flights
+
+    async def __window__(self, type, start, end, stored, touched, top):
+        """
+        Fetches and stores one window, splitting it while it comes back full.
+
+        Returns:
+            Number of flights of the window, None when a part failed.
+        """
+
+        if (start, end) in stored:
+            return stored[(start, end)]
+        # A bad answer or record fails its window only, the other windows of the run go on
+        try:
+            records = await self.__fetch__(type, start, end)
+            full    = len(records) >= self.limit and end - start > self.min_span
+            flights = None if full else [Flight.from_record(record, type) for record in records]
+        except Exception as e:
+            self.failed += 1
+            self.failed_windows.append((type, start, end))
+            self.metrics.error("backfill", e, board=type)
+            return None
+
+        if full:
+            self.split += 1
+            middle      = start + (end - start) // 2
+            counts      = await asyncio.gather(self.__window__(type, start, middle, stored, touched, False),
+                                               self.__window__(type, middle, end, stored, touched, False))
+            if None in counts:
+                return None
+            count = sum(counts)
+            self.history.record_window(type, start, end, [], count=count)
+        else:
+            if len(records) >= self.limit:
+                self.truncated += 1
+            self.history.record_window(type, start, end, flights)
+            count         = len(flights)
+            self.flights += count
+            touched.update(airport_day(flight.scheduledTime) for flight in flights)
+
+        if top:
+            self.stored += 1
+            self.__report__()
+
+        return count
+
+    def __report__(self):
+        if self.progress is not None:
+            self.progress(self)
+
+    def stats(self):
+        """Returns the window and request counters."""
+
+        return {"windows": self.windows, "stored": self.stored, "skipped": self.skipped, "split": self.split, "failed": self.failed,
+                "truncated": self.truncated, "requests": self.requests, "flights": self.flights}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill a history database with past days of the Hamad airport FIDS boards.")
+    parser.add_argument("history", help="SQLite history file, see scripts/history_store.py")
+    parser.add_argument("--start", required=True, type=datetime.date.fromisoformat, help="first day, YYYY-MM-DD")
+    parser.add_argument("--end", required=True, type=datetime.date.fromisoformat, help="last day, YYYY-MM-DD, included")
+    parser.add_argument("--span", choices=SPANS, default="day", help="window length of the requests")
+    parser.add_argument("--types", nargs="+", choices=PATHS, default=list(PATHS))
+    parser.add_argument("--fids-url", default="https://dohahamadairport.com/webservices/fids/")
+    parser.add_argument("--limit", type=int, default=3500, help="most flights the webservice answers per request")
+    parser.add_argument("--workers", type=int, default=4, help="most requests in flight at once")
+    parser.add_argument("--rate", type=float, default=2, help="most requests per second, 0 for no limit")
+    args = parser.parse_args()
+
+    def progress(backfill):
+        done = backfill.stored + backfill.skipped
+        if done % 10 == 0 or done == backfill.windows:
+            print("%d/%d windows (%d skipped, %d split, %d failed), %d flights" % (
+                done, backfill.windows, backfill.skipped, backfill.split, backfill.failed, backfill.flights))
+
+    history  = HistoryStore(args.history)
+    backfill = Backfill(history, args.fids_url, args.limit, workers=args.workers, rate=args.rate or None, progress=progress)
+    started  = time.perf_counter()
+    complete = asyncio.run(backfill.run(args.start, args.end + datetime.timedelta(1), SPANS[args.span], args.types))
+    history.close()
+
+    print("%s in %.1f s: %s" % ("Done" if complete else "Incomplete, run again to retry the failed windows", time.perf_counter() - started, backfill.stats()))
+    for type, start, end in backfill.failed_windows:
+        print("failed: %s %s, %d s" % (type, datetime.datetime.fromtimestamp(start + QATAR_UTC_OFFSET, datetime.timezone.utc).strftime("%Y-%m-%d %H:%M"), end - start))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+import numpy as np
+
+from scripts.localization import STRINGS
+from scripts.models import qatar_hour
+
+
+class Breakdown():
+    """
+    Group-by counts of one board at one version, read by the breakdown panel.
+
+    The flights of the board are counted in one cube by airline, country
+    (destination for departures, origin for arrivals) and hour of their
+    scheduled time (Asia/Qatar), and in one table by airline and status.
+    The airline x country, country x hour and airline x status breakdowns
+    are sums over the cube's axes, and so is any filter by airline and hour
+    range: no query looks at a flight.
+
+    Attributes:
+        airlines: Airline names, index of the first axis.
+        countries: Country names, index of the second axis.
+        statuses: Status names, index of the second axis of status.
+        routes: Flights by airline, country and scheduled hour, shape (airlines, countries, 24).
+        status: Flights by airline and status, shape (airlines, statuses).
+    """
+
+    __slots__ = ("airlines", "countries", "statuses", "routes", "status")
+
+    def __init__(self, airlines, countries, statuses, routes, status) -> None:
+        self.airlines  = airlines
+        self.countries = countries
+        self.statuses  = statuses
+        self.routes    = routes
+        self.status    = status
+
+    @classmethod
+    def empty(cls):
+        return cls([], [], [], np.zeros((0, 0, 24), dtype=np.int32), np.zeros((0, 0), dtype=np.int32))
+
+    def airline_country(self):
+        """Returns the flights by airline and country, shape (airlines, countries)."""
+
+        return self.routes.sum(axis=2)
+
+    def country_hour(self):
+        """Returns the flights by country and scheduled hour, shape (countries, 24)."""
+
+        return self.routes.sum(axis=0)
+
+    def __rows__(self, airline):
+        """Returns the airline rows a filter keeps, every airline for None, none for an unknown one."""
+
+        if airline is None:
+            return slice(None)
+        if airline in self.airlines:
+            index = self.airlines.index(airline)
+            return slice(index, index + 1)
+
+        return slice(0, 0)
+
+    def countries_for(self, airline=None, hours=(0, 24)):
+        """
+        Counts flights per country for one filter.
+
+        Args:
+            airline: Keep one airline, None keeps them all.
+            hours: (first, last) scheduled hours kept, last excluded.
+
+        Returns:
+            Flights per country, index is the country id.
+        """
+
+        return self.routes[self.__rows__(airline), :, hours[0]:hours[1]].sum(axis=(0, 2))
+
+    def top_countries(self, airline=None, hours=(0, 24), n=10):
+        """
+        Returns the busiest countries of a filter.
+
+        Args:
+            airline: Keep one airline, None keeps them all.
+            hours: (first, last) scheduled hours kept, last excluded.
+            n: How many countries to keep.
+
+        Returns:
+            (country, flights) pairs, busiest first, countries with flights only.
+        """
+
+        counts = self.countries_for(airline, hours)
+        top    = np.argsort(-counts, kind="stable")[:n]
+
+        return [(self.countries[index], int(counts[index])) for index in top.tolist() if counts[index]]
+
+    def statuses_for(self, airline=None):
+        """Returns the (status, flights) pairs of an airline (every airline for None), most flights first."""
+
+        counts = self.status[self.__rows__(airline)].sum(axis=0)
+        order  = np.argsort(-counts, kind="stable")
+
+        return [(self.statuses[index], int(counts[index])) for index in order.tolist() if counts[index]]
+
+
+class BreakdownIndex():
+    """
+    Maintains the Breakdown of one board from the Delta of each poll.
+
+    Names are interned into ids once and the counts live in dense arrays
+    that grow when a new airline, country or status shows up. Each flight
+    key remembers the cell it was counted in, so an inserted, changed or
+    removed flight moves one cell of each array and a quiet poll costs
+    nothing. Ids are given to KEY_LANGUAGE names, so the counts stay put
+    when the language changes; snapshot names them in the current one.
+    After a poll that removed flights (the day rolling over, mostly), the
+    names no flight is counted under any more are dropped, see compact.
+
+    Attributes:
+        ids: Id by key name, per axis ("airline", "country", "status").
+        names: Key names by id, per axis.
+        routes: Flights by airline id, country id and scheduled hour, rows beyond the names are spare.
+        status: Flights by airline id and status id.
+        recorded: (airline id, country id, hour, status id) counted per flight key.
+    """
+
+    # Initial rows of each axis, arrays double from there and compact back to a power of two of them
+    CAPACITY = {"airline": 16, "country": 64, "status": 16}
+
+    def __init__(self) -> None:
+        self.ids      = {"airline": dict(), "country": dict(), "status": dict()}
+        self.names    = {"airline": [], "country": [], "status": []}
+        self.routes   = np.zeros((self.CAPACITY["airline"], self.CAPACITY["country"], 24), dtype=np.int32)
+        self.status   = np.zeros((self.CAPACITY["airline"], self.CAPACITY["status"]), dtype=np.int32)
+        self.recorded = dict()
+
+    def __id__(self, axis, name):
+        """Returns the id of a name, interning it and growing the arrays when it is new."""
+
+        ids   = self.ids[axis]
+        index = ids.get(name)
+        if index is None:
+            index = ids[name] = len(ids)
+            self.names[axis].append(name)
+            if axis == "airline" and index >= len(self.routes):
+                self.routes = np.concatenate((self.routes, np.zeros_like(self.routes)), axis=0)
+                self.status = np.concatenate((self.status, np.zeros_like(self.status)), axis=0)
+            elif axis == "country" and index >= self.routes.shape[1]:
+                self.routes = np.concatenate((self.routes, np.zeros_like(self.routes)), axis=1)
+            elif axis == "status" and index >= self.status.shape[1]:
+                self.status = np.concatenate((self.status, np.zeros_like(self.status)), axis=1)
+
+        return index
+
+    def apply(self, store, delta):
+        """
+        Moves the counts of the flights a poll inserted, changed or removed.
+
+        Args:
+            store: The FlightStateStore of the board, after the poll.
+            delta: Delta of the poll.
+
+        Returns:
+            True when a count moved.
+        """
+
+        moved = False
+        for key in delta.removed:
+            moved = self.__retract__(key) or moved
+        for key in delta.inserted + delta.changed:
+            flight = store.flights[key]
+            cell   = (self.__id__("airline", flight.airline_key), self.__id__("country", flight.country_key), qatar_hour(key[1]),
+                      self.__id__("status", flight.status_key))
+            if self.recorded.get(key) == cell:
+                continue
+            self.__retract__(key)
+            airline, country, hour, status = cell
+            self.routes[airline, country, hour] += 1
+            self.status[airline, status]        += 1
+            self.recorded[key]                   = cell
+            moved                                = True
+        if delta.removed:
+            self.compact()
+
+        return moved
+
+    def compact(self):
+        """
+        Drops the names no flight is counted under any more, e.g. the countries of a day gone by.
+
+        The names left are renumbered in their order, the counts and the
+        cell of every flight follow, and the arrays shrink to fit.
+
+        Returns:
+            True when a name was dropped.
+        """
+
+        airlines, countries, statuses = (len(self.names[axis]) for axis in ("airline", "country", "status"))
+        routes = self.routes[:airlines, :countries]
+        status = self.status[:airlines, :statuses]
+        keep   = {"airline": np.flatnonzero(status.sum(axis=1)), "country": np.flatnonzero(routes.sum(axis=(0, 2))),
+                  "status": np.flatnonzero(status.sum(axis=0))}
+        if all(len(keep[axis]) == len(self.names[axis]) for axis in keep):
+            return False
+
+        renumber = dict()
+        for axis, kept in keep.items():
+            names            = [self.names[axis][index] for index in kept.tolist()]
+            self.names[axis] = names
+            self.ids[axis]   = {name: index for index, name in enumerate(names)}
+            renumber[axis]   = dict(zip(kept.tolist(), range(len(kept))))
+
+        size        = {axis: self.__capacity__(axis, len(kept)) for axis, kept in keep.items()}
+        self.routes = np.zeros((size["airline"], size["country"], 24), dtype=np.int32)
+        self.status = np.zeros((size["airline"], size["status"]), dtype=np.int32)
+        self.routes[:len(keep["airline"]), :len(keep["country"])] = routes[np.ix_(keep["airline"], keep["country"])]
+        self.status[:len(keep["airline"]), :len(keep["status"])]  = status[np.ix_(keep["airline"], keep["status"])]
+
+        to_airline, to_country, to_status = renumber["airline"], renumber["country"], renumber["status"]
+        self.recorded                     = {key: (to_airline[airline], to_country[country], hour, to_status[status])
+                                             for key, (airline, country, hour, status) in self.recorded.items()}
+
+        return True
+
+    def __capacity__(self, axis, names):
+        """Returns the rows of an axis holding names: its initial capacity, doubled until they fit."""
+
+        capacity = self.CAPACITY[axis]
+        while capacity < names:
+            capacity *= 2
+
+        return capacity
+
+    def __retract__(self, key):
+        cell = self.recorded.pop(key, None)
+        if cell is None:
+            return False
+        airline, country, hour, status = cell
+        self.routes[airline, country, hour] -= 1
+        self.status[airline, status]        -= 1
+
+        return True
+
+    def snapshot(self):
+        """Returns the current Breakdown, named in the current language, arrays trimmed to the names and copied."""
+
+        airlines, countries, statuses = (len(self.names[axis]) for axis in ("airline", "country", "status"))
+        airline_names, country_names, status_names = ([STRINGS.translate(name) for name in self.names[axis]] for axis in ("airline", "country", "status"))
+
+        return Breakdown(airline_names, country_names, status_names,
+                         self.routes[:airlines, :countries].copy(), self.status[:airlines, :statuses].copy())
@@ -0,0 +1,270 @@
+import math
+import struct
+
+from scripts.history_store import airport_day
+from scripts.rolling import ON_TIME
+
+
+# Relative accuracy of the quantiles: a returned delay is within 1% of a true one
+ACCURACY = 0.01
+GAMMA = (1 + ACCURACY) / (1 - ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+
+# Delays closer to zero than this (seconds) are counted as exactly on schedule
+ZERO = 1.0
+
+# Serialized sketch: count, zero count, on-time count, delay sum, number of positive and negative bins, then (index, count) pairs
+SKETCH_HEADER = struct.Struct("<qqqdII")
+SKETCH_BIN = struct.Struct("<hi")
+
+QUANTILES = (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))
+
+
+def bin_index(value):
+    """Returns the logarithmic bin of a positive value."""
+
+    return math.ceil(math.log(value) / LOG_GAMMA)
+
+
+def bin_value(index):
+    """Returns the value a bin stands for, within ACCURACY of everything in it."""
+
+    return 2 * GAMMA ** index / (GAMMA + 1)
+
+
+class DelaySketch():
+    """
+    Mergeable delay distribution, DDSketch style.
+
+    Delays (seconds, negative when early) are counted in logarithmic bins
+    whose width grows with the delay, so any quantile comes back within
+    ACCURACY of a true delay whatever the spread, in a few hundred bins at
+    most. Adding, retracting (weight -1) and merging are exact: two
+    sketches merged answer like one sketch fed both streams, which is what
+    rolls days up into weeks and months.
+
+    Attributes:
+        positive: Count per bin of the late delays.
+        negative: Count per bin of the early delays, by absolute value.
+        zero: Count of the delays within ZERO of the schedule.
+        count: Number of delays.
+        total: Sum of the delays, seconds.
+        punctual: Number of delays at most ON_TIME.
+    """
+
+    __slots__ = ("positive", "negative", "zero", "count", "total", "punctual")
+
+    def __init__(self) -> None:
+        self.positive = dict()
+        self.negative = dict()
+        self.zero     = 0
+        self.count    = 0
+        self.total    = 0.0
+        self.punctual = 0
+
+    def add(self, delay, weight=1):
+        """
+        Counts one delay.
+
+        Args:
+            delay: Actual minus scheduled time, seconds.
+            weight: 1 to add the delay, -1 to retract one added before.
+        """
+
+        if delay >= ZERO:
+            bins  = self.positive
+            index = bin_index(delay)
+        elif delay <= -ZERO:
+            bins  = self.negative
+            index = bin_index(-delay)
+        else:
+            self.zero += weight
+            bins       = None
+
+        if bins is not None:
+            count = bins.get(index, 0) + weight
+            if count:
+                bins[index] = count
+            else:
+                del bins[index]
+
+        self.count += weight
+        self.total += weight * delay
+        if delay <= ON_TIME:
+            self.punctual += weight
+
+    def merge(self, other):
+        """Adds every delay of another sketch to this one, returns self."""
+
+        for mine, theirs in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, count in theirs.items():
+                mine[index] = mine.get(index, 0) + count
+        self.zero     += other.zero
+        self.count    += other.count
+        self.total    += other.total
+        self.punctual += other.punctual
+
+        return self
+
+    def quantile(self, q):
+        """
+        Returns the delay at quantile q (0 to 1), in seconds, None when empty.
+
+        Walks the bins from the earliest delay up to the rank of q.
+        """
+
+        if self.count <= 0:
+            return None
+
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.negative, reverse=True):
+            seen += self.negative[index]
+            if seen > rank:
+                return -bin_value(index)
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.positive):
+            seen += self.positive[index]
+            if seen > rank:
+                return bin_value(index)
+
+        return bin_value(max(self.positive)) if self.positive else 0.0
+
+    def stats(self):
+        """
+        Returns the summary of the distribution, None when empty.
+
+        A dict with "count", "on_time" (percentage), "mean", "p50", "p90"
+        and "p99" (delays in minutes).
+        """
+
+        if self.count <= 0:
+            return None
+
+        stats = {"count": self.count, "on_time": 100.0 * self.punctual / self.count, "mean": self.total / self.count / 60}
+        for name, q in QUANTILES:
+            stats[name] = self.quantile(q) / 60
+
+        return stats
+
+    def to_bytes(self):
+        """Packs the sketch, see SKETCH_HEADER."""
+
+        out = [SKETCH_HEADER.pack(self.count, self.zero, self.punctual, self.total, len(self.positive), len(self.negative))]
+        out += [SKETCH_BIN.pack(index, count) for bins in (self.positive, self.negative) for index, count in bins.items()]
+
+        return b"".join(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Unpacks bytes written by to_bytes."""
+
+        sketch = cls()
+        header = SKETCH_HEADER.unpack_from(data, 0)
+        bins   = list(SKETCH_BIN.iter_unpack(memoryview(data)[SKETCH_HEADER.size:]))
+
+        sketch.count, sketch.zero, sketch.punctual, sketch.total = header[:4]
+        sketch.positive = dict(bins[:header[4]])
+        sketch.negative = dict(bins[header[4]:])
+
+        return sketch
+
+    def __reduce__(self):
+        return (DelaySketch.from_bytes, (self.to_bytes(),))
+
+
+class DelayBook():
+    """
+    Delay sketches of one board per airport day, by airline, by country and overall.
+
+    Fed with the actual time transitions of each poll: a flight's delay is
+    counted once in its airline, its country and the "all" sketch of the
+    day it was scheduled, and moved (retracted, then added again) when its
+    actual time is corrected. A flight leaving the board keeps its delay,
+    it did move. Sketches touched since the last save are tracked so only
+    those are persisted.
+
+    Attributes:
+        sketches: DelaySketch by (day, kind, name), kind being "airline", "country" or "all" (name "").
+        recorded: (day, airline, country, delay) counted per flight key.
+        dirty: Sketch keys changed since the last call to take_dirty().
+        days: Days holding sketches.
+    """
+
+    def __init__(self) -> None:
+        self.sketches = dict()
+        self.recorded = dict()
+        self.dirty    = set()
+        self.days     = set()
+
+    def __groups__(self, day, airline, country):
+        return ((day, "airline", airline), (day, "country", country), (day, "all", ""))
+
+    def record(self, key, flight):
+        """
+        Counts the delay of a flight, replacing what was counted for it before.
+
+        Args:
+            key: The flight key, see state_store.flight_key.
+            flight: The Flight; one without an actual time uncounts the key. Grouped by key names.
+        """
+
+        previous = self.recorded.pop(key, None)
+        if previous is not None:
+            day, airline, country, delay = previous
+            for group in self.__groups__(day, airline, country):
+                self.sketches[group].add(delay, -1)
+                self.dirty.add(group)
+
+        if flight.actualTime:
+            day                = airport_day(flight.scheduledTime)
+            delay              = flight.actualTime - flight.scheduledTime
+            airline, country   = flight.airline_key, flight.country_key
+            self.recorded[key] = (day, airline, country, delay)
+            self.days.add(day)
+            for group in self.__groups__(day, airline, country):
+                sketch = self.sketches.get(group)
+                if sketch is None:
+                    sketch = self.sketches[group] = DelaySketch()
+                sketch.add(delay)
+                self.dirty.add(group)
+
+    def regroup(self, key, flight):
+        """Moves the counted delay of a flight whose airline or country changed (e.g. a diversion) to its new sketches, nothing otherwise."""
+
+        previous = self.recorded.get(key)
+        if previous is not None and (previous[1], previous[2]) != (flight.airline_key, flight.country_key):
+            self.record(key, flight)
+
+    def stats(self, day, kind, name=""):
+        """Returns the stats of one sketch of a day (see DelaySketch.stats), None when it has no delay."""
+
+        sketch = self.sketches.get((day, kind, name))
+
+        return sketch.stats() if sketch is not None else None
+
+    def table(self, day, kind):
+        """Returns the stats of every sketch of one kind for a day, by name."""
+
+        return {name: sketch.stats() for (sketch_day, sketch_kind, name), sketch in self.sketches.items()
+                if sketch_day == day and sketch_kind == kind and sketch.count > 0}
+
+    def take_dirty(self):
+        """Returns (day, kind, name, sketch bytes) of the sketches changed since the last call, and forgets them."""
+
+        rows       = [(day, kind, name, self.sketches[(day, kind, name)].to_bytes()) for day, kind, name in self.dirty]
+        self.dirty = set()
+
+        return rows
+
+    def drop_before(self, day):
+        """Forgets every day before day, its flights included; free when there is none."""
+
+        if not self.days or min(self.days) >= day:
+            return
+        self.days     = {kept for kept in self.days if kept >= day}
+        self.sketches = {group: sketch for group, sketch in self.sketches.items() if group[0] >= day}
+        self.recorded = {key: record for key, record in self.recorded.items() if record[0] >= day}
+        self.dirty    = {group for group in self.dirty if group[0] >= day}
@@ -0,0 +1,318 @@
+import base64
+import concurrent.futures
+import datetime
+import html
+import io
+import os
+import signal
+import time
+
+from scripts.metrics import NULL_METRICS
+from scripts.snapshot_channel import decode_snapshot, encode_snapshot
+
+
+# Files an export can write, in the output directory
+EXPORT_FORMATS = {"png": "dashboard.png", "svg": "dashboard.svg", "html": "dashboard.html"}
+
+# Size of the exported figure in inches, and dots per inch of the PNG
+FIGURE_SIZE = (15, 7)
+DPI = 100
+
+# The ExportFigure of a pool worker, built on its first render and reused
+worker_figure = None
+
+
+class ExportFigure():
+    """
+    Off-screen figure of the departures, arrivals and hours panels.
+
+    A plain matplotlib Figure on an Agg canvas, no pyplot and no window:
+    it can live in any process or thread. The panels are the dashboard's
+    own, so an export looks like the live window and a new snapshot only
+    moves their persistent artists before the figure is saved.
+
+    Attributes:
+        fig: The Figure.
+        panels: (departures panel, arrivals panel, hours panel).
+    """
+
+    def __init__(self, top_n=5, title="") -> None:
+        import matplotlib
+        matplotlib.use("Agg")
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        from scripts.matplot import AirlinesPanel, HoursPanel
+
+        self.fig = Figure(figsize=FIGURE_SIZE, dpi=DPI)
+        FigureCanvasAgg(self.fig)
+        grid        = self.fig.add_gridspec(2, 2, width_ratios=[2, 2], height_ratios=[0.75, 1.25])
+        self.panels = (AirlinesPanel(self.fig.add_subplot(grid[0, 0]), "depart", "red", top_n),
+                       AirlinesPanel(self.fig.add_subplot(grid[0, 1]), "arrival", "blue", top_n), HoursPanel(self.fig.add_subplot(grid[1, :])))
+        self.fig.suptitle(title)
+        self.fig.subplots_adjust(left=0.083, bottom=0.071, right=0.937, top=0.91, wspace=0.217, hspace=0.3)
+
+    def render(self, snapshot, formats):
+        """
+        Draws a snapshot.
+
+        Args:
+            snapshot: The decoded snapshot of both boards.
+            formats: Image formats to save, "png" and/or "svg".
+
+        Returns:
+            The image bytes by format.
+        """
+
+        for panel, data in zip(self.panels, (snapshot["depart"], snapshot["arrival"], snapshot)):
+            panel.update(data)
+
+        images = dict()
+        for format in formats:
+            buffer = io.BytesIO()
+            self.fig.savefig(buffer, format=format)
+            images[format] = buffer.getvalue()
+
+        return images
+
+
+def ignore_interrupts():
+    """Initializer of the render workers: Ctrl-C stops the exporter, which then writes what is in flight and stops them."""
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def render_export(data, formats, top_n=5, title="", refresh=60):
+    """
+    Renders one export in a pool worker (or inline).
+
+    Args:
+        data: The snapshot, as encoded by encode_snapshot.
+        formats: Formats to produce, keys of EXPORT_FORMATS.
+        top_n: Airlines per panel, used when the worker builds its figure.
+        title: Title of the figure and the page.
+        refresh: Seconds between two reloads of the HTML page.
+
+    Returns:
+        A (files, seconds, cpu seconds) tuple: the bytes of each format,
+        then the wall and CPU time of the render in this process.
+    """
+
+    global worker_figure
+
+    started = time.perf_counter()
+    cpu     = time.process_time()
+    if worker_figure is None:
+        worker_figure = ExportFigure(top_n, title)
+
+    snapshot = decode_snapshot(data)
+    images   = worker_figure.render(snapshot, [format for format in ("png", "svg") if format in formats or (format == "png" and "html" in formats)])
+    files    = {format: images[format] for format in formats if format != "html"}
+    if "html" in formats:
+        files["html"] = export_page(snapshot, images["png"], title, refresh).encode("utf-8")
+
+    return files, time.perf_counter() - started, time.process_time() - cpu
+
+
+def export_page(snapshot, png, title="", refresh=60):
+    """
+    Builds the self-contained HTML page of an export: the PNG inlined as a
+    data URI and the top airlines of both boards as tables, reloading
+    itself every refresh seconds.
+    """
+
+    rows = []
+    for type, heading in (("depart", "Departures"), ("arrival", "Arrivals")):
+        rows.append("<h2>%s</h2>\n<table>\n<tr><th>Airline</th><th>Flights</th><th>Latest flight</th><th>Most recent movement</th></tr>" % heading)
+        for summary in snapshot[type]["airlines"]:
+            recent = "%s %s" % (summary.recent.flightNumber, summary.recent.status) if summary.recent else ""
+            rows.append("<tr><td>%s</td><td>%d</td><td>%s</td><td>%s</td></tr>" % (
+                html.escape(summary.airline), summary.flightsCountered, html.escape(summary.flightNumber), html.escape(recent)))
+        rows.append("</table>")
+
+    return """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta http-equiv="refresh" content="%d">
+<title>%s</title>
+<style>body{font-family:sans-serif;margin:1em}img{max-width:100%%}table{border-collapse:collapse;margin-bottom:1em}td,th{border:1px solid #ccc;padding:2px 8px;text-align:left}</style>
+</head>
+<body>
+<h1>%s</h1>
+<p>Exported %s, departures version %d, arrivals version %d</p>
+<img alt="dashboard" src="data:image/png;base64,%s">
+%s
+</body>
+</html>
+""" % (refresh, html.escape(title), html.escape(title), datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), snapshot["depart"]["version"],
+       snapshot["arrival"]["version"], base64.b64encode(png).decode("ascii"), "\n".join(rows))
+
+
+def write_atomic(path, data):
+    """Writes a file through a temporary one renamed over it, so readers never see half an export."""
+
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        file.write(data)
+    os.replace(temporary, path)
+
+
+class Exporter():
+    """
+    Exports the latest snapshot as PNG, SVG and HTML files on a schedule.
+
+    Each tick reads the snapshot channel; a snapshot whose board versions
+    were already exported is skipped without rendering, a new one is
+    encoded and handed to a ProcessPoolExecutor whose workers keep an
+    ExportFigure each and render with Agg, off the reading process. The
+    files are written by this process as renders complete, a render older
+    than the last written one being dropped, each through a rename so a
+    wallboard never loads half a file. While every worker is busy, ticks
+    are skipped rather than queued.
+
+    Attributes:
+        reader: SnapshotReader of the channel the fetch process publishes to.
+        directory: Directory the files are written to.
+        formats: Formats written, keys of EXPORT_FORMATS.
+        interval: Seconds between two ticks.
+        top_n: Airlines per panel.
+        title: Title of the figure and the page.
+        workers: Worker processes rendering.
+        executor: The ProcessPoolExecutor, started on first use.
+        pending: Board versions of each render in flight, by future.
+        submitted: Board versions last handed to a worker.
+        written: Board versions of the files on disk.
+        counts: Ticks by result: written, unchanged, busy, dropped.
+        render_times: (seconds, cpu seconds) of each render written.
+        metrics: Metrics the render stage and the ticks go to.
+    """
+
+    def __init__(self, reader, directory, formats=tuple(EXPORT_FORMATS), interval=60, top_n=5, title="", workers=1, metrics=NULL_METRICS) -> None:
+        """
+        Initializes an Exporter instance.
+
+        Args:
+            reader: SnapshotReader (or anything with a latest() method) of the snapshots.
+            directory: Directory the files are written to, created when missing.
+            formats: Formats written, keys of EXPORT_FORMATS.
+            interval: Seconds between two ticks.
+            top_n: Airlines per panel.
+            title: Title of the figure and the page.
+            workers: Worker processes rendering.
+            metrics: Metrics the render stage and the ticks go to.
+        """
+
+        unknown = set(formats) - set(EXPORT_FORMATS)
+        if unknown:
+            raise ValueError("unknown export formats: %s" % ", ".join(sorted(unknown)))
+
+        self.reader       = reader
+        self.directory    = directory
+        self.formats      = tuple(formats)
+        self.interval     = interval
+        self.top_n        = top_n
+        self.title        = title
+        self.workers      = workers
+        self.executor     = None
+        self.pending      = dict()
+        self.submitted    = (0, 0)
+        self.written      = (0, 0)
+        self.counts       = {"written": 0, "unchanged": 0, "busy": 0, "dropped": 0}
+        self.render_times = []
+        self.metrics      = metrics
+
+        os.makedirs(directory, exist_ok=True)
+
+    def close(self):
+        """Writes the renders in flight and stops the workers."""
+
+        self.collect(timeout=None)
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __count__(self, result):
+        self.counts[result] += 1
+        self.metrics.inc("exports_total", result=result)
+
+    def export(self):
+        """
+        Runs one tick: writes the finished renders, then hands the latest
+        snapshot to a worker when its versions moved.
+
+        Returns:
+            True when a render was started.
+        """
+
+        self.collect()
+        snapshot = self.reader.latest()
+        versions = (snapshot["depart"]["version"], snapshot["arrival"]["version"])
+        if versions == self.submitted:
+            self.__count__("unchanged")
+            return False
+        if len(self.pending) >= self.workers:
+            self.__count__("busy")
+            return False
+
+        if self.executor is None:
+            self.executor = concurrent.futures.ProcessPoolExecutor(self.workers, initializer=ignore_interrupts)
+        future               = self.executor.submit(render_export, encode_snapshot(snapshot), self.formats, self.top_n, self.title, self.interval)
+        self.pending[future] = versions
+        self.submitted       = versions
+
+        return True
+
+    def collect(self, timeout=0):
+        """
+        Writes the renders that completed.
+
+        Args:
+            timeout: Seconds to wait for the first one, None waits for all of them.
+        """
+
+        if not self.pending:
+            return
+        done, _ = concurrent.futures.wait(self.pending, timeout=timeout,
+                                          return_when=concurrent.futures.ALL_COMPLETED if timeout is None else concurrent.futures.FIRST_COMPLETED)
+        for future in sorted(done, key=self.pending.get):
+            versions = self.pending.pop(future)
+            try:
+                files, seconds, cpu = future.result()
+            except Exception as e:
+                self.metrics.error("render", e)
+                continue
+            if versions[0] < self.written[0] or versions[1] < self.written[1]:
+                self.__count__("dropped")
+                continue
+            for format, data in files.items():
+                write_atomic(os.path.join(self.directory, EXPORT_FORMATS[format]), data)
+            self.written = versions
+            self.render_times.append((seconds, cpu))
+            self.metrics.observe("stage_seconds", seconds, stage="render")
+            self.__count__("written")
+
+    def run(self, ticks=None):
+        """
+        Exports every interval seconds, writing renders as soon as they complete.
+
+        Args:
+            ticks: Number of ticks to run, None runs until interrupted.
+        """
+
+        next_tick = time.monotonic()
+        while ticks is None or ticks > 0:
+            self.export()
+            ticks = None if ticks is None else ticks - 1
+            if ticks == 0:
+                break
+            next_tick += self.interval
+            while self.pending and time.monotonic() < next_tick:
+                self.collect(timeout=max(next_tick - time.monotonic(), 0))
+            time.sleep(max(next_tick - time.monotonic(), 0))
@@ -0,0 +1,232 @@
+import asyncio
+import hashlib
+import json
+import random
+
+import aiohttp
+
+from scripts.flight_stream import FlightStreamDecoder
+from scripts.metrics import NULL_METRICS
+
+
+class FetchError(Exception):
+    """Raised when a webservice request still fails after every retry."""
+
+
+class FidsClient():
+    """
+    Pooled keep-alive HTTP client for the FIDS webservices.
+
+    One aiohttp session is shared by every board, so polls reuse open
+    connections instead of paying a TCP/TLS handshake each time. Every
+    request has its own timeout and failed requests are retried with
+    jittered exponential backoff.
+
+    Attributes:
+        timeout: Seconds allowed for one request, connect + read.
+        retries: How many times a failed request is retried.
+        backoff_base: First retry delay in seconds, doubled on every retry.
+        backoff_cap: Longest retry delay in seconds.
+        pool_size: Maximum number of open connections.
+        metrics: Metrics the request and decode stages and the retries are measured into.
+    """
+
+    def __init__(self, timeout=15, retries=3, backoff_base=1, backoff_cap=60, pool_size=8, metrics=NULL_METRICS) -> None:
+        """
+        Initializes a FidsClient instance, open() must be awaited before use.
+
+        Args:
+            timeout: Seconds allowed for one request, connect + read.
+            retries: How many times a failed request is retried.
+            backoff_base: First retry delay in seconds, doubled on every retry.
+            backoff_cap: Longest retry delay in seconds.
+            pool_size: Maximum number of open connections.
+            metrics: Metrics the request and decode stages and the retries are measured into, off by default.
+        """
+
+        self.timeout      = timeout
+        self.retries      = retries
+        self.backoff_base = backoff_base
+        self.backoff_cap  = backoff_cap
+        self.pool_size    = pool_size
+        self.metrics      = metrics
+        self.session      = None
+
+    async def open(self):
+        """Opens the pooled session."""
+
+        connector    = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    async def close(self):
+        """Closes the pooled session and its connections."""
+
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def backoff(self, attempt):
+        """
+        Returns the delay before a retry, "full jitter" exponential backoff.
+
+        Args:
+            attempt: Number of failures so far, starting at 1.
+        """
+
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** (attempt - 1)))
+
+    async def post_json(self, url, payload, cache=None):
+        """
+        POSTs a JSON payload and decodes the JSON object answered, retrying on failure.
+
+        An answer that is not a JSON object is a failed attempt like a
+        network error, and is forgotten by the cache.
+
+        Args:
+            url: The webservice URL.
+            payload: A JSON serializable request body.
+            cache: Optional ResponseCache, enables conditional requests.
+
+        Returns:
+            The decoded JSON answer. With a cache, None when the answer did
+            not change since the last call (TTL, 304 or same content).
+
+        Raises:
+            FetchError: When every attempt failed.
+        """
+
+        body = json.dumps(payload)
+        if cache is not None and cache.fresh(url, body):
+            return None
+
+        headers = cache.conditional_headers(url, body) if cache is not None else None
+        for attempt in range(1, self.retries + 2):
+            try:
+                with self.metrics.time("stage_seconds", stage="request"):
+                    async with self.session.post(url, data=body, headers=headers) as response:
+                        if cache is not None and response.status == 304:
+                            cache.revalidated(url)
+                            return None
+                        response.raise_for_status()
+                        raw = await response.read()
+                with self.metrics.time("stage_seconds", stage="decode"):
+                    data = json.loads(raw) if cache is None else cache.store(url, body, raw, response.headers)
+                if data is not None and not isinstance(data, dict):
+                    raise ValueError("answer is not a JSON object: %.200r" % (data,))
+                return data
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                error = e
+                if cache is not None and isinstance(e, ValueError):
+                    cache.forget(url)
+            if attempt <= self.retries:
+                self.metrics.inc("fetch_retries_total")
+                await asyncio.sleep(self.backoff(attempt))
+
+        raise FetchError("%s failed after %d attempts: %r" % (url, self.retries + 1, error))
+
+    async def post_flights(self, url, payload, type, lanCode=None, cache=None, chunk_size=1 << 16):
+        """
+        POSTs a JSON payload and decodes the "flights" answer while it streams in.
+
+        Same contract as post_json, but records are decoded chunk by chunk
+        and projected to the fields the analysis reads (see
+        flight_stream.project): neither the raw body nor the full records
+        are held in memory. With a cache, the content hash is computed on
+        the same chunks; an unchanged answer has then been decoded already
+        but is still reported as None so analysis is skipped. Malformed
+        records are left out and counted (records_skipped_total), an answer
+        without a "flights" array is a failed attempt.
+
+        Args:
+            url: The webservice URL.
+            payload: A JSON serializable request body.
+            type: Type of flight data, either "depart" or "arrival".
+            lanCode: The language kept in the records, None keeps every language.
+            cache: Optional ResponseCache, enables conditional requests.
+            chunk_size: Bytes read from the socket at a time.
+
+        Returns:
+            {"flights": compact records}, or None when the answer did not change.
+
+        Raises:
+            FetchError: When every attempt failed.
+        """
+
+        body = json.dumps(payload)
+        if cache is not None and cache.fresh(url, body):
+            return None
+
+        headers = cache.conditional_headers(url, body) if cache is not None else None
+        for attempt in range(1, self.retries + 2):
+            try:
+                # Decoding overlaps the download, the request stage holds both
+                with self.metrics.time("stage_seconds", stage="request"):
+                    async with self.session.post(url, data=body, headers=headers) as response:
+                        if cache is not None and response.status == 304:
+                            cache.revalidated(url)
+                            return None
+                        response.raise_for_status()
+
+                        decoder = FlightStreamDecoder(type, lanCode)
+                        digest  = hashlib.blake2b(digest_size=16)
+                        size    = 0
+                        flights = []
+                        async for chunk in response.content.iter_chunked(chunk_size):
+                            digest.update(chunk)
+                            size += len(chunk)
+                            flights.extend(decoder.feed(chunk))
+                        decoder.close()
+                if decoder.skipped:
+                    self.metrics.inc("records_skipped_total", decoder.skipped)
+
+                if cache is not None and not cache.store_digest(url, body, digest.digest(), size, response.headers):
+                    return None
+                return {"flights": flights}
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                error = e
+            if attempt <= self.retries:
+                self.metrics.inc("fetch_retries_total")
+                await asyncio.sleep(self.backoff(attempt))
+
+        raise FetchError("%s failed after %d attempts: %r" % (url, self.retries + 1, error))
+
+
+async def run_every(interval, job, stop=None):
+    """
+    Runs a coroutine function at a fixed rate without drift.
+
+    Ticks are planned on the loop clock (start + k * interval), so the time
+    spent in job does not push later ticks back. A job that overruns one or
+    more ticks skips them instead of queueing a burst. This is a plain loop:
+    stack and memory stay flat however long it runs.
+
+    Args:
+        interval: Seconds between ticks, 0 runs job back to back.
+        job: Coroutine function called once per tick, without arguments.
+        stop: Optional asyncio.Event, the loop returns once it is set.
+    """
+
+    loop      = asyncio.get_running_loop()
+    next_tick = loop.time()
+    while stop is None or not stop.is_set():
+        await job()
+
+        next_tick += interval
+        now        = loop.time()
+        if next_tick < now:
+            next_tick += (now - next_tick) // interval * interval + interval if interval else now - next_tick
+
+        if stop is None:
+            await asyncio.sleep(next_tick - now)
+        else:
+            try:
+                await asyncio.wait_for(stop.wait(), next_tick - now)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,161 @@
+import codecs
+import json
+
+from scripts.models import DIRECTIONS
+
+
+DECODER = json.JSONDecoder()
+WHITESPACE = " \t\n\r"
+
+
+def is_record(flight):
+    """Returns True when a decoded record has what project() and the state stores read: a flight number, a scheduled time and names by language."""
+
+    if not isinstance(flight, dict) or "flightNumber" not in flight or "scheduledTime" not in flight:
+        return False
+    langs = flight.get("lang")
+
+    return isinstance(langs, dict) and bool(langs) and all(isinstance(lang, dict) for lang in langs.values())
+
+
+def project(flight, type, lanCode=None):
+    """
+    Keeps only the fields the analysis reads from a raw flight record.
+
+    The result has the shape of a webservice record, so every consumer
+    (state store, history, summaries) takes it unchanged: flight number,
+    scheduled time, the actual time of the direction and, for each
+    language kept, airline name, status and country.
+
+    Args:
+        flight: A raw record of the webservice "flights" list.
+        type: Type of flight data, either "depart" or "arrival".
+        lanCode: The language kept, None keeps every language of the record.
+
+    Returns:
+        The compact record.
+    """
+
+    actual_key, country_key = DIRECTIONS[type]
+    langs                   = flight["lang"]
+
+    return {
+        "flightNumber": flight["flightNumber"],
+        "scheduledTime": flight["scheduledTime"],
+        actual_key: flight.get(actual_key),
+        "lang": {language: {
+            "airlineName": lang.get("airlineName"),
+            "flightStatus": lang.get("flightStatus"),
+            country_key: lang.get(country_key),
+        } for language, lang in langs.items() if lanCode is None or language == lanCode},
+    }
+
+
+class FlightStreamDecoder():
+    """
+    Incremental decoder of a {"flights": [...]} payload.
+
+    Bytes are fed as they come off the socket; every record of the
+    "flights" array is decoded as soon as it is complete, projected and
+    handed out, so the raw body and the full records are never held at
+    once: memory is one chunk, one raw record and the compact records.
+
+    Attributes:
+        type: Type of flight data, either "depart" or "arrival".
+        lanCode: The language kept, None keeps every language.
+        records: Number of records decoded so far.
+        skipped: Number of records left out because they are malformed, see is_record.
+        done: True once the closing "]" of the array was read.
+    """
+
+    def __init__(self, type, lanCode=None) -> None:
+        self.type    = type
+        self.lanCode = lanCode
+        self.records = 0
+        self.skipped = 0
+        self.done    = False
+        self.buffer  = ""
+        self.inside  = False
+        self.utf8    = codecs.getincrementaldecoder("utf-8")()
+
+    def feed(self, chunk):
+        """
+        Decodes the records a chunk completes.
+
+        Args:
+            chunk: The next bytes of the payload.
+
+        Returns:
+            The compact records completed by this chunk, see project().
+        """
+
+        if self.done:
+            return []
+
+        buffer = self.buffer + self.utf8.decode(chunk)
+        pos    = 0
+        if not self.inside:
+            key = buffer.find('"flights"')
+            pos = buffer.find("[", key) if key >= 0 else -1
+            if pos < 0:
+                self.buffer = buffer
+                return []
+            self.inside = True
+            pos        += 1
+
+        flights = []
+        length  = len(buffer)
+        while True:
+            while pos < length and (buffer[pos] in WHITESPACE or buffer[pos] == ","):
+                pos += 1
+            if pos == length:
+                break
+            if buffer[pos] == "]":
+                self.done = True
+                break
+            try:
+                flight, pos = DECODER.raw_decode(buffer, pos)
+            except ValueError:
+                break  # incomplete record, wait for the next chunk
+            if is_record(flight):
+                flights.append(project(flight, self.type, self.lanCode))
+            else:
+                self.skipped += 1
+
+        self.records += len(flights)
+        self.buffer   = "" if self.done else buffer[pos:]
+
+        return flights
+
+    def close(self):
+        """
+        Checks the payload was complete.
+
+        Raises:
+            ValueError: When the stream ended before the end of the "flights" array.
+        """
+
+        if not self.done:
+            raise ValueError("flights stream ended after %d records, %d bytes left undecoded" % (self.records, len(self.buffer)))
+
+
+def iter_flights(chunks, type, lanCode=None):
+    """
+    Generator of the compact records of a payload given as chunks of bytes.
+
+    Args:
+        chunks: Iterable of bytes, e.g. a file read block by block.
+        type: Type of flight data, either "depart" or "arrival".
+        lanCode: The language kept, None keeps every language.
+
+    Yields:
+        Compact records, see project().
+
+    Raises:
+        ValueError: When the payload is truncated or malformed.
+    """
+
+    decoder = FlightStreamDecoder(type, lanCode)
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+    decoder.close()
@@ -1,10 +1,16 @@
-import requests
-import json
-import datetime
+import asyncio
 import time
-import pytz
-import threading
-from collections import Counter
+
+from scripts.breakdown import BreakdownIndex
+from scripts.delay_sketch import DelayBook
+from scripts.fetcher import FidsClient
+from scripts.history_store import HistoryStore, airport_day
+from scripts.localization import STRINGS
+from scripts.metrics import NULL_METRICS, Metrics, serve_metrics
+from scripts.notifications import Notifier, load_subscriptions
+from scripts.rolling import RollingWindow
+from scripts.scheduler import BoardScheduler, SourceRegistry
+from scripts.snapshot_channel import SnapshotChannel, empty_board, encode_snapshot
 
 
 class FlightsManager():
@@ -12,13 +18,29 @@ class FlightsManager():
     A class to manage flight data retrieval and analysis.
 
     Attributes:
-        queue: A queue for storing departure flight data.
-        queue2: A queue for storing arrival flight data.
-        depBusiestHoursQueue: A queue for storing busiest hours for departures.
-        arrBusiestHoursQueue: A queue for storing busiest hours for arrivals.
+        channel: SnapshotChannel the latest snapshot of both boards is published to, None when headless.
+        listeners: Callables run with (type, board) after each publish, in the polling loop.
+        snapshot: Latest snapshot of both boards, see snapshot_channel.encode_snapshot.
         FLIGHTS_DATA_LIMIT: The limit for the number of flight records to fetch.
-        SESSION: A session for making HTTP requests.
-        lanCode: The language code for data retrieval.
+        TOP_AIRLINES: How many airlines are tracked on each board.
+        departure_store: Flight-keyed state of the departures board, updated incrementally.
+        arrival_store: Flight-keyed state of the arrivals board, updated incrementally.
+        POLL_INTERVAL: Seconds between two polls of the same board.
+        client: Pooled keep-alive HTTP client shared by every board.
+        registry: SourceRegistry of the boards polled, "depart" and "arrival" are the published ones.
+        scheduler: BoardScheduler polling the registry, see scheduler.stats().
+        history: HistoryStore the flights that moved are recorded to, None keeps no history.
+        unrecorded: Flights of each published board a failed history write left out, by key, recorded with the next poll.
+        rolling: RollingWindow of each published board, fed with the actual time transitions of every poll.
+        delays: DelayBook of each published board, daily delay sketches by airline and country.
+        breakdowns: BreakdownIndex of each published board, its flights by airline x country x hour and airline x status.
+        clock: Returns the current UNIX time, a replay.ReplayClock when replaying a recording.
+        recorder: replay.Recorder every changed payload is written to, None records nothing.
+        notifier: Notifier of the status and time changes matching the watch rules, None watches nothing.
+        metrics: Metrics every stage from the request to the publish is measured into, see scripts/metrics.py.
+        stop_event: asyncio.Event that stops the polling loops once set.
+        strings: The LocalizedStrings table the flights read their names from.
+        lanCode: The language names are shown in, see set_language.
         HAP_URL: The base URL for flight status data.
         ARRIVAL_PATH: The path for arrival flight data.
         DEPARTURE_PATH: The path for departure flight data.
@@ -26,341 +48,318 @@ class FlightsManager():
         ARRIVAL_DATA: The URL for arrival flights data.
 
     Methods:
-        __get_top_relevant__(data): Extracts the top 5 relevant airlines from flight data.
-        __update_arrival_flight__(data): Updates arrival flight data.
-        __update_departured_flight__(data): Updates departure flight data.
-        __analyze_flights__(data, type): Analyzes flight data and updates the respective data attributes.
-        __get_start_and_end__(): Gets the start and end times for flight data retrieval.
-        __get_flights_by_type__(type, time): Retrieves flight data based on type and time.
-        __get_Departures__(): Continuously retrieves and analyzes departure flight data.
-        __get_Arrivals__(): Continuously retrieves and analyzes arrival flight data.
-        __main_loop__(): Starts threads for departure and arrival flight data retrieval.
+        __publish__(type): Publishes a new version of one board.
+        __attach_delays__(type, flights_data): Sets today's delay stats of each summarized airline.
+        __update_arrival_flight__(delta, rolling, breakdown): Publishes arrival flight data when it moved.
+        __update_departured_flight__(delta, rolling, breakdown): Publishes departure flight data when it moved.
+        __analyze_flights__(board, delta): Records and publishes what the last poll of a board moved.
+        set_language(lanCode): Shows names in another language and republishes both boards, without fetching.
+        __watch_language__(): Switches to the language the GUI asks for on the channel.
+        __run__(): Polls every board over one pooled client.
+        __main_loop__(): Runs the departure and arrival polling on one asyncio event loop.
     """
      
-    def __init__(self, queue, queue2, depBusiestHoursQueue, arrBusiestHoursQueue) -> None:
+    def __init__(self, channel, fids_url="https://dohahamadairport.com/webservices/fids/", poll_interval=10, cache_ttl=0, history=None, lanCode="en", stream=False, top_n=5, clock=time.time, record=None, watch=None, metrics=NULL_METRICS,
+                 adaptive=False, min_interval=5, max_interval=60) -> None:
         """
         Initializes a FlightsManager instance.
 
         Args:
-            queue: A queue for storing departure flight data.
-            queue2: A queue for storing arrival flight data.
-            depBusiestHoursQueue: A queue for storing busiest hours for departures.
-            arrBusiestHoursQueue: A queue for storing busiest hours for arrivals.
+            channel: SnapshotChannel to publish the latest snapshot to, None to only notify listeners.
+            fids_url: Base URL of the FIDS webservices, a local stub server in tests.
+            poll_interval: Seconds between two polls of the same board.
+            cache_ttl: Seconds a board answer is reused without asking the server, 0 always asks.
+            history: Path of the SQLite history database, None keeps no history.
+            lanCode: The language names are shown in; every language of the records is kept either way.
+            stream: Decode board answers while they stream in, see FidsClient.post_flights.
+            top_n: How many airlines are tracked on each board, up to 50 for the dashboard.
+            clock: Returns the current UNIX time, see replay.ReplayClock.
+            record: Path of a recording every changed payload is written to, see replay.Recorder.
+            watch: Path of a JSON list of subscription rules to notify, see notifications.load_subscriptions.
+            metrics: Metrics the pipeline stages, counters and gauges go to, off by default.
+            adaptive: Plan the polls of each board from its timetable and recent changes, poll_interval
+                being the interval at the day's mean change rate (see poll_planner.PollPlanner).
+            min_interval: Shortest interval between two polls of an adaptive board.
+            max_interval: Longest interval between two polls of an adaptive board.
         """
 
         self.departure_flights_keys     = []
         self.departure_flights_data     = dict()
         self.arrival_flights_keys       = []
         self.arrival_flights_data       = dict()
-        self.queue                      = queue
-        self.queue2                     = queue2
-        self.depBusiestHoursQueue       = depBusiestHoursQueue
-        self.arrBusiestHoursQueue       = arrBusiestHoursQueue
+        self.channel                    = channel
+        self.listeners                  = []
+        self.snapshot                   = {"depart": empty_board(), "arrival": empty_board()}
         self.FLIGHTS_DATA_LIMIT         = 3500
-        self.SESSION                    = requests.session()
-        self.lanCode                    = "en"
+        self.TOP_AIRLINES               = top_n
+        self.POLL_INTERVAL              = poll_interval
+        self.metrics                    = metrics
+        self.client                     = FidsClient(metrics=metrics)
+        self.history                    = HistoryStore(history) if history is not None else None
+        self.unrecorded                 = {"depart": dict(), "arrival": dict()}
+        self.rolling                    = {"depart": RollingWindow(), "arrival": RollingWindow()}
+        self.delays                     = {"depart": DelayBook(), "arrival": DelayBook()}
+        self.breakdowns                 = {"depart": BreakdownIndex(), "arrival": BreakdownIndex()}
+        self.clock                      = clock
+        self.recorder                   = None
+        if record is not None:
+            from scripts.replay import Recorder  # gzip, aiohttp.web and the stub server, only when recording
+            self.recorder = Recorder(record)
+        self.stop_event                 = None
+        self.strings                    = STRINGS
+        self.strings.use(lanCode)
+        self.lanCode                    = lanCode
         self.HAP_URL                    = "https://dohahamadairport.com/airlines/flight-status?"
         self.ARRIVAL_PATH               = "type=arrivals&day=today&airline=all&locate=all&search_key="
         self.DEPARTURE_PATH             = "type=departures&day=today&airline=all&locate=all&search_key="
-        self.DEPARTURES_DATA            = "https://dohahamadairport.com/webservices/fids/departures?"
-        self.ARRIVAL_DATA               = "https://dohahamadairport.com/webservices/fids/arrivals?"
-
-    def __get_top_relevant__(self, data):
-        airlines = []
-        airCount = dict()
-
-        for line in data:
-            if line["lang"]["en"]["airlineName"] not in airlines:
-                airlineName = line["lang"]["en"]["airlineName"]
-                airlines.append(airlineName)
-                airCount[airlineName] = 1
-            else:
-                airlineName = line["lang"]["en"]["airlineName"]
-                airCount[airlineName] += 1
-        
-        top_5_airlines = dict(sorted(airCount.items(), key=lambda item: item[1], reverse=True)[:5])
-
-        return top_5_airlines.keys()
-        
-
-
-    def __update_arrival_flight__(self, data):
+        self.DEPARTURES_DATA            = fids_url + "departures?"
+        self.ARRIVAL_DATA               = fids_url + "arrivals?"
+        self.registry                   = SourceRegistry()
+        self.registry.airport(fids_url, poll_interval=poll_interval, limit=self.FLIGHTS_DATA_LIMIT, cache_ttl=cache_ttl, stream=stream,
+                                              adaptive=adaptive, min_interval=min_interval, max_interval=max_interval)
+        self.scheduler                  = BoardScheduler(self.registry, self.client, recorder=self.recorder, metrics=metrics)
+        self.departure_store            = self.scheduler.boards["depart"].store
+        self.arrival_store              = self.scheduler.boards["arrival"].store
+        for board in self.scheduler.boards.values():
+            board.listeners.append(lambda board, delta: self.__analyze_flights__(board, delta))
+        self.notifier                   = None
+        if watch is not None:
+            self.notifier = Notifier(load_subscriptions(watch), clock=clock, metrics=metrics)
+            self.notifier.attach(self.scheduler)
+
+    def __publish__(self, type):
         """
-        Updates arrival flight data based on incoming data.
+        Publishes a new version of one board to the channel and the listeners.
 
         Args:
-            data: New arrival flight data.
+            type: The board that moved, either "depart" or "arrival".
         """
 
-        self.arrival_flights_keys   = []
-        self.arrival_flights_data   = dict()
-        busiest_hours               = []
+        board             = self.snapshot[type]
+        board["version"] += 1
+        with self.metrics.time("stage_seconds", stage="publish", board=type):
+            if self.channel is not None:
+                self.channel.publish(encode_snapshot(self.snapshot))
+            for listener in self.listeners:
+                listener(type, board)
+        self.metrics.inc("publishes_total", board=type)
 
-        self.arrival_flights_keys   = self.__get_top_relevant__(data)
-        
+    def __attach_delays__(self, type, flights_data):
+        """Sets today's delay stats of each summarized airline."""
 
-        try:
-            for airlineName in self.arrival_flights_keys:
-                for airtrip in data:
-                    if(airlineName == airtrip["lang"]["en"]["airlineName"]):
-                        if(airlineName not in self.arrival_flights_data):
-                            self.arrival_flights_data[airlineName]                     = dict()
-                            self.arrival_flights_data[airlineName]                     = airtrip
-                            self.arrival_flights_data[airlineName]["recentArri"]       = dict()
-                            self.arrival_flights_data[airlineName]["flightsCountered"] = 1
-                        else:
-                            if(airtrip["actualTimeOfArr"]):
-                                busiest_hours.append(int(airtrip["actualTimeOfArr"]))
-
-                            if self.arrival_flights_data[airlineName]["flightsCountered"]:
-                                self.arrival_flights_data[airlineName]["flightsCountered"] += 1
-                            else:
-                                self.arrival_flights_data[airlineName]["flightsCountered"] = 1
-
-                            flightsCountered = self.arrival_flights_data[airlineName]["flightsCountered"]
-                            recentArri       = self.arrival_flights_data[airlineName]["recentArri"]
-                            if(int(airtrip["scheduledTime"]) > int(self.arrival_flights_data[airlineName]["scheduledTime"])):
-                                self.arrival_flights_data[airlineName]                     = dict()
-                                self.arrival_flights_data[airlineName]                     = airtrip
-                                self.arrival_flights_data[airlineName]["flightsCountered"] = flightsCountered
-                                self.arrival_flights_data[airlineName]["recentArri"]       = recentArri
-
-                            if(airtrip["actualTimeOfArr"]):
-                                if(self.arrival_flights_data[airlineName]["actualTimeOfArr"] != None):
-                                    if(int(self.arrival_flights_data[airlineName]["actualTimeOfArr"]) > int(airtrip["actualTimeOfArr"])):
-                                        self.arrival_flights_data[airlineName]["recentArri"] = self.arrival_flights_data[airlineName]
-                                    else:
-                                        self.arrival_flights_data[airlineName]["recentArri"] = airtrip
-                                else:
-                                    self.arrival_flights_data[airlineName]["recentArri"] = airtrip
-
-
-                """
-                pull out (Hour) from airflights (timestamps)
-                to determine busiest hours in the day
-                """
-                busiest_hours_temp = []
-                for timestamp in busiest_hours:
-                    datetimeObj = datetime.datetime.fromtimestamp(timestamp)
-                    hour        = datetimeObj.hour
-                    busiest_hours_temp.append(hour)
-                
-                # Count the occurrences of each hour
-                hour_counts = Counter(busiest_hours_temp)
-
-                # Create a list of (hour, count) tuples
-                hour_count_tuples = [(hour, count) for hour, count in hour_counts.items()]
-
-                # Sort the list in descending order based on count
-                hour_count_tuples.sort(key=lambda x: x[1], reverse=True)
-
-                """ 
-                    Extract the 24 most frequent hours 
-                    Because a day spans from 12:00 AM (midnight) to the following day at 12:00 AM
-                    which equals 24
-                """
-                top_busiest_hours = [hour for hour, _ in hour_count_tuples[:24]]
-
-                self.arrBusiestHoursQueue.put(top_busiest_hours)
-                self.queue2.put(self.arrival_flights_data)
-        except Exception as e:
-            print("arrival_flights_data")
-            print(e)
+        book  = self.delays[type]
+        today = airport_day(self.clock())
+        for airline, summary in flights_data.items():
+            summary.delays = book.stats(today, "airline", airline)
 
-    def __update_departured_flight__(self, data):
+    def __update_arrival_flight__(self, delta, rolling, breakdown):
         """
-        Updates departure flight data based on incoming data.
+        Publishes arrival flight data when the last poll moved it.
 
         Args:
-            data: New departure flight data.
+            delta: Delta of the arrival state store for the last poll.
+            rolling: Rolling window stats of the arrivals at the time of the poll.
+            breakdown: New Breakdown of the arrivals, None when no count of it moved.
         """
 
-        self.departure_flights_keys = []
-        self.departure_flights_data = dict()
-        busiest_hours               = []
-
-
-        self.departure_flights_keys = self.__get_top_relevant__(data)
-
         try:
-            for airlineName in self.departure_flights_keys:
-                for airtrip in data:
-                    if(airlineName == airtrip["lang"]["en"]["airlineName"]):
-                        if(airlineName not in self.departure_flights_data):
-                            self.departure_flights_data[airlineName]                     = dict()
-                            self.departure_flights_data[airlineName]                     = airtrip
-                            self.departure_flights_data[airlineName]["recentDep"]        = dict()
-                            self.departure_flights_data[airlineName]["flightsCountered"] = 1
-                        else:
-                            if(airtrip["actualTimeOfDep"]):
-                                busiest_hours.append(int(airtrip["actualTimeOfDep"]))
-
-                            if self.departure_flights_data[airlineName]["flightsCountered"]:
-                                self.departure_flights_data[airlineName]["flightsCountered"] += 1
-                            else:
-                                self.departure_flights_data[airlineName]["flightsCountered"] = 1
-                            
-                            flightsCountered = self.departure_flights_data[airlineName]["flightsCountered"]
-                            recentDep        = self.departure_flights_data[airlineName]["recentDep"]
-                            if(int(airtrip["scheduledTime"]) > int(self.departure_flights_data[airlineName]["scheduledTime"])):
-                                self.departure_flights_data[airlineName]                     = dict()
-                                self.departure_flights_data[airlineName]                     = airtrip
-                                self.departure_flights_data[airlineName]["flightsCountered"] = flightsCountered
-                                self.departure_flights_data[airlineName]["recentDep"]        = recentDep
-
-                            if(airtrip["actualTimeOfDep"]):
-                                if(self.departure_flights_data[airlineName]["actualTimeOfDep"] != None):
-                                    if(int(self.departure_flights_data[airlineName]["actualTimeOfDep"]) > int(airtrip["actualTimeOfDep"])):
-                                        self.departure_flights_data[airlineName]["recentDep"] = self.departure_flights_data[airlineName]
-                                    else:
-                                        self.departure_flights_data[airlineName]["recentDep"] = airtrip
-                                else:
-                                    self.departure_flights_data[airlineName]["recentDep"] = airtrip
-
-                
-                """
-                pull out (Hour) from airflights (timestamps)
-                to determine busiest hours in the day
-                """
-                busiest_hours_temp = []
-                for timestamp in busiest_hours:
-                    datetimeObj = datetime.datetime.fromtimestamp(timestamp)
-                    hour        = datetimeObj.hour
-                    busiest_hours_temp.append(hour)
-                
-                # Count the occurrences of each hour
-                hour_counts = Counter(busiest_hours_temp)
-
-                # Create a list of (hour, count) tuples
-                hour_count_tuples = [(hour, count) for hour, count in hour_counts.items()]
-
-                # Sort the list in descending order based on count
-                hour_count_tuples.sort(key=lambda x: x[1], reverse=True)
-
-                """ 
-                    Extract the 24 most frequent hours 
-                    Because a day spans from 12:00 AM (midnight) to the following day at 12:00 AM
-                    which equals 24
-                """
-                top_busiest_hours = [hour for hour, _ in hour_count_tuples[:24]]
-
-                self.depBusiestHoursQueue.put(top_busiest_hours)
-                self.queue.put(self.departure_flights_data)
+            board = self.snapshot["arrival"]
+            top   = self.arrival_store.top_airlines(self.TOP_AIRLINES)
+            if top != self.arrival_flights_keys or not delta.airlines.isdisjoint(top):
+                self.arrival_flights_keys = top
+                self.arrival_flights_data = self.arrival_store.summaries(top)
+                self.__attach_delays__("arrival", self.arrival_flights_data)
+                board["airlines"]         = list(self.arrival_flights_data.values())
+            elif not delta.hours_changed and rolling == board["rolling"] and breakdown is None:
+                return
+
+            board["hours"]   = list(self.arrival_store.hour_counts)
+            board["rolling"] = rolling
+            if breakdown is not None:
+                board["breakdown"] = breakdown
+            self.__publish__("arrival")
         except Exception as e:
-            print("departure_flights_data")
-            print(e)
-
-       
+            self.metrics.error("summarize", e, board="arrival")
 
-
-    def __analyze_flights__(self, data, type):
+    def __update_departured_flight__(self, delta, rolling, breakdown):
         """
-        Analyzes flight data and updates the respective data attributes.
+        Publishes departure flight data when the last poll moved it.
 
         Args:
-            data: Flight data to analyze.
-            type: Type of flight data, either "depart" or "arrival".
+            delta: Delta of the departure state store for the last poll.
+            rolling: Rolling window stats of the departures at the time of the poll.
+            breakdown: New Breakdown of the departures, None when no count of it moved.
         """
 
-        data = data["flights"]
-        if(type == "depart"):            
-            self.__update_departured_flight__(data)
-        else:
-            self.__update_arrival_flight__(data)
-
-    def __get_start_and_end__(self):
+        try:
+            board = self.snapshot["depart"]
+            top   = self.departure_store.top_airlines(self.TOP_AIRLINES)
+            if top != self.departure_flights_keys or not delta.airlines.isdisjoint(top):
+                self.departure_flights_keys = top
+                self.departure_flights_data = self.departure_store.summaries(top)
+                self.__attach_delays__("depart", self.departure_flights_data)
+                board["airlines"]           = list(self.departure_flights_data.values())
+            elif not delta.hours_changed and rolling == board["rolling"] and breakdown is None:
+                return
+
+            board["hours"]   = list(self.departure_store.hour_counts)
+            board["rolling"] = rolling
+            if breakdown is not None:
+                board["breakdown"] = breakdown
+            self.__publish__("depart")
+        except Exception as e:
+            self.metrics.error("summarize", e, board="depart")
 
+    def __analyze_flights__(self, board, delta):
         """
-        Gets the start and end times for flight data retrieval.
+        Records and publishes what the last poll of a board moved.
 
-        Returns:
-            Start and end times as UNIX timestamps.
+        Args:
+            board: The scheduler Board that was polled.
+            delta: Delta of its state store for that poll.
         """
 
-        tz    = pytz.timezone('Asia/Qatar')
-        today = datetime.datetime.now(tz=tz)
-        # one_month_ago = today - datetime.timedelta(days=30)
-        start = today.replace(hour=0, minute=0, second=0, microsecond=0)
-        end   = start + datetime.timedelta(1)
-
-        # one_month_ago = int(round(datetime.datetime.timestamp(one_month_ago))) * 1000
-        start         = int(round(datetime.datetime.timestamp(start))) * 1000
-        end           = int(round(datetime.datetime.timestamp(end))) * 1000
-
-        return start, end
+        type  = board.source.type
+        store = board.store
+        # A history that cannot be written (locked, full, I/O error) is counted, it never stops the live board.
+        # The flights it left out are kept, even those that left the board since, and recorded with the next poll
+        unrecorded = self.unrecorded[type]
+        if self.history is not None and (delta.inserted or delta.changed or unrecorded):
+            with self.metrics.time("stage_seconds", stage="history", board=type):
+                unrecorded.update((key, store.flights[key]) for key in delta.inserted + delta.changed)
+                try:
+                    self.history.record(type, list(unrecorded.values()))
+                    unrecorded.clear()
+                except Exception as e:
+                    self.metrics.error("history", e, board=type)
+
+        # A corrected actual time moves the movement to its new bucket and its delay to its new bin
+        with self.metrics.time("stage_seconds", stage="rolling", board=type):
+            now    = self.clock()
+            window = self.rolling[type]
+            book   = self.delays[type]
+            for key, old, new in delta.moved:
+                scheduled = int(key[1])
+                if old:
+                    window.retract(old, scheduled)
+                if new:
+                    window.add(new, scheduled)
+                book.record(key, store.flights[key])
+            for key in delta.changed:
+                book.regroup(key, store.flights[key])
+            rolling = window.summary(now)
+
+            book.drop_before(airport_day(now) - 1)
+            if self.history is not None and book.dirty:
+                rows = book.take_dirty()
+                try:
+                    self.history.save_sketches(type, rows)
+                except Exception as e:
+                    book.dirty.update((day, kind, name) for day, kind, name, _ in rows)  # saved with the next poll
+                    self.metrics.error("history", e, board=type)
+
+        with self.metrics.time("stage_seconds", stage="breakdown", board=type):
+            breakdowns = self.breakdowns[type]
+            breakdown  = breakdowns.snapshot() if breakdowns.apply(store, delta) else None
+
+        # Includes the publish, which is also measured on its own
+        with self.metrics.time("stage_seconds", stage="summarize", board=type):
+            if(type == "depart"):
+                self.__update_departured_flight__(delta, rolling, breakdown)
+            else:
+                self.__update_arrival_flight__(delta, rolling, breakdown)
 
-    def __get_flights_by_type__(self, type, time= "t=" + str(int(round(time.time() * 1000)))):
+    def set_language(self, lanCode):
         """
-        Retrieves flight data based on type and time.
+        Shows names in another language and republishes both boards.
+
+        Flights, counts and sketches are keyed by id or key name and do not
+        move: the summaries of the top airlines and the breakdowns are only
+        rebuilt from the state stores, no board is fetched again.
 
         Args:
-            type: Type of flight data, either "depart" or "arrival".
-            time: Time parameter for the data request.
+            lanCode: The language code, e.g. "ar".
 
         Returns:
-            Retrieved flight data.
+            True when the language changed.
         """
 
-        data      = None
-        response  = None
-
-        startTime, endTime = self.__get_start_and_end__() #indicate start & end time limit to search for flights
-
-        payload = {
-            "limit": self.FLIGHTS_DATA_LIMIT,
-            "startTime": startTime,
-            "endTime": endTime
-        }
-
-        payload = json.dumps(payload)
-
-
+        if not self.strings.use(lanCode):
+            return False
+        self.lanCode = lanCode
+
+        for type, store in (("depart", self.departure_store), ("arrival", self.arrival_store)):
+            with self.metrics.time("stage_seconds", stage="summarize", board=type):
+                flights_data = store.summaries(store.top_airlines(self.TOP_AIRLINES))
+                self.__attach_delays__(type, flights_data)
+                if type == "depart":
+                    self.departure_flights_keys, self.departure_flights_data = list(flights_data), flights_data
+                else:
+                    self.arrival_flights_keys, self.arrival_flights_data = list(flights_data), flights_data
+                board              = self.snapshot[type]
+                board["airlines"]  = list(flights_data.values())
+                board["breakdown"] = self.breakdowns[type].snapshot()
+                self.__publish__(type)
+        self.metrics.inc("language_switches_total", language=lanCode)
+
+        return True
+
+    async def __watch_language__(self, interval=0.2):
+        """Switches to the language the GUI asks for on the channel, every interval seconds until stop_event is set."""
+
+        while not self.stop_event.is_set():
+            lanCode = self.channel.requested_language()
+            if lanCode is not None:
+                try:
+                    self.set_language(lanCode)
+                except Exception as e:
+                    self.metrics.error("summarize", e)
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def __run__(self):
+        """Polls every board concurrently over one pooled client until stop_event is set."""
+
+        self.stop_event = asyncio.Event()
+        watcher         = asyncio.create_task(self.__watch_language__()) if self.channel is not None else None
         try:
-            if(type == "depart"):
-                response = self.SESSION.post(url=self.DEPARTURES_DATA + time, data=payload)
-            else:
-                response = self.SESSION.post(url=self.ARRIVAL_DATA + time, data=payload)
-        except Exception as e:
-            print("Error -> " + e) 
-        data = response.json()
-
-        return data
-    
-    def __get_Departures__(self):
-        """Continuously retrieves and analyzes departure flight data."""
-
-        data = self.__get_flights_by_type__("depart")
-        self.__analyze_flights__(data, "depart")
-        time.sleep(10)
-        self.__get_Departures__()
-    
-    def __get_Arrivals__(self):
-        """Continuously retrieves and analyzes arrival flight data."""
-
-        data = self.__get_flights_by_type__("arrival")
-        self.__analyze_flights__(data, "arrival")
-        time.sleep(10)
-        self.__get_Arrivals__()
+            await self.scheduler.run(self.stop_event)
+        finally:
+            if watcher is not None:
+                self.stop_event.set()
+                await watcher
+            if self.recorder is not None:
+                self.recorder.close()
+            if self.notifier is not None:
+                await self.notifier.close()
 
     def __main_loop__(self):
-        """Starts threads for departure and arrival flight data retrieval."""
+        """Runs the departure and arrival polling on one asyncio event loop."""
 
-        departures_thread = threading.Thread(target=self.__get_Departures__)
-        departures_thread.start()
+        asyncio.run(self.__run__())
 
-        arrivals_thread = threading.Thread(target=self.__get_Arrivals__)
-        arrivals_thread.start()
-
-def getFlightsData(queue, queue2, depBusiestHoursQueue, arrBusiestHoursQueue):
+def getFlightsData(channel_name, top_n=5, fids_url="https://dohahamadairport.com/webservices/fids/", metrics_port=None, metrics_log=None, lanCode="en", adaptive=False):
     """
     Function to start the FlightsManager and retrieve flight data.
 
     Args:
-        queue: A queue for storing departure flight data.
-        queue2: A queue for storing arrival flight data.
-        depBusiestHoursQueue: A queue for storing busiest hours for departures.
-        arrBusiestHoursQueue: A queue for storing busiest hours for arrivals.
+        channel_name: Name of the SnapshotChannel created by the GUI process.
+        top_n: How many airlines are tracked on each board.
+        fids_url: Base URL of the FIDS webservices, a replay server to run on a recording.
+        metrics_port: Port GET /metrics of this process is served on, None serves nothing.
+        metrics_log: JSON lines file polls and errors are logged to, None logs nothing.
+        lanCode: The language names are shown in at start, the GUI can ask for another one on the channel.
+        adaptive: Plan the polls from the timetable instead of polling every 10 s, see poll_planner.PollPlanner.
     """
-     
-    HLF = FlightsManager(queue, queue2, depBusiestHoursQueue, arrBusiestHoursQueue)
-    HLF.__main_loop__()
\ No newline at end of file
+
+    metrics = NULL_METRICS
+    if metrics_port is not None or metrics_log is not None:
+        metrics = Metrics(log=metrics_log)
+    if metrics_port is not None:
+        serve_metrics(metrics, port=metrics_port)
+
+    channel = SnapshotChannel(channel_name)
+    HLF     = FlightsManager(channel, fids_url, top_n=top_n, lanCode=lanCode, metrics=metrics, adaptive=adaptive)
+    HLF.__main_loop__()
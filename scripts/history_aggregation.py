@@ -0,0 +1,270 @@
+import concurrent.futures
+import os
+import sqlite3
+import struct
+
+import numpy as np
+
+from scripts.history_store import airport_day, day_number
+from scripts.models import make_summary, qatar_hour
+
+
+# Serialized partial: first day, number of days, number of airlines, then the int64 arrays in HistoryPartial.ARRAYS order
+PARTIAL_HEADER = struct.Struct("<qqq")
+
+# Days per shard: with one airline per shard, a year of 20 airlines is a few hundred shards
+DAYS_PER_SHARD = 30
+
+
+class HistoryPartial():
+    """
+    Mergeable statistics of some airlines over some airport days.
+
+    Every field is an int64 array indexed by airline id (the position of
+    the airline in the list the aggregation was started with), so partials
+    of different shards add up without a name lookup and travel between
+    processes as a few flat buffers. Merging is exact and order free:
+    counts and histograms add, the latest scheduled flight keeps the
+    larger time then the smaller flight id (the first stored), the most
+    recent movement the larger time then the larger id (the last stored).
+
+    Attributes:
+        first_day: Airport day of row 0 of hours.
+        counts: Scheduled flights per airline.
+        hours: Actual movements per day and hour of day, shape (days, 24).
+        airline_hours: Actual movements per airline and hour of day, shape (airlines, 24).
+        latest: (scheduled time, flight id) of the latest scheduled flight per airline, -1 when none.
+        recent: (actual time, flight id) of the most recent movement per airline, -1 when none.
+    """
+
+    __slots__ = ("first_day", "counts", "hours", "airline_hours", "latest", "recent")
+
+    ARRAYS = ("counts", "hours", "airline_hours", "latest", "recent")
+
+    def __init__(self, first_day, counts, hours, airline_hours, latest, recent) -> None:
+        self.first_day     = first_day
+        self.counts        = counts
+        self.hours         = hours
+        self.airline_hours = airline_hours
+        self.latest        = latest
+        self.recent        = recent
+
+    @classmethod
+    def empty(cls, first_day, days, airlines):
+        """Returns a partial with no flight over days days from first_day, for airlines airlines."""
+
+        return cls(first_day, np.zeros(airlines, dtype=np.int64), np.zeros((days, 24), dtype=np.int64),
+                   np.zeros((airlines, 24), dtype=np.int64), np.full((airlines, 2), -1, dtype=np.int64), np.full((airlines, 2), -1, dtype=np.int64))
+
+    def merge(self, other):
+        """Adds every flight of another partial (same airlines) to this one, returns self."""
+
+        if other.first_day < self.first_day or other.first_day + len(other.hours) > self.first_day + len(self.hours):
+            first     = min(self.first_day, other.first_day)
+            last      = max(self.first_day + len(self.hours), other.first_day + len(other.hours))
+            hours     = np.zeros((last - first, 24), dtype=np.int64)
+            hours[self.first_day - first:self.first_day - first + len(self.hours)] = self.hours
+            self.hours, self.first_day = hours, first
+        offset = other.first_day - self.first_day
+        self.hours[offset:offset + len(other.hours)] += other.hours
+
+        self.counts        += other.counts
+        self.airline_hours += other.airline_hours
+
+        later = (other.latest[:, 0] > self.latest[:, 0]) | ((other.latest[:, 0] == self.latest[:, 0]) & (other.latest[:, 1] < self.latest[:, 1]))
+        self.latest[later] = other.latest[later]
+        later = (other.recent[:, 0] > self.recent[:, 0]) | ((other.recent[:, 0] == self.recent[:, 0]) & (other.recent[:, 1] > self.recent[:, 1]))
+        self.recent[later] = other.recent[later]
+
+        return self
+
+    def to_bytes(self):
+        """Packs the partial, see PARTIAL_HEADER."""
+
+        return PARTIAL_HEADER.pack(self.first_day, len(self.hours), len(self.counts)) + b"".join(getattr(self, name).tobytes() for name in self.ARRAYS)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Unpacks bytes written by to_bytes."""
+
+        first_day, days, airlines = PARTIAL_HEADER.unpack_from(data, 0)
+        values                    = np.frombuffer(bytearray(data[PARTIAL_HEADER.size:]), dtype=np.int64)
+        shapes                    = ((airlines,), (days, 24), (airlines, 24), (airlines, 2), (airlines, 2))
+        arrays                    = []
+        offset                    = 0
+        for shape in shapes:
+            size    = int(np.prod(shape))
+            arrays.append(values[offset:offset + size].reshape(shape))
+            offset += size
+
+        return cls(first_day, *arrays)
+
+    def __reduce__(self):
+        return (HistoryPartial.from_bytes, (self.to_bytes(),))
+
+
+def aggregate_shard(path, type, first_day, days, airline_id, airline, airlines, connection=None):
+    """
+    Computes the partial of one airline over some days, in a pool worker or inline.
+
+    Counts and histograms come from the flights_by_airline index alone;
+    the count and the latest scheduled and actual times come from one
+    scan, then the ids of the flights at those times are read back through
+    the same index, narrowed to the airport day of the latest scheduled
+    time and to the hour of the latest actual time, with the tie rule of
+    HistoryPartial.merge.
+
+    Args:
+        path: The HistoryStore database file.
+        type: Type of flight data, either "depart" or "arrival".
+        first_day: First airport day of the shard.
+        days: Number of days of the shard.
+        airline_id: Id of the airline in the aggregation.
+        airline: The airline name.
+        airlines: Number of airlines of the aggregation.
+        connection: An open connection to read through, a read-only one on path is opened (and closed) when None.
+
+    Returns:
+        The HistoryPartial of the shard.
+    """
+
+    partial = HistoryPartial.empty(first_day, days, airlines)
+    where   = "type = ? AND airline = ? AND day >= ? AND day < ?"
+    params  = (type, airline, first_day, first_day + days)
+    owned   = connection is None
+    if owned:
+        connection = sqlite3.connect("file:%s?mode=ro" % path, uri=True)
+    try:
+        rows = connection.execute("SELECT day, hour, COUNT(*) FROM flights WHERE " + where + " AND hour IS NOT NULL GROUP BY day, hour", params).fetchall()
+        if rows:
+            rows = np.array(rows, dtype=np.int64)
+            partial.hours[rows[:, 0] - first_day, rows[:, 1]] = rows[:, 2]
+            partial.airline_hours[airline_id] = np.bincount(rows[:, 1], weights=rows[:, 2], minlength=24).astype(np.int64)
+
+        count, scheduled, actual = connection.execute(
+            "SELECT COUNT(*), MAX(scheduledTime), MAX(CASE WHEN actualTime > 0 THEN actualTime END) FROM flights WHERE " + where, params).fetchone()
+        latest = recent = None
+        if scheduled is not None:
+            latest = scheduled, connection.execute("SELECT MIN(id) FROM flights WHERE type = ? AND airline = ? AND day = ? AND scheduledTime = ?",
+                                                   (type, airline, airport_day(scheduled), scheduled)).fetchone()[0]
+        if actual is not None:
+            recent = actual, connection.execute("SELECT MAX(id) FROM flights WHERE " + where + " AND hour = ? AND actualTime = ?",
+                                                params + (qatar_hour(actual), actual)).fetchone()[0]
+    finally:
+        if owned:
+            connection.close()
+
+    partial.counts[airline_id] = count
+    if latest is not None:
+        partial.latest[airline_id] = latest
+    if recent is not None:
+        partial.recent[airline_id] = recent
+
+    return partial
+
+
+class ShardedAggregator():
+    """
+    Per-airline and per-hour statistics of a HistoryStore over long day ranges, across processes.
+
+    A range is cut into shards of one airline over DAYS_PER_SHARD days,
+    run by a ProcessPoolExecutor whose workers each read the database on
+    their own read-only connection and return a HistoryPartial; the parent
+    merges partials as they complete. The partials merge exactly, so the
+    result is the same whatever the number of workers, shards or the order
+    they finish in; workers=1 runs the same shards inline, in process.
+
+    Attributes:
+        history: The HistoryStore read; inline shards go through its connection, so ":memory:" is read inline only.
+        workers: Worker processes, defaults to the number of CPUs.
+        days_per_shard: Days of one shard.
+        executor: The ProcessPoolExecutor, started on first use, None inline.
+    """
+
+    def __init__(self, history, workers=None, days_per_shard=DAYS_PER_SHARD) -> None:
+        """
+        Initializes a ShardedAggregator instance.
+
+        Args:
+            history: The HistoryStore read.
+            workers: Worker processes, defaults to the number of CPUs, 1 runs inline.
+            days_per_shard: Days of one shard.
+        """
+
+        self.history        = history
+        self.workers        = workers or os.cpu_count() or 1
+        self.days_per_shard = days_per_shard
+        self.executor       = None
+
+        if history.path == ":memory:":
+            self.workers = 1
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def shards(self, type, start, end, airlines):
+        """Returns the aggregate_shard arguments of a day range, one airline over days_per_shard days each."""
+
+        first, last = day_number(start), day_number(end)
+
+        return [(self.history.path, type, day, min(self.days_per_shard, last - day), airline_id, airline, len(airlines))
+                for day in range(first, last, self.days_per_shard) for airline_id, airline in enumerate(airlines)]
+
+    def aggregate(self, type, start, end):
+        """
+        Aggregates a day range.
+
+        Args:
+            type: Type of flight data, either "depart" or "arrival".
+            start: First day, a datetime.date.
+            end: Day after the last one, a datetime.date.
+
+        Returns:
+            An (airlines, partial) tuple: the airline names in id order
+            (alphabetical) and the merged HistoryPartial of the range.
+        """
+
+        airlines = self.history.airlines(type, start, end)
+        result   = HistoryPartial.empty(day_number(start), max(day_number(end) - day_number(start), 0), len(airlines))
+        shards   = self.shards(type, start, end, airlines)
+
+        if self.workers == 1:
+            for shard in shards:
+                result.merge(aggregate_shard(*shard, connection=self.history.connection))
+        else:
+            if self.executor is None:
+                self.executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+            for future in concurrent.futures.as_completed([self.executor.submit(aggregate_shard, *shard) for shard in shards]):
+                result.merge(future.result())
+
+        return airlines, result
+
+    def summaries(self, airlines, partial, top_n=5):
+        """
+        Builds the summaries of the busiest airlines of an aggregate, like FlightStateStore.summaries does for one board.
+
+        Args:
+            airlines: The airline names of the aggregate.
+            partial: The merged HistoryPartial.
+            top_n: How many airlines to keep, busiest first.
+
+        Returns:
+            A dict mapping each top airline to its AirlineSummary, busiest
+            first, ties in alphabetical order.
+        """
+
+        top     = [airline_id for airline_id in np.argsort(-partial.counts, kind="stable")[:top_n].tolist() if partial.counts[airline_id]]
+        flights = self.history.flights_by_id([int(partial.latest[airline_id, 1]) for airline_id in top] +
+                                             [int(partial.recent[airline_id, 1]) for airline_id in top if partial.recent[airline_id, 1] >= 0])
+
+        return {airlines[airline_id]: make_summary(airlines[airline_id], partial.counts[airline_id], flights[int(partial.latest[airline_id, 1])],
+                                                   flights.get(int(partial.recent[airline_id, 1])))
+                for airline_id in top}
@@ -0,0 +1,332 @@
+import datetime
+import sqlite3
+import time
+
+import numpy as np
+
+from scripts.models import QATAR_UTC_OFFSET, Flight
+
+
+EPOCH = datetime.date(1970, 1, 1)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS flights (
+    id            INTEGER PRIMARY KEY,
+    type          TEXT    NOT NULL,
+    flightNumber  TEXT    NOT NULL,
+    scheduledTime INTEGER NOT NULL,
+    day           INTEGER NOT NULL,
+    airline       TEXT    NOT NULL,
+    country       TEXT    NOT NULL,
+    status        TEXT    NOT NULL,
+    actualTime    INTEGER NOT NULL,
+    hour          INTEGER,
+    UNIQUE (type, flightNumber, scheduledTime)
+);
+CREATE INDEX IF NOT EXISTS flights_by_day ON flights (type, day, hour);
+CREATE INDEX IF NOT EXISTS flights_by_airline ON flights (type, airline, day, hour);
+CREATE TABLE IF NOT EXISTS events (
+    flight     INTEGER NOT NULL REFERENCES flights (id),
+    status     TEXT    NOT NULL,
+    actualTime INTEGER NOT NULL,
+    recordedAt INTEGER NOT NULL,
+    UNIQUE (flight, status, actualTime)
+);
+CREATE TABLE IF NOT EXISTS delay_sketches (
+    type   TEXT    NOT NULL,
+    day    INTEGER NOT NULL,
+    kind   TEXT    NOT NULL,
+    name   TEXT    NOT NULL,
+    sketch BLOB    NOT NULL,
+    PRIMARY KEY (type, kind, day, name)
+);
+CREATE TABLE IF NOT EXISTS backfill_windows (
+    type      TEXT    NOT NULL,
+    startTime INTEGER NOT NULL,
+    endTime   INTEGER NOT NULL,
+    flights   INTEGER NOT NULL,
+    fetchedAt INTEGER NOT NULL,
+    PRIMARY KEY (type, startTime, endTime)
+);
+"""
+
+
+def airport_day(timestamp):
+    """Returns the airport day (days since 1970-01-01 in Asia/Qatar) of a UNIX timestamp."""
+
+    return (int(timestamp) + QATAR_UTC_OFFSET) // 86400
+
+
+def day_number(date):
+    """Returns the airport day of a datetime.date."""
+
+    return (date - EPOCH).days
+
+
+class HistoryStore():
+    """
+    Persistent flight history in SQLite, partitioned by airport day.
+
+    One row per flight holds its latest state and is keyed by the flight
+    key; the day (of the scheduled time, Asia/Qatar) and the hour of the
+    actual movement are stored with it and lead every index, so range
+    queries read only the days they cover. Status changes are appended to
+    an events log deduplicated on (flight, status, actual time): a poll
+    that moved nothing writes nothing. Daily delay sketches (see
+    delay_sketch.DelayBook) are kept beside, one row per day and group,
+    and so are the time windows a backfill already stored (see backfill.py).
+
+    Attributes:
+        path: The database file, ":memory:" for a throwaway store.
+        connection: The sqlite3 connection.
+    """
+
+    def __init__(self, path) -> None:
+        """
+        Opens (or creates) a HistoryStore.
+
+        Args:
+            path: The database file, ":memory:" for a throwaway store.
+        """
+
+        self.path       = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def record(self, type, flights, recorded_at=None):
+        """
+        Upserts flights and appends their status changes, in one transaction.
+
+        Pass only what moved (the inserted and changed flights of a state
+        store Delta); unchanged flights would be deduplicated anyway.
+
+        Args:
+            type: Type of flight data, either "depart" or "arrival".
+            flights: Flight objects, see models.Flight.
+            recorded_at: UNIX time of the poll, defaults to now.
+
+        Returns:
+            Number of new events appended.
+        """
+
+        with self.connection:
+            return self.__upsert__(type, flights, recorded_at)
+
+    def __upsert__(self, type, flights, recorded_at):
+        """Upserts flights and appends their status changes, inside the caller's transaction."""
+
+        # Key names: the history does not depend on the language names are shown in
+        recorded_at = int(recorded_at if recorded_at is not None else time.time())
+        rows        = [(type, flight.flightNumber, flight.scheduledTime, airport_day(flight.scheduledTime), flight.airline_key,
+                        flight.country_key, flight.status_key, flight.actualTime,
+                        (flight.actualTime + QATAR_UTC_OFFSET) // 3600 % 24 if flight.actualTime else None) for flight in flights]
+
+        self.connection.executemany("""
+            INSERT INTO flights (type, flightNumber, scheduledTime, day, airline, country, status, actualTime, hour)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (type, flightNumber, scheduledTime) DO UPDATE SET
+                airline = excluded.airline, country = excluded.country, status = excluded.status,
+                actualTime = excluded.actualTime, hour = excluded.hour""", rows)
+        before = self.connection.total_changes
+        self.connection.executemany("""
+            INSERT OR IGNORE INTO events SELECT id, ?, ?, ? FROM flights
+            WHERE type = ? AND flightNumber = ? AND scheduledTime = ?""",
+            [(row[6], row[7], recorded_at, type, row[1], row[2]) for row in rows])
+
+        return self.connection.total_changes - before
+
+    def record_window(self, type, start, end, flights, count=None, recorded_at=None):
+        """
+        Records the flights of a backfilled time window and marks the window stored, in one transaction.
+
+        A window whose flights were stored through smaller windows (it hit
+        the request limit and was split) is marked with no flights and the
+        count of its parts, see backfill.Backfill.
+
+        Args:
+            type: Type of flight data, either "depart" or "arrival".
+            start: Window start, UNIX seconds.
+            end: Window end (excluded), UNIX seconds.
+            flights: Flight objects scheduled in the window.
+            count: Flights of the window when they were stored apart, defaults to len(flights).
+            recorded_at: UNIX time of the fetch, defaults to now.
+        """
+
+        recorded_at = int(recorded_at if recorded_at is not None else time.time())
+        with self.connection:
+            if flights:
+                self.__upsert__(type, flights, recorded_at)
+            self.connection.execute("INSERT OR REPLACE INTO backfill_windows (type, startTime, endTime, flights, fetchedAt) VALUES (?, ?, ?, ?, ?)",
+                                    (type, int(start), int(end), len(flights) if count is None else count, recorded_at))
+
+    def stored_windows(self, type):
+        """Returns the number of flights of every backfill window already stored for a board type, by (start, end)."""
+
+        return {(start, end): flights for start, end, flights in
+                self.connection.execute("SELECT startTime, endTime, flights FROM backfill_windows WHERE type = ?", (type,))}
+
+    def delays(self, type, day):
+        """Returns (airline, country, actual - scheduled) of the flights of a day that moved, to rebuild its delay sketches."""
+
+        return self.connection.execute("""
+            SELECT airline, country, actualTime - scheduledTime FROM flights
+            WHERE type = ? AND day = ? AND actualTime > 0""", (type, day)).fetchall()
+
+    def unsketched_days(self, type, days):
+        """Returns the days among days with flights that moved but no delay sketch saved, e.g. left by an interrupted backfill."""
+
+        if not days:
+            return set()
+
+        return {day for day, in self.connection.execute("""
+            SELECT DISTINCT day FROM flights AS f
+            WHERE type = ? AND day >= ? AND day <= ? AND actualTime > 0 AND NOT EXISTS (
+                SELECT 1 FROM delay_sketches AS s WHERE s.type = f.type AND s.kind = 'all' AND s.day = f.day AND s.name = '')""",
+            (type, min(days), max(days))) if day in days}
+
+    def __where__(self, type, start, end, airline):
+        """Builds the WHERE clause of a [start, end) day range, optionally one airline."""
+
+        clause = "type = ? AND day >= ? AND day < ?"
+        params = [type, day_number(start), day_number(end)]
+        if airline is not None:
+            clause += " AND airline = ?"
+            params.append(airline)
+
+        return clause, params
+
+    def hourly(self, type, start, end, airline=None):
+        """
+        Counts actual movements per airport day and hour.
+
+        Args:
+            type: Type of flight data, either "depart" or "arrival".
+            start: First day, a datetime.date.
+            end: Day after the last one, a datetime.date.
+            airline: Restrict to one airline, None counts them all.
+
+        Returns:
+            An int array of shape (days, 24), row 0 is start.
+        """
+
+        clause, params = self.__where__(type, start, end, airline)
+        counts         = np.zeros((max(day_number(end) - day_number(start), 0), 24), dtype=np.int64)
+        rows           = self.connection.execute(
+            "SELECT day, hour, COUNT(*) FROM flights WHERE " + clause + " AND hour IS NOT NULL GROUP BY day, hour", params).fetchall()
+        if rows:
+            rows = np.array(rows, dtype=np.int64)
+            counts[rows[:, 0] - day_number(start), rows[:, 1]] = rows[:, 2]
+
+        return counts
+
+    def daily_airlines(self, type, start, end):
+        """
+        Counts scheduled flights per airline over a day range.
+
+        Args:
+            type: Type of flight data, either "depart" or "arrival".
+            start: First day, a datetime.date.
+            end: Day after the last one, a datetime.date.
+
+        Returns:
+            A list of (airline, flights) pairs, busiest first.
+        """
+
+        clause, params = self.__where__(type, start, end, None)
+
+        return self.connection.execute(
+            "SELECT airline, COUNT(*) AS flights FROM flights WHERE " + clause + " GROUP BY airline ORDER BY flights DESC, airline", params).fetchall()
+
+    def airlines(self, type, start, end):
+        """Returns the names of the airlines with flights over a [start, end) day range, in alphabetical order."""
+
+        clause, params = self.__where__(type, start, end, None)
+
+        return [airline for airline, in self.connection.execute("SELECT DISTINCT airline FROM flights WHERE " + clause + " ORDER BY airline", params)]
+
+    def flights_by_id(self, ids):
+        """Returns the Flight of each stored flight id, by id."""
+
+        ids = list(ids)
+
+        return {row[0]: Flight(*row[1:]) for start in range(0, len(ids), 500) for row in self.connection.execute(
+                "SELECT id, flightNumber, scheduledTime, actualTime, airline, status, country FROM flights WHERE id IN (%s)" %
+                ", ".join("?" * len(ids[start:start + 500])), ids[start:start + 500])}
+
+    def timeline(self, type, flightNumber, scheduledTime):
+        """
+        Returns the recorded status changes of one flight, oldest first.
+
+        Args:
+            type: Type of flight data, either "depart" or "arrival".
+            flightNumber: The flight number.
+            scheduledTime: Its scheduled time, UNIX seconds.
+
+        Returns:
+            A list of (status, actual time or 0, recorded at) tuples.
+        """
+
+        return self.connection.execute("""
+            SELECT events.status, events.actualTime, events.recordedAt FROM events JOIN flights ON flights.id = events.flight
+            WHERE flights.type = ? AND flights.flightNumber = ? AND flights.scheduledTime = ?
+            ORDER BY events.recordedAt, events.rowid""", (type, flightNumber, int(scheduledTime))).fetchall()
+
+    def save_sketches(self, type, rows):
+        """
+        Upserts daily delay sketches.
+
+        Args:
+            type: Type of flight data, either "depart" or "arrival".
+            rows: (day, kind, name, sketch bytes) tuples, see DelayBook.take_dirty.
+        """
+
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO delay_sketches (type, day, kind, name, sketch) VALUES (?, ?, ?, ?, ?)",
+                                        [(type, day, kind, name, sketch) for day, kind, name, sketch in rows])
+
+    def sketches(self, type, start, end, kind):
+        """
+        Merges the daily delay sketches of a day range, e.g. a week or a month.
+
+        Args:
+            type: Type of flight data, either "depart" or "arrival".
+            start: First day, a datetime.date.
+            end: Day after the last one, a datetime.date.
+            kind: "airline", "country" or "all".
+
+        Returns:
+            A dict mapping each name to its merged DelaySketch.
+        """
+
+        from scripts.delay_sketch import DelaySketch
+
+        merged = dict()
+        for name, sketch in self.connection.execute(
+                "SELECT name, sketch FROM delay_sketches WHERE type = ? AND kind = ? AND day >= ? AND day < ?",
+                (type, kind, day_number(start), day_number(end))):
+            sketch = DelaySketch.from_bytes(sketch)
+            if name in merged:
+                merged[name].merge(sketch)
+            else:
+                merged[name] = sketch
+
+        return merged
+
+    def drop_before(self, date):
+        """
+        Deletes every day before date, for retention.
+
+        Args:
+            date: First day to keep, a datetime.date.
+        """
+
+        with self.connection:
+            self.connection.execute("DELETE FROM events WHERE flight IN (SELECT id FROM flights WHERE day < ?)", (day_number(date),))
+            self.connection.execute("DELETE FROM flights WHERE day < ?", (day_number(date),))
+            self.connection.execute("DELETE FROM delay_sketches WHERE day < ?", (day_number(date),))
+            self.connection.execute("DELETE FROM backfill_windows WHERE startTime < ?", (day_number(date) * 86400 - QATAR_UTC_OFFSET,))
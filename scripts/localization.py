@@ -0,0 +1,113 @@
+import sys
+
+
+# Language names are keyed by: every record carries it, and history, delay sketches, breakdown ids and watch rules use its names
+KEY_LANGUAGE = "en"
+
+
+def key_names(langs):
+    """Returns the fields of a record's "lang" that names are keyed by: its KEY_LANGUAGE ones, else those of its first language."""
+
+    return langs.get(KEY_LANGUAGE) or next(iter(langs.values()))
+
+
+class LocalizedStrings():
+    """
+    Intern table of the localized airline, status and country names.
+
+    Each distinct name gets one id, keyed by its KEY_LANGUAGE text, and
+    the table keeps its text in every language a record carried: once for
+    the whole process, whatever the number of flights and boards. Flights
+    hold ids only; reading a name is a lookup in the list of the current
+    language, so switching language swaps that list and touches neither
+    the flights nor anything keyed by them.
+
+    Attributes:
+        ids: Id by key name.
+        keys: Key name by id, texts[KEY_LANGUAGE].
+        texts: Text by id per language, None where a language never carried that name.
+        language: The current language.
+        current: texts[language], the lookup table names are read from.
+    """
+
+    def __init__(self, language=KEY_LANGUAGE) -> None:
+        self.ids      = dict()
+        self.keys     = []
+        self.texts    = {KEY_LANGUAGE: self.keys}
+        self.language = KEY_LANGUAGE
+        self.current  = self.keys
+        self.use(language)
+
+    def intern(self, key):
+        """Returns the id of a key name, adding it when new."""
+
+        index = self.ids.get(key)
+        if index is None:
+            key   = sys.intern(key)
+            index = self.ids[key] = len(self.keys)
+            for texts in self.texts.values():
+                texts.append(None)
+            self.keys[index] = key
+
+        return index
+
+    def intern_record(self, langs, field):
+        """
+        Returns the id of one name of a webservice record, recording its text in every language of the record.
+
+        Args:
+            langs: The "lang" dict of the record, language code to fields.
+            field: The field read in each language, e.g. "airlineName".
+        """
+
+        key   = key_names(langs)
+        index = self.intern(key.get(field) or "")
+        for language, fields in langs.items():
+            if language == KEY_LANGUAGE:
+                continue
+            texts = self.texts.get(language)
+            if texts is None:
+                texts = self.texts[language] = [None] * len(self.keys)
+            text = fields.get(field)
+            if text and texts[index] != text:
+                texts[index] = sys.intern(text)
+
+        return index
+
+    def name(self, index):
+        """Returns the name of an id in the current language, its key name when that language has none."""
+
+        return self.current[index] or self.keys[index]
+
+    def translate(self, key):
+        """Returns a key name in the current language, unchanged when it is not in the table."""
+
+        index = self.ids.get(key)
+
+        return key if index is None else self.name(index)
+
+    def use(self, language):
+        """
+        Switches the current language.
+
+        Returns:
+            True when the language changed.
+        """
+
+        texts = self.texts.get(language)
+        if texts is None:
+            texts = self.texts[language] = [None] * len(self.keys)
+        changed       = language != self.language
+        self.language = language
+        self.current  = texts
+
+        return changed
+
+    def languages(self):
+        """Returns the languages some name has a text in, the key language first."""
+
+        return [KEY_LANGUAGE] + sorted(language for language, texts in self.texts.items() if language != KEY_LANGUAGE and any(texts))
+
+
+# The table of the process: every Flight reads its names from it
+STRINGS = LocalizedStrings()
@@ -1,222 +1,536 @@
-import numpy as np
-import matplotlib.pyplot as plt
+import time
+from collections import OrderedDict
+from functools import lru_cache
 
-from datetime import datetime
+import numpy as np
 import mplcursors
+import pytz
+from datetime import datetime
+from matplotlib.widgets import RadioButtons, RangeSlider
+
+from scripts.breakdown import Breakdown
+from scripts.metrics import NULL_METRICS
+from scripts.rolling import ROLLING_WINDOWS, moving_average
 
 
 
+# Tick labels of the hours of day, index 0 is the hour after midnight
 dayHours = [
-    "1AM", "2AM", "3AM", "4AM", "5AM", "6AM", "7AM", "8AM",
-    "9AM", "10AM", "11AM", "12PM", "1PM", "2PM", "3PM",
-    "4:00PM", "5:00PM", "6:00PM", "7:00PM", "8PM", "9PM", "10PM",
-    "11PM", "12PM"
+    "12AM", "1AM", "2AM", "3AM", "4AM", "5AM", "6AM", "7AM",
+    "8AM", "9AM", "10AM", "11AM", "12PM", "1PM", "2PM", "3PM",
+    "4PM", "5PM", "6PM", "7PM", "8PM", "9PM", "10PM", "11PM"
 ]
 
-def update_depart_plot(frame, fig, ax, queue):
-    """Update the departure plot with new data.
-
-    Args:
-        frame: Frame number (not used).
-        fig: The figure.
-        ax: The axis for the departure plot.
-        queue: Queue containing new data.
-    """
-    new_data = queue.get()  # Wait for new data
-
-    if new_data:
-        airlines = list(new_data.keys())
-        labels = []
-        sizes = np.random.uniform(50, 100, len(airlines))
-        colors = np.random.uniform(1, 255, len(airlines))
-        FlightsCountered = []
-
-
-        for airline in airlines:
-            if airline == "busiestHours":
-                continue
-            FlightsCountered.append(int(new_data[airline]["flightsCountered"]))
-
-        ax.clear()
-        scatter = ax.scatter(airlines, FlightsCountered, marker='2', s=sizes, c='red', vmin=0, vmax=100)
-
-        for label in airlines:
-            if label == "busiestHours":
-                continue
-            details = ["Last Flight For Today", "Scheduled Time", "Flights Countered"]  # Order must meet the detailsValues
-            detailsValues = []
-            # detailsValues.append(new_data[label]["lang"]["en"]["airlineName"])
-            detailsValues.append(new_data[label]["flightNumber"])
-
-            # Beginning of flight Scheduled Time
-            datetime_obj = datetime.fromtimestamp(int(new_data[label]["scheduledTime"]))
-            formatted_date_time = datetime_obj.strftime("%I:%M %p")
-            detailsValues.append(formatted_date_time)
-            # End of flight Scheduled Time
-
-            detailsValues.append(new_data[label]["flightsCountered"])
-
-            description = ""
-            for index, d in enumerate(details):
-                description = description + (d + " : " + str(detailsValues[index]) + "\n")
-
-            description = description + (" -------Most Recent Departure-------" + "\n")
-
-            if(new_data[label]["recentDep"]):
-                details = ["Flight Number", "Scheduled Time", "Actual Time Of Departure", "Flight Status",
-                        "Destination Country"]  # Order must meet the detailsValues
-                detailsValues = []
-
-                detailsValues.append(new_data[label]["recentDep"]["flightNumber"])
-                
-
-                # Beginning of recent flight Scheduled Time
-                datetime_obj = datetime.fromtimestamp(int(new_data[label]["recentDep"]["scheduledTime"]))
-                formatted_date_time = datetime_obj.strftime("%I:%M %p")
-                detailsValues.append(formatted_date_time)
-                # End of recent flight Scheduled Time
-
-                # Beginning of Actual Time Of Departure
-                try:
-                    datetime_obj = datetime.fromtimestamp(int(new_data[label]["recentDep"]["actualTimeOfDep"]))
-                    formatted_date_time = datetime_obj.strftime("%I:%M %p")
-                    detailsValues.append(formatted_date_time)
-                except:
-                    detailsValues.append("N/A")
-                # End of Actual Time Of Departure
-
-                detailsValues.append(new_data[label]["recentDep"]["lang"]["en"]["flightStatus"])
-                detailsValues.append(new_data[label]["recentDep"]["lang"]["en"]["destinationCountry"])
-
-                for index, d in enumerate(details):
-                    description = description + (d + " : " + str(detailsValues[index]) + "\n")
-
-            else:
-                description = description + (" No recent depature for today." + "\n")
-            labels.append(description)
+QATAR = pytz.timezone('Asia/Qatar')
 
-        mplcursors.cursor(scatter, hover=True).connect("add", lambda sel: sel.annotation.set_text(labels[sel.target.index]))
-        ax.set(xlabel="Today(Top 5 Airlines Departure - Hover over shape for details)", ylabel="Flights Countered",
-               title="Departures Today (" + datetime.today().strftime('%Y-%m-%d %H:%M:%S') + ") (updates every 10s)")
+@lru_cache(maxsize=2048)
+def minute_label(minute):
+    """Format a minute (UNIX seconds // 60) as "%I:%M %p" in Asia/Qatar, memoized."""
+    return datetime.fromtimestamp(minute * 60, QATAR).strftime("%I:%M %p")
 
-        plt.xticks(fontsize=10)
-        ax.set_title("Departures Today (" + datetime.today().strftime('%Y-%m-%d %H:%M:%S') + ") (updates every 10s)")
-        fig.canvas.draw()
+def local_time(ts):
+    """Format a UNIX timestamp as "%I:%M %p" in Asia/Qatar; every second of a minute shares one cache entry."""
+    return minute_label(int(ts) // 60)
 
-def update_arriv_plot(frame, fig, ax, queue):
-    """Update the arrival plot with new data.
+def describe_airline(summary, type):
+    """Build the hover text of one airline.
 
     Args:
-        frame: Frame number (not used).
-        fig: The figure.
-        ax: The axis for the arrival plot.
-        queue: Queue containing new data.
-    """
-    new_data = queue.get()  # Wait for new data
-
-    if new_data:
-        airlines = list(new_data.keys())
-        labels = []
-        sizes = np.random.uniform(50, 100, len(airlines))
-        FlightsCountered = []
+        summary: AirlineSummary from the snapshot.
+        type: Type of flight data, either "depart" or "arrival".
 
-        for airline in airlines:
-            if airline == "busiestHours":
-                continue
-            FlightsCountered.append(new_data[airline]["flightsCountered"])
-
-        ax.clear()
+    Returns:
+        The tooltip text.
+    """
+    lines = [
+        "Last Flight For Today : " + str(summary.flightNumber),
+        "Scheduled Time : " + local_time(summary.scheduledTime),
+        "Flights Countered : " + str(summary.flightsCountered),
+    ]
+
+    if type == "depart":
+        lines.append(" -------Most Recent Departure-------")
+        details = ["Flight Number", "Scheduled Time", "Actual Time Of Departure", "Flight Status", "Destination Country"]
+    else:
+        lines.append(" -------Most Recent Arrival-------")
+        details = ["Flight Number", "Scheduled Time", "Actual Time Of Arrival", "Flight Status", "Origin Country"]
+
+    recent = summary.recent
+    if recent:
+        detailsValues = [recent.flightNumber, local_time(recent.scheduledTime), local_time(recent.actualTime), recent.status, recent.country]
+        lines += [d + " : " + str(value) for d, value in zip(details, detailsValues)]
+    elif type == "depart":
+        lines.append(" No recent depature for today.")
+    else:
+        lines.append("No recent arrival for today.")
+
+    delays = summary.delays
+    if delays:
+        lines += [
+            " -------Delays Today (%d flights)-------" % delays["count"],
+            "On Time : %.0f%%" % delays["on_time"],
+            "Mean Delay : %+.0f min" % delays["mean"],
+            "p50 / p90 / p99 : %+.0f / %+.0f / %+.0f min" % (delays["p50"], delays["p90"], delays["p99"]),
+        ]
+
+    return "\n".join(lines) + "\n"
+
+def tooltip_key(summary):
+    """Everything the hover text of a summary depends on: its latest flight, its count, the key, status and actual time of its recent flight and its delay stats."""
+    recent = summary.recent
+    delays = summary.delays
+    return (summary.airline, summary.flightNumber, summary.scheduledTime, summary.flightsCountered,
+            None if recent is None else (recent.flightNumber, recent.scheduledTime, recent.status, recent.actualTime),
+            None if delays is None else tuple(delays.values()))
+
+class TooltipCache():
+    """LRU cache of hover texts, filled when mplcursors asks for one.
+
+    Frames never build tooltips: a panel keeps the summaries it shows and
+    only the hovered one is described, once per tooltip_key. An airline
+    whose flights did not move keeps its entry across polls.
+
+    Attributes:
+        type: Type of flight data, either "depart" or "arrival".
+        maxsize: Number of texts kept.
+        entries: Texts by tooltip_key, least recently used first.
+        hits: Number of lookups served from the cache.
+        misses: Number of texts built.
+    """
 
-        scatter = ax.scatter(airlines, FlightsCountered, marker='2', s=sizes, c='blue')
+    def __init__(self, type, maxsize=256) -> None:
+        self.type    = type
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits    = 0
+        self.misses  = 0
+
+    def get(self, summary):
+        """Return the hover text of a summary, building it on a miss."""
+        key  = tooltip_key(summary)
+        text = self.entries.get(key)
+        if text is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return text
+
+        self.misses      += 1
+        text              = describe_airline(summary, self.type)
+        self.entries[key] = text
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return text
+
+class BlitManager():
+    """Redraw only the axes whose artists changed.
+
+    Every artist handed to the manager is animated: a full draw leaves them
+    out, the manager keeps a background per axes and paints its artists on
+    top. Updating an axes restores that background, draws its artists and
+    blits the axes rectangle alone. Anything that changes the static part of
+    an axes (limits, ticks) has to go through full_redraw().
+
+    Attributes:
+        canvas: The figure canvas.
+        artists: Animated artists per axes.
+        backgrounds: Background pixels per axes, captured after each full draw.
+        full_draws: Number of full figure draws so far.
+    """
 
+    def __init__(self, canvas) -> None:
+        self.canvas      = canvas
+        self.artists     = dict()
+        self.backgrounds = dict()
+        self.full_draws  = 0
+        canvas.mpl_connect("draw_event", self.__on_draw__)
+
+    def add(self, ax, *artists):
+        """Register animated artists of one axes."""
+        for artist in artists:
+            artist.set_animated(True)
+        self.artists.setdefault(ax, []).extend(artists)
+
+    def __on_draw__(self, event):
+        """Capture the fresh backgrounds after a full draw and paint the artists back."""
+        self.full_draws += 1
+        for ax, artists in self.artists.items():
+            self.backgrounds[ax] = self.canvas.copy_from_bbox(ax.bbox)
+            for artist in artists:
+                ax.draw_artist(artist)
+
+    def full_redraw(self):
+        """Draw the whole figure, for changes the backgrounds do not cover."""
+        self.canvas.draw()
+
+    def update(self, axes):
+        """Repaint and blit only the given axes."""
+        for ax in axes:
+            background = self.backgrounds.get(ax)
+            if background is None:
+                self.full_redraw()
+                return
+            self.canvas.restore_region(background)
+            for artist in self.artists[ax]:
+                ax.draw_artist(artist)
+            self.canvas.blit(ax.bbox)
+        self.canvas.flush_events()
+
+class AirlinesPanel():
+    """Persistent artists of the departures or arrivals panel.
+
+    The scatter, the airline name texts and the "updated at" text are
+    created once; a new board only moves them, and only the name texts
+    whose airline or count changed are touched. Airline names are texts
+    inside the axes instead of tick labels so they can be blitted. One
+    mplcursors cursor lives for the whole run and describes the hovered
+    airline through the tooltip cache, so frames do no string work.
+
+    Attributes:
+        ax: The axis of the panel.
+        type: Type of flight data, either "depart" or "arrival".
+        scatter: The airlines scatter.
+        names: One text per airline slot.
+        shown: (airline, count) drawn in each name slot, None when hidden.
+        stamp: The "updated at" text.
+        airlines: Summaries currently drawn, busiest first.
+        tooltips: TooltipCache of the panel.
+        version: Board version last drawn.
+    """
 
-        for label in airlines:
-            if label == "busiestHours":
+    def __init__(self, ax, type, color, top_n=5) -> None:
+        self.ax       = ax
+        self.type     = type
+        self.airlines = []
+        self.tooltips = TooltipCache(type, maxsize=max(256, top_n * 8))
+        self.version  = 0
+
+        direction = "Departure" if type == "depart" else "Arrival"
+        ax.set(xlim=[-0.5, top_n - 0.5], ylim=[0, 10], xticks=[],
+               xlabel="Today(Top " + str(top_n) + " Airlines " + direction + " - Hover over shape for details)", ylabel="Flights Countered",
+               title=("Departures" if type == "depart" else "Arrivals") + " Today (updates every 10s)")
+
+        # Past a dozen airlines horizontal names overlap, stand them up
+        crowded      = top_n > 12
+        self.scatter = ax.scatter(np.zeros(0), np.zeros(0), marker='2', s=75, c=color)
+        self.names   = [ax.text(0, 0, "", ha="center", va="bottom", fontsize=6 if crowded else 9, rotation=90 if crowded else 0, visible=False)
+                        for _ in range(top_n)]
+        self.shown   = [None] * top_n
+        self.stamp   = ax.text(0.99, 0.97, "", ha="right", va="top", fontsize=8, transform=ax.transAxes)
+
+        mplcursors.cursor(self.scatter, hover=True).connect("add", self.__on_hover__)
+
+    def artists(self):
+        return [self.scatter, self.stamp] + self.names
+
+    def __on_hover__(self, sel):
+        if sel.index < len(self.airlines):
+            sel.annotation.set_text(self.tooltips.get(self.airlines[sel.index]))
+
+    def update(self, board):
+        """Move the artists to a new board.
+
+        Args:
+            board: The board of this panel from the snapshot.
+
+        Returns:
+            None when the board did not change, else True when the y limits
+            changed (the panel then needs a full redraw), False otherwise.
+        """
+        if board["version"] == self.version:
+            return None
+        self.version = board["version"]
+
+        self.airlines = board["airlines"][:len(self.names)]
+        counts        = np.array([summary.flightsCountered for summary in self.airlines], dtype=float)
+        self.scatter.set_offsets(np.column_stack((np.arange(len(counts)), counts)))
+
+        for index, text in enumerate(self.names):
+            shown = (self.airlines[index].airline, counts[index]) if index < len(self.airlines) else None
+            if shown == self.shown[index]:
                 continue
-            details = ["Last Flight For Today", "Scheduled Time", "Flights Countered"]  # Order must meet the detailsValues
-            detailsValues = []
-            detailsValues.append(new_data[label]["flightNumber"])
-
-            # Beginning of flight Scheduled Time
-            datetime_obj = datetime.fromtimestamp(int(new_data[label]["scheduledTime"]))
-            formatted_date_time = datetime_obj.strftime("%I:%M %p")
-            detailsValues.append(formatted_date_time)
-            # End of flight Scheduled Time
-
-            detailsValues.append(new_data[label]["flightsCountered"])
-
-            description = ""
-            for index, d in enumerate(details):
-                description = description + (d + " : " + str(detailsValues[index]) + "\n")
-
-            description = description + (" -------Most Recent Arrival-------" + "\n")
-
-            if(new_data[label]["recentArri"]):
-                details = ["Flight Number", "Scheduled Time", "Actual Time Of Arrival", "Flight Status",
-                        "Origin Country"]  # Order must meet the detailsValues
-                detailsValues = []
-
-                detailsValues.append(new_data[label]["recentArri"]["flightNumber"])
-
-                # Beginning of recent flight Scheduled Time
-                datetime_obj = datetime.fromtimestamp(int(new_data[label]["recentArri"]["scheduledTime"]))
-                formatted_date_time = datetime_obj.strftime("%I:%M %p")
-                detailsValues.append(formatted_date_time)
-                # End of recent flight Scheduled Time
-
-                # Beginning of Actual Time Of Departure
-                try:
-                    datetime_obj = datetime.fromtimestamp(int(new_data[label]["recentArri"]["actualTimeOfArr"]))
-                    formatted_date_time = datetime_obj.strftime("%I:%M %p")
-                    detailsValues.append(formatted_date_time)
-                except:
-                    detailsValues.append("N/A")
-                # End of Actual Time Of Departure
-
-                detailsValues.append(new_data[label]["recentArri"]["lang"]["en"]["flightStatus"])
-                detailsValues.append(new_data[label]["recentArri"]["lang"]["en"]["originCountry"])
-
-                for index, d in enumerate(details):
-                    description = description + (d + " : " + str(detailsValues[index]) + "\n")
+            self.shown[index] = shown
+            if shown is None:
+                text.set_visible(False)
             else:
-                description = description + ("No recent arrival for today." + "\n")
-            
-            labels.append(description)
-
-        mplcursors.cursor(scatter, hover=True).connect("add", lambda sel: sel.annotation.set_text(labels[sel.target.index]))
-        ax.set(xlabel="Today(Top 5 Airlines Arrival - Hover over shape for details)", ylabel="Flights Countered",
-               title="Arrivals Today (" + datetime.today().strftime('%Y-%m-%d %H:%M:%S') + ") (updates every 10s)")
-
-        plt.xticks(fontsize=10)
-        ax.set_title("Arrivals Today (" + datetime.today().strftime('%Y-%m-%d %H:%M:%S') + ") (updates every 10s)")
-        fig.canvas.draw()
-
-def update_busiest_hours_plot(frame, fig, ax, depBusiestHoursQueue, arrBusiestHoursQueue):
-    """Update the busiest hours plot with new data.
-
-    Args:
-        frame: Frame number (not used).
-        fig: The figure.
-        ax: The axis for the busiest hours plot.
-        depBusiestHoursQueue: Queue containing busiest departure hours data.
-        arrBusiestHoursQueue: Queue containing busiest arrival hours data.
+                text.set(text=shown[0], position=(index, shown[1]), visible=True)
+        self.stamp.set_text("updated " + datetime.today().strftime('%Y-%m-%d %H:%M:%S'))
+
+        return fit_ylim(self.ax, counts.max() if len(counts) else 0)
+
+def rolling_readout(rolling):
+    """One line of rolling window stats: movements, on-time % and median delay per window."""
+    parts = []
+    for name, _ in ROLLING_WINDOWS:
+        stats = rolling[name]
+        if stats["movements"]:
+            parts.append("%s %d (%.0f%% on time, p50 %+.0f min)" % (name, stats["movements"], stats["on_time"], stats["p50"]))
+        else:
+            parts.append("%s 0" % name)
+    return ", ".join(parts)
+
+class HoursPanel():
+    """Persistent artists of the hours panel, moved with set_data.
+
+    Plots the true movement count of each hour of the day per board, with
+    a dashed trailing 3 hour moving average, and the rolling window stats
+    of both boards as text.
+
+    Attributes:
+        ax: The axis of the panel.
+        arrival: The arrival line.
+        departure: The departure line.
+        arrival_average: The arrival moving average line.
+        departure_average: The departure moving average line.
+        stamp: The "updated at" text.
+        readout: The rolling window stats text.
+        versions: (departure, arrival) board versions last drawn.
     """
-    depBusiestHours = depBusiestHoursQueue.get()
-    arrBusiestHours = arrBusiestHoursQueue.get()
 
-    if arrBusiestHours and depBusiestHours:
-        ax.clear()
-
-        ax.plot(dayHours[:len(arrBusiestHours)], arrBusiestHours, marker='o',
-                linestyle='-', label="Arrival", color='blue')
-
-        ax.plot(dayHours[:len(depBusiestHours)], depBusiestHours, marker='o',
-                linestyle='-', label="Departure", color='red')
-        
+    def __init__(self, ax) -> None:
+        self.ax       = ax
+        self.versions = (0, 0)
+
+        ax.set(xlim=[-0.5, 23.5], ylim=[0, 10], xticks=range(24),
+               ylabel="Number of Flights", xlabel="(Departure/Arrival Movements per Hour, dashed: 3h moving average) Today (updates every 10s)")
+        ax.set_xticklabels(dayHours, fontsize=7)
+
+        self.arrival,           = ax.plot([], [], marker='o', linestyle='-', label="Arrival", color='blue')
+        self.departure,         = ax.plot([], [], marker='o', linestyle='-', label="Departure", color='red')
+        self.arrival_average,   = ax.plot([], [], linestyle='--', color='blue', alpha=0.6)
+        self.departure_average, = ax.plot([], [], linestyle='--', color='red', alpha=0.6)
+        self.stamp              = ax.text(0.99, 0.97, "", ha="right", va="top", fontsize=8, transform=ax.transAxes)
+        self.readout            = ax.text(0.99, 0.90, "", ha="right", va="top", fontsize=7, transform=ax.transAxes)
+        ax.legend(loc="upper left")
+
+    def artists(self):
+        return [self.arrival, self.departure, self.arrival_average, self.departure_average, self.stamp, self.readout]
+
+    def update(self, snapshot):
+        """Move the lines to a new snapshot, same return values as AirlinesPanel.update."""
+        versions = (snapshot["depart"]["version"], snapshot["arrival"]["version"])
+        if versions == self.versions:
+            return None
+        self.versions = versions
+
+        depart  = snapshot["depart"]
+        arrival = snapshot["arrival"]
+        hours   = range(24)
+
+        self.arrival.set_data(hours, arrival["hours"])
+        self.departure.set_data(hours, depart["hours"])
+        self.arrival_average.set_data(hours, moving_average(arrival["hours"]))
+        self.departure_average.set_data(hours, moving_average(depart["hours"]))
+        self.stamp.set_text("updated " + datetime.today().strftime('%Y-%m-%d %H:%M:%S'))
+        self.readout.set_text("Departures: " + rolling_readout(depart["rolling"]) + "\nArrivals: " + rolling_readout(arrival["rolling"]))
+
+        return fit_ylim(self.ax, max(depart["hours"] + arrival["hours"]))
+
+class BreakdownPanel():
+    """Top countries of one board, filtered by direction, airline and scheduled hours.
+
+    Reads the Breakdown of the boards: every filter is a sum over its
+    precomputed counts, so switching a filter recounts nothing and only
+    moves the persistent bars, texts and slider artists, which are blitted.
+    Bar widths are relative to the busiest country of the filter and the
+    counts are written out, so no filter changes the axis limits. The
+    airline choices are the busiest airlines of both boards together and
+    only change (with a full redraw) when that top moves.
+
+    Attributes:
+        ax: The axis of the bar chart.
+        blitter: The BlitManager the filter callbacks redraw through.
+        bars: One horizontal bar per country slot, busiest on top.
+        names: One "country  flights" text per country slot.
+        readout: The statuses text of the filter.
+        direction: RadioButtons of the board shown, departures or arrivals.
+        airline_buttons: RadioButtons of "All" and the busiest airlines.
+        slider: RangeSlider of the scheduled hours kept.
+        type: Board shown, either "depart" or "arrival".
+        airline: Airline kept, None keeps them all.
+        hours: (first, last) scheduled hours kept, last excluded.
+        breakdowns: Breakdown of each board from the last snapshot.
+        choices: Airlines offered by airline_buttons after "All", "" for an empty slot.
+        versions: (departure, arrival) board versions last drawn.
+    """
 
-        ax.set(ylabel="Number of Flights",
-               xlabel="(Busiest Hours for Departure/Arrival Flights) Today(" + datetime.today().strftime('%Y-%m-%d %H:%M:%S') + ") (updates every 10s)")
+    def __init__(self, ax, ax_direction, ax_airline, ax_hours, blitter, top_n=5, countries=10) -> None:
+        self.ax         = ax
+        self.blitter    = blitter
+        self.type       = "depart"
+        self.airline    = None
+        self.hours      = (0, 24)
+        self.breakdowns = {"depart": Breakdown.empty(), "arrival": Breakdown.empty()}
+        self.choices    = [""] * top_n
+        self.versions   = (0, 0)
+
+        ax.set(xlim=[0, 1], ylim=[countries + 0.5, -0.5], xticks=[], yticks=[], xlabel="Top Countries (scheduled flights by destination/origin)",
+               title="Destinations / Origins Today")
+        self.bars    = list(ax.barh(np.arange(countries), np.zeros(countries), height=0.7, color="red").patches)
+        self.names   = [ax.text(0, index, "", va="center", fontsize=8) for index in range(countries)]
+        self.readout = ax.text(0.99, 0.01, "", ha="right", va="bottom", fontsize=7, transform=ax.transAxes)
+
+        self.direction       = RadioButtons(ax_direction, ["Departures", "Arrivals"])
+        self.airline_buttons = RadioButtons(ax_airline, ["All"] + self.choices)
+        self.slider          = RangeSlider(ax_hours, "Hours", 0, 24, valinit=(0, 24), valstep=1)
+        for label in self.airline_buttons.labels:
+            label.set_fontsize(7)
+
+        # The slider would ask for a full draw on each move, its moving artists are blitted instead
+        self.slider.drawon = False
+        blitter.add(ax_hours, self.slider.poly, self.slider.valtext, *self.slider._handles)
+
+        self.direction.on_clicked(self.__on_direction__)
+        self.airline_buttons.on_clicked(self.__on_airline__)
+        self.slider.on_changed(self.__on_hours__)
+
+    def artists(self):
+        return self.bars + self.names + [self.readout]
+
+    def __on_direction__(self, label):
+        self.type = "depart" if label == "Departures" else "arrival"
+        self.__draw__()
+        self.blitter.update([self.ax])
+
+    def __on_airline__(self, label):
+        index        = self.airline_buttons.index_selected
+        self.airline = self.choices[index - 1] if index and label else None
+        self.__draw__()
+        self.blitter.update([self.ax])
+
+    def __on_hours__(self, hours):
+        self.hours = (int(hours[0]), int(hours[1]))
+        self.__draw__()
+        self.blitter.update([self.ax, self.slider.ax])
+
+    def __offer__(self):
+        """Offer the busiest airlines of both boards, return True when the choices changed."""
+        counts = dict()
+        for breakdown in self.breakdowns.values():
+            for airline, flights in zip(breakdown.airlines, breakdown.status.sum(axis=1).tolist()):
+                counts[airline] = counts.get(airline, 0) + flights
+        top     = [airline for airline in sorted(counts, key=lambda airline: (-counts[airline], airline)) if counts[airline]][:len(self.choices)]
+        choices = top + [""] * (len(self.choices) - len(top))
+        if choices == self.choices:
+            return False
+        self.choices = choices
+        for label, airline in zip(self.airline_buttons.labels[1:], choices):
+            label.set_text(airline)
+        if self.airline not in top:
+            self.airline = None
+
+        # Moves the selection mark only: the filter is already set and the caller draws
+        self.airline_buttons.eventson = self.airline_buttons.drawon = False
+        self.airline_buttons.set_active(top.index(self.airline) + 1 if self.airline else 0)
+        self.airline_buttons.eventson = self.airline_buttons.drawon = True
+        return True
+
+    def __draw__(self):
+        """Move the bars and texts to the filter."""
+        breakdown = self.breakdowns[self.type]
+        top       = breakdown.top_countries(self.airline, self.hours, n=len(self.bars))
+        color     = "red" if self.type == "depart" else "blue"
+        scale     = 0.6 / top[0][1] if top else 0
+        for index, (bar, text) in enumerate(zip(self.bars, self.names)):
+            country, flights = top[index] if index < len(top) else ("", 0)
+            bar.set(width=flights * scale, color=color)
+            text.set(text="%s  %d" % (country, flights) if flights else "", x=flights * scale + 0.01)
+
+        self.readout.set_text(", ".join("%s %d" % pair for pair in breakdown.statuses_for(self.airline)))
+
+    def update(self, snapshot):
+        """Take the breakdowns of a new snapshot, same return values as AirlinesPanel.update (True when the airline choices changed)."""
+        versions = (snapshot["depart"]["version"], snapshot["arrival"]["version"])
+        if versions == self.versions:
+            return None
+        self.versions   = versions
+        self.breakdowns = {type: snapshot[type]["breakdown"] for type in ("depart", "arrival")}
+
+        self.__draw__()
+        return self.__offer__()
+
+def fit_ylim(ax, top, floor=10):
+    """Grow the y limits with 25% headroom when top no longer fits, shrink them when it falls under half of them
+    (after a busy day or a spike), never under floor; return True when they changed."""
+    limit = ax.get_ylim()[1]
+    if limit * 0.5 <= top < limit * 0.95:
+        return False
+    fitted = max(top * 1.25 + 1, floor)
+    if fitted == limit:
+        return False
+    ax.set_ylim(0, fitted)
+    return True
+
+class Dashboard():
+    """The live panels, redrawn from the snapshot channel by blitting.
+
+    update() is meant to be driven by a canvas timer (see main.py): frames
+    where no board changed cost one shared memory header read. Changed
+    panels are blitted alone; only rescaled y limits trigger a full draw.
+
+    Attributes:
+        reader: SnapshotReader of the channel the fetch process publishes to.
+        panels: (departures panel, arrivals panel, hours panel), then the breakdown panel when there is one.
+        blitter: The BlitManager of the figure.
+        frame_times: Duration in seconds of the last frames that drew something.
+        title: Window title the frame time readout is appended to.
+        metrics: Metrics the read and draw stages and the frame counts go to.
+    """
 
-        ax.legend()
-        plt.xticks(fontsize=7)
-        fig.canvas.draw()
\ No newline at end of file
+    def __init__(self, fig, ax_depart, ax_arrival, ax_hours, reader, top_n=5, title="", metrics=NULL_METRICS, breakdown=None) -> None:
+        """Build the panels; breakdown is the (chart, direction, airline, hours slider) axes of the breakdown panel, None leaves it out."""
+        self.fig         = fig
+        self.reader      = reader
+        self.blitter     = BlitManager(fig.canvas)
+        self.panels      = (AirlinesPanel(ax_depart, "depart", "red", top_n), AirlinesPanel(ax_arrival, "arrival", "blue", top_n), HoursPanel(ax_hours))
+        if breakdown is not None:
+            self.panels += (BreakdownPanel(*breakdown, self.blitter, top_n=top_n),)
+        self.frame_times = []
+        self.title       = title
+        self.metrics     = metrics
+        self.last_frame  = None
+        for panel in self.panels:
+            self.blitter.add(panel.ax, *panel.artists())
+        metrics.gauge("snapshot_age_seconds", lambda: time.time() - reader.read_at if reader.read_at else float("nan"))
+        metrics.gauge("snapshot_versions_skipped_total", lambda: reader.skipped)
+
+    def update(self, frame):
+        """Redraw the panels whose board moved.
+
+        Args:
+            frame: Frame number (not used).
+        """
+        with self.metrics.time("stage_seconds", stage="read"):
+            snapshot = self.reader.latest()
+        started  = time.perf_counter()
+
+        changed = []
+        full    = False
+        for panel, data in zip(self.panels, (snapshot["depart"], snapshot["arrival"], snapshot, snapshot)):
+            moved = panel.update(data)
+            if moved is not None:
+                changed.append(panel.ax)
+                full = full or moved
+
+        if not changed:
+            return
+        if full:
+            self.blitter.full_redraw()
+        else:
+            self.blitter.update(changed)
+
+        elapsed = time.perf_counter() - started
+        self.metrics.observe("stage_seconds", elapsed, stage="draw")
+        self.metrics.inc("frames_total", kind="full" if full else "blit")
+        self.__record_frame__(elapsed)
+
+    def __record_frame__(self, elapsed):
+        """Keep the last frame times and show the readout in the window title."""
+        now = time.perf_counter()
+        fps = 1 / (now - self.last_frame) if self.last_frame else 0
+        self.last_frame  = now
+        self.frame_times = (self.frame_times + [elapsed])[-100:]
+
+        manager = self.fig.canvas.manager
+        if manager is not None:
+            manager.set_window_title("%s  |  %.2f fps, frame %.1f ms (avg %.1f ms), full redraws %d" % (
+                self.title, fps, elapsed * 1000, sum(self.frame_times) / len(self.frame_times) * 1000, self.blitter.full_draws))
@@ -0,0 +1,290 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+
+# Upper bounds (seconds) of the stage duration buckets, +Inf is implied
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Type and help of every metric, names without the prefix
+METRICS_HELP = {
+    "stage_seconds": ("histogram", "Duration of one pipeline stage: request, decode, apply, history, rolling, breakdown, summarize, publish, notify, read, draw, render."),
+    "fetches_total": ("counter", "Polls of a board by result: changed, unchanged or error."),
+    "fetch_retries_total": ("counter", "Webservice requests retried after a failure."),
+    "records_processed_total": ("counter", "Flight records of the changed payloads applied to a board."),
+    "records_skipped_total": ("counter", "Malformed flight records left out of streamed answers."),
+    "flights_changed_total": ("counter", "Flights inserted, changed or removed by the polls of a board."),
+    "publishes_total": ("counter", "New versions of a board published."),
+    "errors_total": ("counter", "Errors caught by stage."),
+    "events_total": ("counter", "Status and actual time changes detected, by board and kind."),
+    "notifications_total": ("counter", "Matched events handed to a sink, by sink: stdout, file or http(s)."),
+    "polls_in_flight": ("gauge", "Polls holding a worker of the scheduler."),
+    "flights_on_board": ("gauge", "Flights currently on a board."),
+    "poll_interval_seconds": ("gauge", "Seconds planned until the next poll of an adaptive board."),
+    "data_age_seconds": ("gauge", "Seconds since a board was last fetched successfully."),
+    "language_switches_total": ("counter", "Switches of the language names are shown in, by language."),
+    "exports_total": ("counter", "Export ticks by result: written, unchanged, busy or dropped."),
+    "frames_total": ("counter", "Dashboard frames that drew something, by kind: blit or full."),
+    "snapshot_age_seconds": ("gauge", "Seconds since the dashboard last read a new snapshot."),
+    "snapshot_versions_skipped_total": ("counter", "Snapshots published but overwritten before the dashboard read them."),
+    "sse_clients": ("gauge", "Connected Server-Sent Events clients."),
+    "sse_queue_depth": ("gauge", "Events waiting in the fullest SSE client queue."),
+}
+
+
+class Histogram():
+    """
+    Cumulative-bucket histogram, Prometheus style.
+
+    Attributes:
+        bounds: Upper bound of each bucket.
+        counts: Observations per bucket, not cumulated.
+        sum: Sum of the observations.
+        count: Number of observations.
+    """
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds=STAGE_BUCKETS) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum    = 0.0
+        self.count  = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum   += value
+        self.count += 1
+
+
+class Timer():
+    """Context manager observing its duration into a histogram of a Metrics."""
+
+    __slots__ = ("metrics", "name", "labels", "started")
+
+    def __init__(self, metrics, name, labels) -> None:
+        self.metrics = metrics
+        self.name    = name
+        self.labels  = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.started, **self.labels)
+
+
+class NullTimer():
+    """Timer of NullMetrics, times nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class NullMetrics():
+    """
+    Metrics turned off: every call returns at once, errors are still printed.
+
+    The default of every instrumented class, so the hot path pays one
+    method call per measure and nothing else.
+    """
+
+    enabled = False
+
+    def inc(self, name, value=1, **labels):
+        pass
+
+    def set(self, name, value, **labels):
+        pass
+
+    def gauge(self, name, function, **labels):
+        pass
+
+    def observe(self, name, value, **labels):
+        pass
+
+    def time(self, name, **labels):
+        return NULL_TIMER
+
+    def event(self, event, **fields):
+        pass
+
+    def error(self, stage, error, **labels):
+        print("%s error -> %s" % (stage, error))
+
+
+NULL_METRICS = NullMetrics()
+
+
+def label_key(labels):
+    """Returns the hashable, ordered form of labels."""
+
+    return tuple(sorted(labels.items()))
+
+
+def format_labels(key, extra=()):
+    """Returns the Prometheus {name="value",...} text of a label key, "" when empty."""
+
+    pairs = key + tuple(extra)
+    if not pairs:
+        return ""
+
+    return "{" + ",".join('%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"')) for name, value in pairs) + "}"
+
+
+class Metrics():
+    """
+    In-process counters, gauges and stage histograms, rendered as Prometheus text.
+
+    Every series is a (name, labels) pair held in a dict, created on first
+    use. Gauges can also be callables read at render time, for values that
+    are cheaper to compute on scrape than to keep up to date (data age,
+    queue depth). With a log path, events and errors are also appended as
+    JSON lines, one object per line with "ts", "event" and "pid".
+
+    Attributes:
+        prefix: Prepended to every metric name.
+        counters: Value by (name, label key).
+        gauges: Value or callable by (name, label key).
+        histograms: Histogram by (name, label key).
+        log: Open structured log file, None when not logging.
+    """
+
+    enabled = True
+
+    def __init__(self, prefix="hamad_", log=None) -> None:
+        """
+        Initializes a Metrics instance.
+
+        Args:
+            prefix: Prepended to every metric name.
+            log: Path of a JSON lines file events and errors are appended to, None logs nothing.
+        """
+
+        self.prefix     = prefix
+        self.counters   = dict()
+        self.gauges     = dict()
+        self.histograms = dict()
+        self.log        = open(log, "a", buffering=1, encoding="utf-8") if log is not None else None
+        self.pid        = os.getpid()
+
+    def inc(self, name, value=1, **labels):
+        """Adds value to a counter."""
+
+        key                = (name, label_key(labels))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """Sets a gauge."""
+
+        self.gauges[(name, label_key(labels))] = value
+
+    def gauge(self, name, function, **labels):
+        """Registers a gauge (or counter) whose value is function() at render time."""
+
+        self.gauges[(name, label_key(labels))] = function
+
+    def observe(self, name, value, **labels):
+        """Adds an observation to a histogram."""
+
+        key       = (name, label_key(labels))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def time(self, name, **labels):
+        """Returns a context manager observing its duration in seconds into a histogram."""
+
+        return Timer(self, name, labels)
+
+    def event(self, event, **fields):
+        """Appends one JSON line to the structured log, nothing when not logging."""
+
+        if self.log is not None:
+            self.log.write(json.dumps(dict(fields, ts=time.time(), event=event, pid=self.pid), default=str) + "\n")
+
+    def error(self, stage, error, **labels):
+        """Counts, prints and logs an error caught by a stage."""
+
+        self.inc("errors_total", stage=stage)
+        print("%s error -> %s" % (stage, error))
+        self.event("error", stage=stage, error=repr(error), **labels)
+
+    def render(self):
+        """Returns every metric in the Prometheus text exposition format, safe to call from another thread."""
+
+        series = dict()
+        for (name, key), value in list(self.counters.items()):
+            series.setdefault(name, []).append(self.prefix + name + format_labels(key) + " " + repr(value))
+        for (name, key), value in list(self.gauges.items()):
+            series.setdefault(name, []).append(self.prefix + name + format_labels(key) + " " + repr(value() if callable(value) else value))
+        for (name, key), histogram in list(self.histograms.items()):
+            lines      = series.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(histogram.bounds + ("+Inf",), histogram.counts):
+                cumulative += count
+                lines.append(self.prefix + name + "_bucket" + format_labels(key, (("le", bound),)) + " " + str(cumulative))
+            lines.append(self.prefix + name + "_sum" + format_labels(key) + " " + repr(histogram.sum))
+            lines.append(self.prefix + name + "_count" + format_labels(key) + " " + str(histogram.count))
+
+        out = []
+        for name in sorted(series):
+            kind, help = METRICS_HELP.get(name, ("untyped", name))
+            out.append("# HELP %s%s %s" % (self.prefix, name, help))
+            out.append("# TYPE %s%s %s" % (self.prefix, name, kind))
+            out.extend(series[name])
+
+        return "\n".join(out) + "\n"
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+
+def serve_metrics(metrics, host="127.0.0.1", port=9100):
+    """
+    Serves GET /metrics from a daemon thread, for processes without an HTTP server of their own.
+
+    Args:
+        metrics: The Metrics rendered.
+        host: Interface to bind.
+        port: Port to bind, 0 picks a free one.
+
+    Returns:
+        The ThreadingHTTPServer, its server_address holds the bound port.
+    """
+
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
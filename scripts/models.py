@@ -0,0 +1,198 @@
+import datetime
+
+import pytz
+
+from scripts.localization import STRINGS
+
+
+# Per direction: the actual movement timestamp key and the
+# country key (under "lang") of the other end of the flight
+DIRECTIONS = {
+    "depart": ("actualTimeOfDep", "destinationCountry"),
+    "arrival": ("actualTimeOfArr", "originCountry"),
+}
+
+# Asia/Qatar has no DST, so one offset converts any timestamp to a local hour
+QATAR_UTC_OFFSET = int(pytz.timezone('Asia/Qatar').utcoffset(datetime.datetime(2000, 1, 1)).total_seconds())
+
+
+def qatar_hour(timestamp):
+    """Returns the hour of day (0-23) of a UNIX timestamp in Asia/Qatar."""
+
+    return (int(timestamp) + QATAR_UTC_OFFSET) // 3600 % 24
+
+
+class Flight():
+    """
+    One flight as the analysis sees it, built once when it enters a state store.
+
+    Timestamps are ints (actualTime is 0 until the flight moved) and the
+    airline, status and country are ids into the shared LocalizedStrings
+    table, which holds each name once in every language the records
+    carried. airline, status and country read the names in the current
+    language of the table; airline_key, status_key and country_key the
+    key (KEY_LANGUAGE) names, which do not move when the language does and
+    are what history, delays and watch rules use.
+
+    Attributes:
+        flightNumber: The flight number.
+        scheduledTime: Scheduled time, UNIX seconds.
+        actualTime: Actual time of departure or arrival, UNIX seconds, 0 when none yet.
+        airline_id: Id of the airline name.
+        status_id: Id of the flight status.
+        country_id: Id of the destination country for departures, origin country for arrivals.
+        strings: The LocalizedStrings table of the ids, shared by every flight.
+    """
+
+    __slots__ = ("flightNumber", "scheduledTime", "actualTime", "airline_id", "status_id", "country_id")
+
+    strings = STRINGS
+
+    def __init__(self, flightNumber, scheduledTime, actualTime, airline, status, country) -> None:
+        """Builds a Flight from its key names (or names with no other language, like the GUI's decoded snapshots)."""
+
+        intern             = self.strings.intern
+        self.flightNumber  = flightNumber
+        self.scheduledTime = scheduledTime
+        self.actualTime    = actualTime
+        self.airline_id    = intern(airline)
+        self.status_id     = intern(status)
+        self.country_id    = intern(country)
+
+    @classmethod
+    def from_record(cls, flight, type):
+        """
+        Builds a Flight from a webservice record (raw or projected, see flight_stream.project).
+
+        The names are interned with their text in every language of the record's "lang".
+
+        Args:
+            flight: The record.
+            type: Type of flight data, either "depart" or "arrival".
+        """
+
+        actual_key, country_key = DIRECTIONS[type]
+        langs                   = flight["lang"]
+        actual                  = flight.get(actual_key)
+        intern                  = cls.strings.intern_record
+
+        self               = cls.__new__(cls)
+        self.flightNumber  = flight["flightNumber"]
+        self.scheduledTime = int(flight["scheduledTime"])
+        self.actualTime    = int(actual) if actual else 0
+        self.airline_id    = intern(langs, "airlineName")
+        self.status_id     = intern(langs, "flightStatus")
+        self.country_id    = intern(langs, country_key)
+
+        return self
+
+    @property
+    def airline(self):
+        return self.strings.name(self.airline_id)
+
+    @property
+    def status(self):
+        return self.strings.name(self.status_id)
+
+    @property
+    def country(self):
+        return self.strings.name(self.country_id)
+
+    @property
+    def airline_key(self):
+        return self.strings.keys[self.airline_id]
+
+    @property
+    def status_key(self):
+        return self.strings.keys[self.status_id]
+
+    @property
+    def country_key(self):
+        return self.strings.keys[self.country_id]
+
+    def __eq__(self, other):
+        return isinstance(other, Flight) and all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __reduce__(self):
+        # Positional fields only, names by key: ids mean nothing to another process's table
+        return (Flight, (self.flightNumber, self.scheduledTime, self.actualTime, self.airline_key, self.status_key, self.country_key))
+
+    def __repr__(self):
+        return "Flight(%s)" % ", ".join("%s=%r" % (name, getattr(self, name))
+                                        for name in ("flightNumber", "scheduledTime", "actualTime", "airline", "status", "country"))
+
+
+class AirlineSummary():
+    """
+    What the plots and the API show of one airline.
+
+    Attributes:
+        airline: The airline name.
+        flightsCountered: Number of flights of the airline.
+        flightNumber: Flight number of its latest scheduled flight.
+        scheduledTime: Scheduled time of that flight, UNIX seconds.
+        recent: Flight of its most recent actual movement, None when none.
+        delays: Delay stats of its flights today (see DelaySketch.stats), None when none moved.
+    """
+
+    __slots__ = ("airline", "flightsCountered", "flightNumber", "scheduledTime", "recent", "delays")
+
+    def __init__(self, airline, flightsCountered, flightNumber, scheduledTime, recent=None, delays=None) -> None:
+        self.airline          = airline
+        self.flightsCountered = flightsCountered
+        self.flightNumber     = flightNumber
+        self.scheduledTime    = scheduledTime
+        self.recent           = recent
+        self.delays           = delays
+
+    def to_dict(self):
+        """
+        Returns the JSON shape of the summary.
+
+        A dict with "airline", "flightsCountered", "flightNumber",
+        "scheduledTime", "recent", which is None or a dict with
+        "flightNumber", "scheduledTime", "actualTime", "flightStatus" and
+        "country", and "delays" (None or the delay stats).
+        """
+
+        recent = self.recent
+        return {
+            "airline": self.airline,
+            "flightsCountered": self.flightsCountered,
+            "flightNumber": self.flightNumber,
+            "scheduledTime": self.scheduledTime,
+            "recent": None if recent is None else {
+                "flightNumber": recent.flightNumber,
+                "scheduledTime": recent.scheduledTime,
+                "actualTime": recent.actualTime,
+                "flightStatus": recent.status,
+                "country": recent.country,
+            },
+            "delays": self.delays,
+        }
+
+    def __eq__(self, other):
+        return isinstance(other, AirlineSummary) and all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __reduce__(self):
+        return (AirlineSummary, tuple(getattr(self, name) for name in self.__slots__))
+
+    def __repr__(self):
+        return "AirlineSummary(%s)" % ", ".join("%s=%r" % (name, getattr(self, name)) for name in self.__slots__)
+
+
+def make_summary(airline, count, latest, recent):
+    """
+    Builds the compact summary of one airline that is published to the plots.
+
+    Args:
+        airline: The airline name.
+        count: Number of flights of the airline.
+        latest: Flight of its latest scheduled flight.
+        recent: Flight of its most recent actual movement, None when none.
+
+    Returns:
+        The AirlineSummary.
+    """
+
+    return AirlineSummary(airline, int(count), latest.flightNumber, latest.scheduledTime, recent)
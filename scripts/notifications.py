@@ -0,0 +1,466 @@
+import asyncio
+import json
+import sys
+import time
+
+import aiohttp
+
+from scripts.fetcher import FetchError, FidsClient
+from scripts.metrics import NULL_METRICS
+
+
+# Event kinds: a flight already on the board changed status, or its actual time was set or corrected
+EVENT_KINDS = ("status", "time")
+
+# Fields a subscription can match on, by equality
+FIELDS = ("flightNumber", "airline", "country", "status")
+
+
+class FlightEvent():
+    """
+    One change of a watched kind to one flight, detected from a poll's Delta.
+
+    Statuses are KEY_LANGUAGE names, the ones rules match on; to_dict and
+    the sinks show them, and the flight's names, in the current language.
+
+    Attributes:
+        kind: "status" or "time", see EVENT_KINDS.
+        board: Name of the board polled, e.g. "depart".
+        flight: The Flight after the change.
+        old: Status (or actual time, 0 for none) before the change.
+        new: Status (or actual time) after the change.
+        at: UNIX time of the poll that saw it.
+    """
+
+    __slots__ = ("kind", "board", "flight", "old", "new", "at")
+
+    def __init__(self, kind, board, flight, old, new, at) -> None:
+        self.kind   = kind
+        self.board  = board
+        self.flight = flight
+        self.old    = old
+        self.new    = new
+        self.at     = at
+
+    def shown(self):
+        """Returns (old, new) as shown: statuses in the current language, times unchanged."""
+
+        if self.kind != "status":
+            return self.old, self.new
+        translate = self.flight.strings.translate
+
+        return translate(self.old), translate(self.new)
+
+    def to_dict(self):
+        """Returns the JSON shape of the event, the flight fields inlined."""
+
+        flight   = self.flight
+        old, new = self.shown()
+        return {
+            "kind": self.kind,
+            "board": self.board,
+            "flightNumber": flight.flightNumber,
+            "scheduledTime": flight.scheduledTime,
+            "actualTime": flight.actualTime,
+            "airline": flight.airline,
+            "country": flight.country,
+            "status": flight.status,
+            "old": old,
+            "new": new,
+            "at": self.at,
+        }
+
+    def __repr__(self):
+        return "FlightEvent(%s)" % ", ".join("%s=%r" % (name, getattr(self, name)) for name in self.__slots__)
+
+
+def detect_events(board, store, delta, at):
+    """
+    Turns what one poll changed into events.
+
+    Flights first seen in this poll bring no event, only the changes of
+    flights that were already on the board do (so the first poll of the
+    day is not a burst of thousands of events).
+
+    Args:
+        board: Name of the board polled.
+        store: Its FlightStateStore, after the poll.
+        delta: Delta of the poll.
+        at: UNIX time of the poll.
+
+    Returns:
+        A list of FlightEvent, status changes first.
+    """
+
+    events = [FlightEvent("status", board, store.flights[key], old, new, at) for key, old, new in delta.statuses]
+    if delta.moved:
+        inserted  = set(delta.inserted)
+        events   += [FlightEvent("time", board, store.flights[key], old, new, at) for key, old, new in delta.moved if key not in inserted]
+
+    return events
+
+
+class Subscription():
+    """
+    A rule matching events: every field it sets must equal the event's, the others match anything.
+
+    Airline, country and status are matched on KEY_LANGUAGE names, whatever
+    the language the dashboard shows.
+
+    Attributes:
+        id: Identifier of the rule, unique within a SubscriptionIndex.
+        flightNumber: Flight number watched, None for any.
+        airline: Airline watched, None for any.
+        country: Destination (departures) or origin (arrivals) country watched, None for any.
+        status: Status of the flight after the change, e.g. "Delayed", None for any.
+        kind: Event kind, "status" or "time", None for both.
+        sink: Spec of the sink matched events go to, see make_sink.
+    """
+
+    __slots__ = ("id", "flightNumber", "airline", "country", "status", "kind", "sink")
+
+    def __init__(self, id, flightNumber=None, airline=None, country=None, status=None, kind=None, sink="stdout") -> None:
+        self.id           = id
+        self.flightNumber = flightNumber
+        self.airline      = airline
+        self.country      = country
+        self.status       = status
+        self.kind         = kind
+        self.sink         = sink
+
+    @classmethod
+    def from_dict(cls, rule, id=None):
+        """Builds a subscription from its JSON shape, the keys of __init__, "id" defaulting to id."""
+
+        return cls(rule.get("id", id), **{name: rule[name] for name in cls.__slots__[1:] if name in rule})
+
+    def matches(self, event):
+        """Returns True when the event satisfies every field the rule sets."""
+
+        flight = event.flight
+        return ((self.kind is None or self.kind == event.kind) and
+                (self.flightNumber is None or self.flightNumber == flight.flightNumber) and
+                (self.airline is None or self.airline == flight.airline_key) and
+                (self.country is None or self.country == flight.country_key) and
+                (self.status is None or self.status == flight.status_key))
+
+    def __repr__(self):
+        return "Subscription(%s)" % ", ".join("%s=%r" % (name, getattr(self, name)) for name in self.__slots__ if getattr(self, name) is not None)
+
+
+class SubscriptionIndex():
+    """
+    Finds the subscriptions an event matches without looking at the others.
+
+    Rules are grouped by pattern, the fields of FIELDS they set, and filed
+    under the tuple of their values for those fields. An event builds the
+    same tuple from its own flight for each pattern in use (16 at most)
+    and gets, in one dict lookup each, exactly the rules whose fields all
+    match; only the event kind is left to check. The cost follows the
+    number of patterns and of matches, not the number of rules.
+
+    Attributes:
+        rules: Subscription by id.
+        patterns: For each pattern (a tuple of field names), its rules by values tuple, then by id.
+    """
+
+    def __init__(self, subscriptions=()) -> None:
+        self.rules    = dict()
+        self.patterns = dict()
+        for subscription in subscriptions:
+            self.add(subscription)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def __key__(self, subscription):
+        """Returns the (pattern, values) a subscription is filed under."""
+
+        pattern = tuple(field for field in FIELDS if getattr(subscription, field) is not None)
+
+        return pattern, tuple(getattr(subscription, field) for field in pattern)
+
+    def add(self, subscription):
+        """Files a subscription, replacing the one with the same id."""
+
+        self.remove(subscription.id)
+        pattern, values             = self.__key__(subscription)
+        self.rules[subscription.id] = subscription
+        self.patterns.setdefault(pattern, dict()).setdefault(values, dict())[subscription.id] = subscription
+
+    def remove(self, id):
+        """Drops the subscription with this id, if any."""
+
+        subscription = self.rules.pop(id, None)
+        if subscription is None:
+            return
+        pattern, values = self.__key__(subscription)
+        buckets         = self.patterns[pattern]
+        del buckets[values][id]
+        if not buckets[values]:
+            del buckets[values]
+            if not buckets:
+                del self.patterns[pattern]
+
+    def match(self, event):
+        """Returns the subscriptions an event matches."""
+
+        flight  = event.flight
+        fields  = {"flightNumber": flight.flightNumber, "airline": flight.airline_key, "country": flight.country_key, "status": flight.status_key}
+        kind    = event.kind
+        matches = []
+        for pattern, buckets in self.patterns.items():
+            bucket = buckets.get(tuple(fields[field] for field in pattern))
+            if bucket:
+                matches += [subscription for subscription in bucket.values() if subscription.kind is None or subscription.kind == kind]
+
+        return matches
+
+
+class StdoutSink():
+    """
+    Prints one line per matched event.
+
+    Every sink has deliver(matches), called in the polling loop with the
+    (subscription, event) pairs of one poll and never blocking on I/O
+    for long, and a coroutine close().
+
+    Attributes:
+        stream: Text stream written to, None for the current sys.stdout.
+    """
+
+    def __init__(self, stream=None) -> None:
+        self.stream = stream
+
+    def deliver(self, matches):
+        """Delivers (subscription, event) pairs."""
+
+        stream = self.stream or sys.stdout
+        for subscription, event in matches:
+            flight = event.flight
+            stream.write("[%s] %s %s %s (%s): %s %s -> %s\n" % ((subscription.id, event.board, flight.flightNumber, flight.airline, flight.country,
+                                                                 event.kind) + event.shown()))
+        stream.flush()
+
+    async def close(self):
+        pass
+
+
+class FileSink():
+    """
+    Appends one JSON line per matched event to a file.
+
+    Attributes:
+        path: The file written to.
+    """
+
+    def __init__(self, path) -> None:
+        self.path = path
+        self.file = open(path, "a", encoding="utf-8")
+
+    def deliver(self, matches):
+        """Delivers (subscription, event) pairs."""
+
+        self.file.write("".join(json.dumps(dict(event.to_dict(), subscription=subscription.id)) + "\n" for subscription, event in matches))
+        self.file.flush()
+
+    async def close(self):
+        self.file.close()
+
+
+class WebhookSink():
+    """
+    POSTs matched events as JSON lists to a URL, in the background.
+
+    Delivery never holds the polling loop: events are queued and one task
+    sends everything queued so far in a single POST on the session of a
+    FidsClient (its timeout, retries and backoff), then the next lot, so a
+    slow endpoint gets fewer, larger batches rather than a pile of
+    requests. Any 2xx answer delivers a batch, whatever its body (204, text);
+    connection errors, timeouts and 5xx answers are retried, other answers
+    are not. A batch that still fails is counted as an error and dropped,
+    and so are the oldest events beyond max_pending.
+
+    Attributes:
+        url: The webhook URL, e.g. a stub_server.WebhookReceiver.
+        client: FidsClient the batches are sent with.
+        max_pending: Most events queued, the oldest are dropped beyond.
+        metrics: Metrics the delivery errors go to.
+        queue: Events (as dicts) waiting to be sent.
+        sender: Task sending the queue, None when idle.
+        dropped: Events dropped, failed or beyond max_pending.
+    """
+
+    def __init__(self, url, client=None, max_pending=10000, metrics=NULL_METRICS) -> None:
+        self.url         = url
+        self.client      = client if client is not None else FidsClient(timeout=5, retries=2, pool_size=1)
+        self.max_pending = max_pending
+        self.metrics     = metrics
+        self.queue       = []
+        self.sender      = None
+        self.dropped     = 0
+
+    def deliver(self, matches):
+        """Queues (subscription, event) pairs, from inside the running event loop."""
+
+        self.queue += [dict(event.to_dict(), subscription=subscription.id) for subscription, event in matches]
+        if len(self.queue) > self.max_pending:
+            self.dropped += len(self.queue) - self.max_pending
+            del self.queue[:len(self.queue) - self.max_pending]
+        if self.sender is None:
+            self.sender = asyncio.get_running_loop().create_task(self.__send__())
+
+    async def __send__(self):
+        try:
+            if self.client.session is None:
+                await self.client.open()
+            while self.queue:
+                batch, self.queue = self.queue, []
+                try:
+                    await self.__post__(batch)
+                except FetchError as e:
+                    self.dropped += len(batch)
+                    self.metrics.error("notify", e, sink=self.url)
+        finally:
+            self.sender = None
+
+    async def __post__(self, batch):
+        """
+        POSTs one batch, retrying connection errors, timeouts and 5xx answers.
+
+        Raises:
+            FetchError: When the endpoint answered neither 2xx nor 5xx, or every attempt failed.
+        """
+
+        client = self.client
+        body   = json.dumps(batch)
+        for attempt in range(1, client.retries + 2):
+            try:
+                async with client.session.post(self.url, data=body, headers={"Content-Type": "application/json"}) as response:
+                    if 200 <= response.status < 300:
+                        return
+                    if response.status < 500:
+                        raise FetchError("%s answered %d" % (self.url, response.status))
+                    error = "HTTP %d" % response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = repr(e)
+            if attempt <= client.retries:
+                await asyncio.sleep(client.backoff(attempt))
+
+        raise FetchError("%s failed after %d attempts: %s" % (self.url, client.retries + 1, error))
+
+    async def flush(self):
+        """Waits until the queue is sent."""
+
+        while self.sender is not None:
+            await asyncio.shield(self.sender)
+
+    async def close(self):
+        """Waits until the queue is sent, then closes the client."""
+
+        await self.flush()
+        await self.client.close()
+
+
+def make_sink(spec, metrics=NULL_METRICS):
+    """
+    Builds a sink from its spec.
+
+    Args:
+        spec: "stdout", "file:<path>" or an http(s) webhook URL.
+        metrics: Metrics the webhook delivery errors go to.
+
+    Returns:
+        A StdoutSink, FileSink or WebhookSink.
+    """
+
+    if spec == "stdout":
+        return StdoutSink()
+    if spec.startswith("file:"):
+        return FileSink(spec[len("file:"):])
+    if spec.startswith(("http://", "https://")):
+        return WebhookSink(spec, metrics=metrics)
+    raise ValueError("unknown sink %r, expected stdout, file:<path> or an http(s) URL" % spec)
+
+
+def load_subscriptions(path):
+    """Reads subscriptions from a JSON file holding a list of rules, see Subscription.from_dict."""
+
+    with open(path, encoding="utf-8") as file:
+        return [Subscription.from_dict(rule, str(index)) for index, rule in enumerate(json.load(file))]
+
+
+class Notifier():
+    """
+    Change-detection stage run after every poll: detects events, matches them, delivers them.
+
+    Register it as a board listener (see attach); each poll's events are
+    matched against the SubscriptionIndex and handed to the sinks in one
+    batch per sink. Sinks are built on first use from the subscriptions'
+    sink specs, or given up front by spec.
+
+    Attributes:
+        index: The SubscriptionIndex matched against.
+        sinks: Sink by spec.
+        clock: Returns the current UNIX time, see replay.ReplayClock.
+        metrics: Metrics the notify stage and the event and delivery counters go to.
+        events: Events detected.
+        delivered: (subscription, event) pairs delivered.
+    """
+
+    def __init__(self, subscriptions=(), sinks=None, clock=time.time, metrics=NULL_METRICS) -> None:
+        """
+        Initializes a Notifier instance.
+
+        Args:
+            subscriptions: Subscription rules, or a SubscriptionIndex.
+            sinks: Sink by spec, to use a sink instance for a spec (e.g. a StdoutSink on a buffer).
+            clock: Returns the current UNIX time.
+            metrics: Metrics the notify stage and the counters go to, off by default.
+        """
+
+        self.index     = subscriptions if isinstance(subscriptions, SubscriptionIndex) else SubscriptionIndex(subscriptions)
+        self.sinks     = dict(sinks or {})
+        self.clock     = clock
+        self.metrics   = metrics
+        self.events    = 0
+        self.delivered = 0
+
+    def attach(self, scheduler):
+        """Runs the notifier after every poll of every board of a BoardScheduler."""
+
+        for board in scheduler.boards.values():
+            board.listeners.append(self)
+
+    def __call__(self, board, delta):
+        """Board listener: detects, matches and delivers the events of one poll."""
+
+        if not (delta.statuses or delta.moved):
+            return
+        name = board.source.name
+        with self.metrics.time("stage_seconds", stage="notify", board=name):
+            events       = detect_events(name, board.store, delta, int(self.clock()))
+            self.events += len(events)
+            self.metrics.inc("events_total", len(delta.statuses), board=name, kind="status")
+            self.metrics.inc("events_total", len(events) - len(delta.statuses), board=name, kind="time")
+            batches      = dict()
+            for event in events:
+                for subscription in self.index.match(event):
+                    batches.setdefault(subscription.sink, []).append((subscription, event))
+            for spec, matches in batches.items():
+                try:
+                    sink = self.sinks.get(spec)
+                    if sink is None:
+                        sink = self.sinks[spec] = make_sink(spec, self.metrics)
+                    sink.deliver(matches)
+                except Exception as e:
+                    self.metrics.error("notify", e, sink=spec)
+                    continue
+                self.delivered += len(matches)
+                self.metrics.inc("notifications_total", len(matches), sink=spec.split(":")[0])
+
+    async def close(self):
+        """Closes every sink, webhook batches being sent are waited for."""
+
+        for sink in self.sinks.values():
+            await sink.close()
@@ -0,0 +1,119 @@
+import math
+
+import numpy as np
+
+
+# Statuses after which a flight changes no more
+FINAL_STATUSES = frozenset(("Departed", "Landed", "Arrived", "Cancelled"))
+
+
+class PollPlanner():
+    """
+    Plans the polls of one board from its timetable and what its last polls changed.
+
+    A flight changes from about lead seconds before its scheduled time
+    (gate, "Delayed", boarding) until it moved, at worst lag seconds after
+    it. The flights still to move whose scheduled time is in that window
+    around now give the expected change rate of the board; the rate the
+    last polls saw, smoothed, takes over when it is higher, so an
+    unannounced burst of changes speeds polling up too.
+
+    The interval follows base_interval * sqrt(reference / rate), reference
+    being the day's mean rate: for a given number of polls a day, that
+    spread minimizes the mean time between a change and the poll that
+    sees it. It is kept within [min_interval, max_interval]; max_interval
+    is the latency bound, no change waits longer than that to be polled.
+
+    Attributes:
+        base_interval: Interval at the mean change rate of the day.
+        min_interval: Shortest interval, bounds the request rate.
+        max_interval: Longest interval, bounds the detection latency.
+        lead: Seconds before its scheduled time a flight starts changing.
+        lag: Seconds after its scheduled time a flight still not moved keeps changing.
+        changes_per_flight: Changes a flight brings in its window, status updates and the movement.
+        smoothing: Weight of the last poll in the observed change rate.
+        scheduled: Sorted scheduled times of the flights still to move.
+        flights: Flights on the board.
+        observed: Smoothed changes per second seen by the polls.
+        polled_at: Time of the last poll, None before the first.
+        interval: Interval planned after the last poll.
+    """
+
+    def __init__(self, base_interval=10, min_interval=5, max_interval=60, lead=3600, lag=3600, changes_per_flight=2, smoothing=0.3) -> None:
+        """
+        Initializes a PollPlanner instance.
+
+        Args:
+            base_interval: Interval at the mean change rate of the day.
+            min_interval: Shortest interval, bounds the request rate.
+            max_interval: Longest interval, bounds the detection latency.
+            lead: Seconds before its scheduled time a flight starts changing.
+            lag: Seconds after its scheduled time a flight still not moved keeps changing.
+            changes_per_flight: Changes a flight brings in its window, status updates and the movement.
+            smoothing: Weight of the last poll in the observed change rate.
+
+        Raises:
+            ValueError: When the bounds do not hold base_interval.
+        """
+
+        if not 0 < min_interval <= base_interval <= max_interval:
+            raise ValueError("intervals must satisfy 0 < min %g <= base %g <= max %g" % (min_interval, base_interval, max_interval))
+
+        self.base_interval      = base_interval
+        self.min_interval       = min_interval
+        self.max_interval       = max_interval
+        self.lead               = lead
+        self.lag                = lag
+        self.changes_per_flight = changes_per_flight
+        self.smoothing          = smoothing
+        self.scheduled          = np.zeros(0, dtype=np.int64)
+        self.flights            = 0
+        self.observed           = 0.0
+        self.polled_at          = None
+        self.interval           = base_interval
+
+    def observe(self, now, store, delta=None):
+        """
+        Takes in one poll of the board.
+
+        Args:
+            now: UNIX time of the poll.
+            store: FlightStateStore of the board, after the poll.
+            delta: Delta of the poll, None when the payload did not change (or the fetch failed).
+        """
+
+        changes = 0
+        if delta is not None:
+            changes = len(delta.inserted) + len(delta.changed) + len(delta.removed)
+            if changes:
+                self.scheduled = np.sort(np.fromiter((flight.scheduledTime for flight in store.flights.values()
+                                                      if not flight.actualTime and flight.status_key not in FINAL_STATUSES), dtype=np.int64))
+                self.flights   = len(store.flights)
+
+        # The first poll fills the board, it says nothing of the rate
+        if self.polled_at is not None and now > self.polled_at:
+            rate          = changes / (now - self.polled_at)
+            self.observed = self.smoothing * rate + (1 - self.smoothing) * self.observed
+        self.polled_at = now
+
+    def expected_rate(self, now):
+        """Returns the changes per second the timetable announces around now."""
+
+        first, last = np.searchsorted(self.scheduled, (now - self.lag, now + self.lead))
+
+        return self.changes_per_flight * int(last - first) / (self.lead + self.lag)
+
+    def next_interval(self, now):
+        """Returns the seconds to wait before the next poll, and keeps it in interval."""
+
+        reference = self.changes_per_flight * self.flights / 86400
+        rate      = max(self.expected_rate(now), self.observed)
+        if reference <= 0:
+            interval = self.base_interval
+        elif rate <= 0:
+            interval = self.max_interval
+        else:
+            interval = self.base_interval * math.sqrt(reference / rate)
+        self.interval = min(max(interval, self.min_interval), self.max_interval)
+
+        return self.interval
@@ -0,0 +1,306 @@
+import argparse
+import asyncio
+import gzip
+import json
+import time
+
+from aiohttp import web
+
+from scripts.state_store import flight_key
+from scripts.stub_server import StubFidsServer
+from scripts.synthetic import HUB_WAVES, simulate_day
+
+
+class Recorder():
+    """
+    Writes the board payloads a process receives to a gzipped JSON lines file.
+
+    Each line is one changed payload of one board: a keyframe holding the
+    whole "flights" list every keyframe_every lines of that board, and in
+    between only the records that are new or changed ("upsert") and the
+    keys of the flights that left ("remove"). A day of polls records in a
+    few megabytes and read_recording rebuilds every payload from it.
+
+    Attributes:
+        path: The recording file.
+        keyframe_every: Lines of a board between two of its keyframes.
+        boards: {name: (flights by key, lines since the last keyframe)} of the boards recorded.
+        lines: Lines written.
+    """
+
+    def __init__(self, path, keyframe_every=360) -> None:
+        """
+        Initializes a Recorder instance.
+
+        Args:
+            path: The recording file, truncated.
+            keyframe_every: Lines of a board between two of its keyframes.
+        """
+
+        self.path           = path
+        self.keyframe_every = keyframe_every
+        self.boards         = dict()
+        self.lines          = 0
+        self.file           = gzip.open(path, "wt", encoding="utf-8")
+
+    def write(self, at, name, type, flights):
+        """
+        Records one payload of a board, nothing when it did not change.
+
+        Args:
+            at: UNIX time the payload was received.
+            name: Name of the board.
+            type: Type of flight data, either "depart" or "arrival".
+            flights: The "flights" list of the payload.
+        """
+
+        current        = {flight_key(flight): flight for flight in flights}
+        previous, ages = self.boards.get(name, (None, 0))
+        line           = {"t": at, "name": name, "type": type}
+        if previous is None or ages >= self.keyframe_every:
+            line["flights"] = flights
+            ages            = 0
+        else:
+            line["upsert"] = [flight for key, flight in current.items()
+                              if previous.get(key) is not flight and previous.get(key) != flight]
+            line["remove"] = [key for key in previous if key not in current]
+            if not line["upsert"] and not line["remove"]:
+                return
+            ages += 1
+
+        self.boards[name] = (current, ages)
+        self.lines       += 1
+        self.file.write(json.dumps(line, separators=(",", ":")) + "\n")
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_recording(path):
+    """
+    Reads a recording back, payload by payload.
+
+    Records that did not change between two payloads of a board are the
+    same dict in both, like the flights of successive polls.
+
+    Args:
+        path: A file written by Recorder.
+
+    Yields:
+        (time, board name, type, "flights" list), in recording order.
+    """
+
+    boards = dict()
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        for text in file:
+            line = json.loads(text)
+            name = line["name"]
+            if "flights" in line:
+                flights = {flight_key(flight): flight for flight in line["flights"]}
+            else:
+                flights = dict(boards[name])
+                for key in line["remove"]:
+                    flights.pop(tuple(key), None)
+                for flight in line["upsert"]:
+                    flights[flight_key(flight)] = flight
+            boards[name] = flights
+
+            yield line["t"], name, line["type"], list(flights.values())
+
+
+def simulated_recording(count, seed=0, interval=10, start=None, weights=None):
+    """
+    Builds the payloads of a simulated day of both boards, see synthetic.simulate_day.
+
+    Args:
+        count: Number of flights on each board.
+        seed: Seed so runs are reproducible.
+        interval: Seconds between two polls.
+        start: Midnight of the simulated day as a UNIX timestamp, defaults to today.
+        weights: Relative flights per scheduled hour, see synthetic.simulate_day.
+
+    Yields:
+        (time, board name, type, "flights" list), both boards at each poll.
+    """
+
+    days = zip(simulate_day(count, "depart", seed, interval, start, weights), simulate_day(count, "arrival", seed + 1, interval, start, weights))
+    for (at, departures), (_, arrivals) in days:
+        yield at, "depart", "depart", departures
+        yield at, "arrival", "arrival", arrivals
+
+
+class ReplayClock():
+    """
+    Time of a replay: the recorded time reached, running at speed times real time.
+
+    Handed to FlightsManager as its clock, so rolling windows and "today"
+    follow the recording instead of the wall clock.
+
+    Attributes:
+        speed: Recorded seconds per real second, 0 replays as fast as possible.
+        origin: Recorded time at start, or of the last payload when speed is 0.
+        started: time.monotonic() at start, None when speed is 0.
+    """
+
+    def __init__(self, speed=1.0) -> None:
+        self.speed   = speed
+        self.origin  = None
+        self.started = None
+
+    def start(self, origin):
+        """Starts the clock at a recorded time."""
+
+        self.origin  = origin
+        self.started = time.monotonic() if self.speed else None
+
+    def seek(self, at):
+        """Moves the clock of an as-fast-as-possible replay to a recorded time."""
+
+        self.origin = at
+
+    def __call__(self):
+        if self.origin is None:
+            return time.time()
+        if self.started is None:
+            return self.origin
+
+        return self.origin + (time.monotonic() - self.started) * self.speed
+
+
+async def replay_into(manager, payloads, speed=0, clock=None):
+    """
+    Feeds recorded payloads straight into a FlightsManager, no HTTP involved.
+
+    Every payload goes through BoardScheduler.apply like a poll would, to
+    the board of the same name, or of the same type when the manager has
+    no board of that name.
+
+    Args:
+        manager: The FlightsManager, created with clock=clock.
+        payloads: (time, board name, type, "flights" list), see read_recording.
+        speed: Recorded seconds per real second, 0 replays as fast as possible.
+        clock: The manager's ReplayClock, kept on the recorded time.
+
+    Returns:
+        Number of payloads applied.
+    """
+
+    scheduler = manager.scheduler
+    applied   = 0
+    for at, name, type, flights in payloads:
+        if clock is not None and clock.origin is None:
+            clock.start(at)
+        if speed:
+            wait = (at - clock.origin) / speed - (time.monotonic() - clock.started)
+            if wait > 0:
+                await asyncio.sleep(wait)
+        elif clock is not None:
+            clock.seek(at)
+        scheduler.apply(scheduler.boards.get(name) or scheduler.boards[type], flights, at)
+        applied += 1
+
+    return applied
+
+
+class ReplayServer(StubFidsServer):
+    """
+    Stub FIDS webservices answering with a recording, replayed at speed times real time.
+
+    Both endpoints answer with the payload of their board (by type) that
+    was current at the replayed time, read lazily from the recording as
+    the replay goes. The day window of the request is ignored, the
+    recording has its own day; the limit is honoured.
+
+    Attributes:
+        payloads: Iterator over the recording, see read_recording.
+        clock: ReplayClock of the replay, started on the first request.
+        current: Latest replayed "flights" list per type.
+        next: The next payload, None once the recording is over.
+    """
+
+    def __init__(self, payloads, speed=1.0, **options) -> None:
+        """
+        Initializes a ReplayServer instance.
+
+        Args:
+            payloads: (time, board name, type, "flights" list), see read_recording.
+            speed: Recorded seconds per real second.
+            options: Other StubFidsServer arguments (delay, fail_every, prefix, etag).
+        """
+
+        super().__init__(0, **options)
+        self.payloads = iter(payloads)
+        self.clock    = ReplayClock(speed)
+        self.current  = {"depart": [], "arrival": []}
+        self.next     = next(self.payloads, None)
+
+    def advance(self):
+        """Replays every payload up to the replayed time."""
+
+        if self.next is not None and self.clock.origin is None:
+            self.clock.start(self.next[0])
+        now = self.clock()
+        while self.next is not None and self.next[0] <= now:
+            self.current[self.next[2]] = self.next[3]
+            self.next                  = next(self.payloads, None)
+
+    def select(self, type, body):
+        self.advance()
+        flights = self.current[type]
+
+        return flights[:body.get("limit", len(flights))]
+
+
+def main():
+    parser   = argparse.ArgumentParser(description="Record, simulate and replay Hamad airport FIDS payloads.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record = commands.add_parser("record", help="poll the webservices headless and record every changed payload")
+    record.add_argument("path")
+    record.add_argument("--fids-url", default="https://dohahamadairport.com/webservices/fids/")
+    record.add_argument("--poll-interval", type=float, default=10)
+    record.add_argument("--seconds", type=float, default=None, help="stop after this long, default never")
+
+    simulate = commands.add_parser("simulate", help="write the recording of a simulated day of both boards")
+    simulate.add_argument("path")
+    simulate.add_argument("--flights", type=int, default=3500, help="flights per board")
+    simulate.add_argument("--interval", type=int, default=10, help="seconds between two polls")
+    simulate.add_argument("--seed", type=int, default=0)
+    simulate.add_argument("--waves", action="store_true", help="schedule flights in hub waves (synthetic.HUB_WAVES), not evenly over the day")
+
+    serve = commands.add_parser("serve", help="serve a recording as stub FIDS webservices")
+    serve.add_argument("path")
+    serve.add_argument("--speed", type=float, default=1.0, help="recorded seconds per real second")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        from scripts.flights import FlightsManager
+
+        manager = FlightsManager(None, args.fids_url, args.poll_interval, record=args.path)
+
+        async def run():
+            if args.seconds is not None:
+                asyncio.get_running_loop().call_later(args.seconds, lambda: manager.stop_event.set())
+            await manager.__run__()
+
+        asyncio.run(run())
+    elif args.command == "simulate":
+        with Recorder(args.path) as recorder:
+            for payload in simulated_recording(args.flights, args.seed, args.interval, weights=HUB_WAVES if args.waves else None):
+                recorder.write(*payload)
+        print("%d lines written to %s" % (recorder.lines, args.path))
+    else:
+        server = ReplayServer(read_recording(args.path), args.speed)
+        web.run_app(server.app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import time
+
+
+class CacheEntry():
+    """
+    Last answer of one webservice URL.
+
+    Only what is needed to recognise the same answer again is kept, not the
+    decoded payload itself.
+
+    Attributes:
+        body: The request body the answer was for.
+        digest: Hash of the raw answer bytes.
+        size: Length of the raw answer in bytes.
+        etag: ETag header of the answer, None when the server sent none.
+        last_modified: Last-Modified header of the answer, None when the server sent none.
+        fetched_at: time.monotonic() of the last download or revalidation.
+    """
+
+    __slots__ = ("body", "digest", "size", "etag", "last_modified", "fetched_at")
+
+    def __init__(self, body, digest, size, etag, last_modified, fetched_at) -> None:
+        self.body          = body
+        self.digest        = digest
+        self.size          = size
+        self.etag          = etag
+        self.last_modified = last_modified
+        self.fetched_at    = fetched_at
+
+
+class ResponseCache():
+    """
+    Response cache in front of the FIDS webservices.
+
+    Requests are revalidated with If-None-Match / If-Modified-Since when the
+    server sent an ETag / Last-Modified, so an unchanged board answers 304
+    without a body. When it did not, the raw bytes are hashed and an
+    identical payload skips JSON decoding. Either way the caller is told the
+    board did not change, so it can skip analysis entirely.
+
+    Attributes:
+        ttl: Seconds an answer is reused without asking the server at all, 0 always asks.
+        hits: Requests answered from the cache (TTL, 304 or same content hash).
+        misses: Requests that brought a changed payload.
+        not_modified: Requests the server answered with 304.
+        bytes_saved: Body bytes not downloaded thanks to the TTL or a 304.
+        decodes_saved: JSON decodes skipped because the content hash matched.
+    """
+
+    def __init__(self, ttl=0) -> None:
+        """
+        Initializes a ResponseCache instance.
+
+        Args:
+            ttl: Seconds an answer is reused without asking the server at all, 0 always asks.
+        """
+
+        self.ttl           = ttl
+        self.entries       = dict()  # url -> CacheEntry, a new body (next day) replaces the entry
+        self.hits          = 0
+        self.misses        = 0
+        self.not_modified  = 0
+        self.bytes_saved   = 0
+        self.decodes_saved = 0
+
+    def __entry__(self, url, body):
+        entry = self.entries.get(url)
+
+        return entry if entry is not None and entry.body == body else None
+
+    def fresh(self, url, body):
+        """
+        Returns True when the cached answer for (url, body) is younger than the TTL.
+
+        A fresh answer counts as a hit: the caller does not send the request.
+        """
+
+        entry = self.__entry__(url, body)
+        if entry is None or not self.ttl or time.monotonic() - entry.fetched_at >= self.ttl:
+            return False
+
+        self.hits        += 1
+        self.bytes_saved += entry.size
+
+        return True
+
+    def conditional_headers(self, url, body):
+        """Returns the If-None-Match / If-Modified-Since headers for (url, body), empty when nothing is cached."""
+
+        headers = dict()
+        entry   = self.__entry__(url, body)
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        return headers
+
+    def revalidated(self, url):
+        """Records a 304 answer for url."""
+
+        entry              = self.entries[url]
+        entry.fetched_at   = time.monotonic()
+        self.hits         += 1
+        self.not_modified += 1
+        self.bytes_saved  += entry.size
+
+    def store(self, url, body, raw, headers):
+        """
+        Records a full answer for (url, body).
+
+        Args:
+            url: The webservice URL.
+            body: The request body.
+            raw: The raw answer bytes.
+            headers: The answer headers.
+
+        Returns:
+            The decoded JSON answer, or None when it is identical to the cached one.
+        """
+
+        if not self.store_digest(url, body, hashlib.blake2b(raw, digest_size=16).digest(), len(raw), headers):
+            return None
+
+        return json.loads(raw)
+
+    def store_digest(self, url, body, digest, size, headers):
+        """
+        Records a full answer for (url, body) that was decoded while it streamed in.
+
+        Args:
+            url: The webservice URL.
+            body: The request body.
+            digest: blake2b (16 bytes) digest of the raw answer.
+            size: Length of the raw answer in bytes.
+            headers: The answer headers.
+
+        Returns:
+            True when the answer changed, False when it is identical to the cached one.
+        """
+
+        entry = self.__entry__(url, body)
+        now   = time.monotonic()
+
+        if entry is not None and entry.digest == digest:
+            entry.etag          = headers.get("ETag")
+            entry.last_modified = headers.get("Last-Modified")
+            entry.fetched_at    = now
+            self.hits          += 1
+            self.decodes_saved += 1
+            return False
+
+        self.entries[url] = CacheEntry(body, digest, size, headers.get("ETag"), headers.get("Last-Modified"), now)
+        self.misses      += 1
+
+        return True
+
+    def forget(self, url):
+        """Drops the answer cached for url, the next one is downloaded and reported as changed, e.g. after it failed to apply."""
+
+        self.entries.pop(url, None)
+
+    def stats(self):
+        """Returns the cache counters as a dict."""
+
+        requests = self.hits + self.misses
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / requests if requests else 0.0,
+            "not_modified": self.not_modified,
+            "bytes_saved": self.bytes_saved,
+            "decodes_saved": self.decodes_saved,
+            "ttl": self.ttl,
+        }
@@ -0,0 +1,231 @@
+import numpy as np
+
+
+# Windows published with every board, name -> seconds
+ROLLING_WINDOWS = (("15m", 15 * 60), ("1h", 3600), ("24h", 24 * 3600))
+
+# A movement at most this late (seconds) is on time, the usual 15 minute threshold
+ON_TIME = 15 * 60
+
+# Delay histogram bin edges in seconds: 5 minute bins from an hour early to four hours late
+DELAY_EDGES = np.arange(-60, 241, 5) * 60
+FIRST_EDGE = int(DELAY_EDGES[0])
+BIN_WIDTH = 5 * 60
+
+# Delay a histogram bin reads as: its upper edge, the open ended last bin its lower one (minutes)
+BIN_DELAYS = np.append(DELAY_EDGES, DELAY_EDGES[-1]) / 60
+
+
+def delay_bin(delay):
+    """Returns the DELAY_EDGES histogram bin of a delay in seconds, 0 and len(DELAY_EDGES) being the open ended ones."""
+
+    return min(max((delay - FIRST_EDGE) // BIN_WIDTH + 1, 0), len(DELAY_EDGES))
+
+
+def empty_stats():
+    """Returns the stats of a window without movements."""
+
+    return {"movements": 0, "on_time": 0.0, "mean_delay": 0.0, "p50": 0.0, "p90": 0.0}
+
+
+def moving_average(counts, hours=3):
+    """
+    Trailing moving average of hourly counts.
+
+    Args:
+        counts: Counts per hour, oldest first.
+        hours: Width of the window; the first hours average what they have.
+
+    Returns:
+        A float array the length of counts.
+    """
+
+    counts = np.asarray(counts, dtype=float)
+    sums   = np.convolve(counts, np.ones(hours))[:len(counts)]
+
+    return sums / np.minimum(np.arange(1, len(counts) + 1), hours)
+
+
+def window_stats(movements, punctual, delay_sum, histogram):
+    """Turns the totals of a window into its stats dict, see RollingWindow.stats."""
+
+    if movements <= 0:
+        return empty_stats()
+
+    cumulated = np.cumsum(histogram)
+    p50, p90  = (float(BIN_DELAYS[np.searchsorted(cumulated, movements * q)]) for q in (0.5, 0.9))
+
+    return {
+        "movements": movements,
+        "on_time": 100.0 * punctual / movements,
+        "mean_delay": delay_sum / movements / 60,
+        "p50": p50,
+        "p90": p90,
+    }
+
+
+class BucketRing():
+    """
+    Ring of fixed-width time buckets of movements.
+
+    A bucket covers width seconds of actual movement times and holds the
+    number of movements, how many were on time, the sum of their delays
+    and a delay histogram (DELAY_EDGES). Slots are reused lazily: a slot
+    still holding an older bucket is cleared when a newer movement lands
+    in it, so adding or retracting a movement is O(1).
+
+    Attributes:
+        width: Seconds per bucket.
+        stamps: Bucket number (actual time // width) each slot holds, -1 when empty.
+        counts: Movements per slot.
+        punctual: On-time movements per slot.
+        delay_sums: Sum of the delays per slot, seconds.
+        delays: Delay histogram per slot.
+        newest: Newest bucket number seen.
+    """
+
+    def __init__(self, size, width) -> None:
+        self.width      = width
+        self.stamps     = np.full(size, -1, dtype=np.int64)
+        self.counts     = np.zeros(size, dtype=np.int64)
+        self.punctual   = np.zeros(size, dtype=np.int64)
+        self.delay_sums = np.zeros(size, dtype=np.float64)
+        self.delays     = np.zeros((size, len(DELAY_EDGES) + 1), dtype=np.int64)
+        self.newest     = -1
+
+    def add(self, actual, delay, on_time, weight=1):
+        """Counts (weight 1) or uncounts (weight -1) one movement, False when its bucket is gone or too old."""
+
+        bucket = actual // self.width
+        slot   = bucket % len(self.stamps)
+        if self.stamps[slot] != bucket:
+            if weight < 0 or self.stamps[slot] > bucket or bucket <= self.newest - len(self.stamps):
+                return False
+            self.stamps[slot]     = bucket
+            self.counts[slot]     = 0
+            self.punctual[slot]   = 0
+            self.delay_sums[slot] = 0
+            self.delays[slot]     = 0
+
+        self.counts[slot]                   += weight
+        self.delay_sums[slot]               += weight * delay
+        self.delays[slot, delay_bin(delay)] += weight
+        if on_time:
+            self.punctual[slot] += weight
+        self.newest = max(self.newest, bucket)
+
+        return True
+
+    def totals(self, first, last):
+        """Returns (movements, on time, delay sum, delay histogram) of buckets first to last included."""
+
+        if last < first:
+            return (0, 0, 0.0, 0)
+        buckets = np.arange(first, last + 1)
+        slots   = buckets % len(self.stamps)
+        slots   = slots[self.stamps[slots] == buckets]
+
+        return int(self.counts[slots].sum()), int(self.punctual[slots].sum()), float(self.delay_sums[slots].sum()), self.delays[slots].sum(axis=0)
+
+
+def add_totals(a, b):
+    """Sums two BucketRing.totals tuples."""
+
+    return tuple(x + y for x, y in zip(a, b))
+
+
+class RollingWindow():
+    """
+    Movements of one board over the last span seconds, in minute and hour buckets.
+
+    Every movement goes to a ring of width-second buckets and to a ring of
+    hour buckets, O(1) each. A window query sums whole hours from the hour
+    ring and only the partial hours at both ends from the fine ring, so the
+    24 hour window reads about 24 + 2 * 60 buckets instead of 1440. Delay
+    percentiles have the 5 minute resolution of the histogram.
+
+    Attributes:
+        span: Seconds covered, the longest window it can answer.
+        width: Seconds per fine bucket, a divisor of an hour.
+        on_time: Lateness in seconds up to which a movement is on time.
+        fine: BucketRing of width-second buckets over span.
+        hours: BucketRing of hour buckets over span plus the current hour.
+    """
+
+    def __init__(self, span=ROLLING_WINDOWS[-1][1], width=60, on_time=ON_TIME) -> None:
+        """
+        Initializes a RollingWindow instance.
+
+        Args:
+            span: Seconds covered.
+            width: Seconds per fine bucket, a divisor of an hour.
+            on_time: Lateness in seconds up to which a movement is on time.
+        """
+
+        self.span    = span
+        self.width   = width
+        self.on_time = on_time
+        self.fine    = BucketRing(span // width, width)
+        self.hours   = BucketRing(span // 3600 + 1, 3600)
+
+    def add(self, actual, scheduled, weight=1):
+        """
+        Counts one movement.
+
+        Args:
+            actual: Actual time of the movement, UNIX seconds.
+            scheduled: Its scheduled time, UNIX seconds.
+            weight: 1 to add the movement, -1 to retract it.
+
+        Returns:
+            False when the movement is older than span (or, for a
+            retraction, its bucket was already recycled) and was ignored.
+        """
+
+        delay   = actual - scheduled
+        on_time = delay <= self.on_time
+        if not self.fine.add(actual, delay, on_time, weight):
+            return False
+        self.hours.add(actual, delay, on_time, weight)
+
+        return True
+
+    def retract(self, actual, scheduled):
+        """Uncounts a movement added before, e.g. when its actual time was corrected."""
+
+        return self.add(actual, scheduled, -1)
+
+    def __totals__(self, first, last):
+        """Totals of fine buckets first to last included, whole hours read from the hour ring."""
+
+        per_hour = 3600 // self.width
+        if last - first < 2 * per_hour:
+            return self.fine.totals(first, last)
+
+        head = self.fine.totals(first, (first // per_hour + 1) * per_hour - 1)
+        body = self.hours.totals(first // per_hour + 1, last // per_hour - 1)
+        tail = self.fine.totals(last // per_hour * per_hour, last)
+
+        return add_totals(add_totals(head, body), tail)
+
+    def stats(self, window, now):
+        """
+        Aggregates the movements of one window.
+
+        Args:
+            window: Length of the window in seconds, at most span.
+            now: End of the window, UNIX seconds.
+
+        Returns:
+            A dict with "movements", "on_time" (percentage), "mean_delay",
+            "p50" and "p90" (delays in minutes), see empty_stats().
+        """
+
+        last = int(now) // self.width
+
+        return window_stats(*self.__totals__(last - min(window, self.span) // self.width + 1, last))
+
+    def summary(self, now):
+        """Returns the stats of every ROLLING_WINDOWS window ending at now, by window name."""
+
+        return {name: self.stats(window, now) for name, window in ROLLING_WINDOWS}
@@ -0,0 +1,360 @@
+import asyncio
+import datetime
+import time
+import pytz
+
+from scripts.fetcher import FetchError, FidsClient, run_every
+from scripts.metrics import NULL_METRICS
+from scripts.poll_planner import PollPlanner
+from scripts.response_cache import ResponseCache
+from scripts.state_store import FlightStateStore
+
+
+def today_window(timezone="Asia/Qatar"):
+    """
+    Returns the [start, end) of today in an airport's timezone.
+
+    Args:
+        timezone: The airport's pytz timezone name.
+
+    Returns:
+        Start and end as UNIX timestamps in milliseconds.
+    """
+
+    tz    = pytz.timezone(timezone)
+    start = datetime.datetime.now(tz=tz).replace(hour=0, minute=0, second=0, microsecond=0)
+    end   = start + datetime.timedelta(1)
+
+    return int(round(start.timestamp())) * 1000, int(round(end.timestamp())) * 1000
+
+
+class BoardSource():
+    """
+    One FIDS-compatible board to poll: an airport and a direction.
+
+    Attributes:
+        name: Unique name of the board in its registry.
+        type: Type of flight data, either "depart" or "arrival".
+        url: The webservice URL of the board.
+        poll_interval: Seconds between two polls of the board, the interval at the day's mean change rate when adaptive.
+        adaptive: Plan each poll from the board's timetable and recent changes (see poll_planner.PollPlanner), not at a fixed interval.
+        min_interval: Shortest interval of an adaptive board.
+        max_interval: Longest interval of an adaptive board, the bound on the time a change waits to be polled.
+        rate: Most requests per second sent to the board, None for no limit.
+        limit: Most flight records asked for.
+        timezone: pytz timezone name of the airport, defines "today".
+        cache_ttl: Seconds an answer is reused without asking the server, 0 always asks.
+        stream: Decode answers while they stream in, keeping only the fields analysis reads.
+    """
+
+    def __init__(self, name, type, url, poll_interval=10, rate=None, limit=3500, timezone="Asia/Qatar", cache_ttl=0, stream=False, adaptive=False,
+                 min_interval=5, max_interval=60) -> None:
+        self.name          = name
+        self.type          = type
+        self.url           = url
+        self.poll_interval = poll_interval
+        self.adaptive      = adaptive
+        self.min_interval  = min_interval
+        self.max_interval  = max_interval
+        self.rate          = rate
+        self.limit         = limit
+        self.timezone      = timezone
+        self.cache_ttl     = cache_ttl
+        self.stream        = stream
+
+    def payload(self):
+        """Returns the request body asking for today's flights."""
+
+        startTime, endTime = today_window(self.timezone)
+
+        return {"limit": self.limit, "startTime": startTime, "endTime": endTime}
+
+
+class SourceRegistry():
+    """
+    The boards a process tracks, by name.
+
+    Attributes:
+        sources: BoardSource by name, in registration order.
+    """
+
+    def __init__(self) -> None:
+        self.sources = dict()
+
+    def register(self, source):
+        """
+        Adds a board.
+
+        Raises:
+            ValueError: When a board of that name is already registered.
+        """
+
+        if source.name in self.sources:
+            raise ValueError("board %r is already registered" % source.name)
+        self.sources[source.name] = source
+
+        return source
+
+    def airport(self, fids_url, prefix="", **options):
+        """
+        Registers the departures and arrivals boards of a FIDS-compatible airport.
+
+        Args:
+            fids_url: Base URL of the airport's FIDS webservices.
+            prefix: Prepended to the board names "depart" and "arrival".
+            options: Other BoardSource arguments, shared by both boards.
+
+        Returns:
+            The (departures, arrivals) sources.
+        """
+
+        return (self.register(BoardSource(prefix + "depart", "depart", fids_url + "departures?", **options)),
+                self.register(BoardSource(prefix + "arrival", "arrival", fids_url + "arrivals?", **options)))
+
+    def __iter__(self):
+        return iter(self.sources.values())
+
+    def __len__(self):
+        return len(self.sources)
+
+    def __getitem__(self, name):
+        return self.sources[name]
+
+
+class RateLimiter():
+    """
+    Token bucket: at most rate acquisitions per second, burst of them at once.
+
+    Attributes:
+        rate: Tokens added per second.
+        burst: Most tokens held.
+    """
+
+    def __init__(self, rate, burst=1) -> None:
+        self.rate    = rate
+        self.burst   = burst
+        self.tokens  = burst
+        self.updated = None
+
+    async def acquire(self):
+        """Waits until a token is available and takes it."""
+
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if self.updated is not None:
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Board():
+    """
+    Runtime state of one registered board, isolated from every other board.
+
+    Attributes:
+        source: The BoardSource polled.
+        store: FlightStateStore of the board.
+        cache: ResponseCache of the board, two boards never share an entry.
+        limiter: RateLimiter of the board, None when it has no rate limit.
+        planner: PollPlanner of an adaptive board, None polls at the fixed interval.
+        listeners: Callables run with (board, delta) after each poll that moved the board.
+        polls: Polls done.
+        changes: Polls that brought a changed payload.
+        errors: Polls whose fetch failed after every retry.
+        failures: Polls whose payload could not be applied, or one of whose listeners failed.
+        fetched_at: UNIX time of the last successful fetch, changed or not, None before the first.
+    """
+
+    def __init__(self, source) -> None:
+        self.source     = source
+        self.store      = FlightStateStore(source.type)
+        self.cache      = ResponseCache(source.cache_ttl)
+        self.limiter    = RateLimiter(source.rate) if source.rate else None
+        self.planner    = PollPlanner(source.poll_interval, source.min_interval, source.max_interval) if source.adaptive else None
+        self.listeners  = []
+        self.polls      = 0
+        self.changes    = 0
+        self.errors     = 0
+        self.failures   = 0
+        self.fetched_at = None
+
+
+class BoardScheduler():
+    """
+    Polls every board of a registry over one pooled client and a bounded worker pool.
+
+    Each board runs its own fixed-rate loop (see fetcher.run_every) at its
+    own interval, or waits the interval its PollPlanner plans after each
+    poll when adaptive, so a slow board never delays another one; at most
+    workers polls are in flight at once, whatever the number of boards,
+    and every board waits on its own rate limiter before each request.
+
+    Attributes:
+        registry: The SourceRegistry polled.
+        client: FidsClient shared by every board.
+        workers: Most polls in flight at once.
+        boards: Board by source name.
+        recorder: replay.Recorder every changed payload is written to, None records nothing.
+        metrics: Metrics the fetch and apply stages, the poll results and the board gauges go to.
+        in_flight: Polls currently holding a worker.
+    """
+
+    def __init__(self, registry, client=None, workers=None, recorder=None, metrics=NULL_METRICS) -> None:
+        """
+        Initializes a BoardScheduler instance.
+
+        Args:
+            registry: The SourceRegistry polled.
+            client: FidsClient shared by every board, a default one when None.
+            workers: Most polls in flight at once, defaults to the client's pool size.
+            recorder: replay.Recorder every changed payload is written to, None records nothing.
+            metrics: Metrics the fetch and apply stages, the poll results and the board gauges go to, off by default.
+        """
+
+        self.registry  = registry
+        self.client    = client if client is not None else FidsClient(metrics=metrics)
+        self.workers   = workers or self.client.pool_size
+        self.boards    = dict()
+        self.recorder  = recorder
+        self.metrics   = metrics
+        self.in_flight = 0
+        self.semaphore = None
+        for source in registry:
+            self.__board__(source)
+        metrics.gauge("polls_in_flight", lambda: self.in_flight)
+
+    def __board__(self, source):
+        """Creates the Board of a source and registers its gauges."""
+
+        board                    = Board(source)
+        self.boards[source.name] = board
+        self.metrics.gauge("flights_on_board", lambda: len(board.store.flights), board=source.name)
+        self.metrics.gauge("data_age_seconds", lambda: time.time() - board.fetched_at if board.fetched_at else float("nan"), board=source.name)
+        if board.planner is not None:
+            self.metrics.gauge("poll_interval_seconds", lambda: board.planner.interval, board=source.name)
+
+        return board
+
+    def add(self, source):
+        """Registers a board and returns its Board, before run() only."""
+
+        self.registry.register(source)
+
+        return self.__board__(source)
+
+    async def poll(self, board):
+        """Fetches and applies one board once, an unchanged board or a failed fetch is skipped."""
+
+        source = board.source
+        if board.limiter is not None:
+            await board.limiter.acquire()  # outside the pool, a throttled board holds no worker
+        async with self.semaphore:
+            board.polls    += 1
+            self.in_flight += 1
+            started         = time.perf_counter()
+            try:
+                if source.stream:
+                    data = await self.client.post_flights(source.url, source.payload(), source.type, cache=board.cache)
+                else:
+                    data = await self.client.post_json(source.url, source.payload(), board.cache)
+            except FetchError as e:
+                board.errors += 1
+                self.metrics.inc("fetches_total", board=source.name, result="error")
+                self.metrics.error("fetch", e, board=source.name)
+                return
+            finally:
+                self.in_flight -= 1
+                self.metrics.observe("stage_seconds", time.perf_counter() - started, stage="fetch", board=source.name)
+            board.fetched_at = time.time()
+            if data is None:
+                self.metrics.inc("fetches_total", board=source.name, result="unchanged")
+                if board.planner is not None:
+                    board.planner.observe(board.fetched_at, board.store)
+                return
+
+        self.metrics.inc("fetches_total", board=source.name, result="changed")
+        # A payload or a listener that fails costs this poll only, the loops of the board and of the others go on.
+        # The store may be half updated then: the answer is forgotten, so the next poll applies it again even when unchanged
+        try:
+            flights = data.get("flights") if isinstance(data, dict) else None
+            if not isinstance(flights, list):
+                raise ValueError("answer has no \"flights\" list: %.200r" % (data,))
+            self.metrics.event("poll", board=source.name, records=len(flights), fetch_seconds=time.perf_counter() - started)
+            delta = self.apply(board, flights)
+        except Exception as e:
+            delta = None
+            board.failures += 1
+            board.cache.forget(source.url)
+            self.metrics.error("apply", e, board=source.name)
+        if board.planner is not None:
+            board.planner.observe(board.fetched_at, board.store, delta)
+
+    async def __run_planned__(self, board, stop=None):
+        """Polls an adaptive board, waiting the interval its planner gives after each poll."""
+
+        while stop is None or not stop.is_set():
+            await self.poll(board)
+            interval = board.planner.next_interval(time.time())
+            if stop is None:
+                await asyncio.sleep(interval)
+            else:
+                try:
+                    await asyncio.wait_for(stop.wait(), interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    def apply(self, board, flights, at=None):
+        """
+        Applies a changed "flights" list to a board and runs its listeners.
+
+        Polls end here, and so do replays (see replay.replay_into).
+
+        Args:
+            board: The Board.
+            flights: The "flights" list of the payload.
+            at: UNIX time of the payload for the recorder, defaults to now.
+
+        Returns:
+            The Delta of the board's state store.
+        """
+
+        if self.recorder is not None:
+            self.recorder.write(time.time() if at is None else at, board.source.name, board.source.type, flights)
+
+        board.changes += 1
+        with self.metrics.time("stage_seconds", stage="apply", board=board.source.name):
+            delta = board.store.apply(flights)
+        self.metrics.inc("records_processed_total", len(flights), board=board.source.name)
+        self.metrics.inc("flights_changed_total", len(delta.inserted) + len(delta.changed) + len(delta.removed), board=board.source.name)
+        for listener in board.listeners:
+            listener(board, delta)
+
+        return delta
+
+    async def run(self, stop=None):
+        """
+        Polls every board until stop is set, opening and closing the shared client.
+
+        Args:
+            stop: Optional asyncio.Event, polling stops once it is set.
+        """
+
+        self.semaphore = asyncio.Semaphore(self.workers)
+        async with self.client:
+            await asyncio.gather(*(self.__run_planned__(board, stop) if board.planner is not None else
+                                   run_every(board.source.poll_interval, lambda board=board: self.poll(board), stop) for board in self.boards.values()))
+
+    def stats(self):
+        """Returns polls, changes, errors, failures, cache stats and the planned interval (adaptive boards) per board."""
+
+        stats = dict()
+        for name, board in self.boards.items():
+            stats[name] = {"polls": board.polls, "changes": board.changes, "errors": board.errors, "failures": board.failures, "cache": board.cache.stats()}
+            if board.planner is not None:
+                stats[name]["interval"] = board.planner.interval
+
+        return stats
@@ -0,0 +1,331 @@
+import struct
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from scripts.breakdown import Breakdown
+from scripts.models import AirlineSummary, Flight
+from scripts.rolling import ROLLING_WINDOWS, empty_stats
+
+
+BOARDS = ("depart", "arrival")
+EMPTY_RECENT = Flight("", 0, 0, "", "", "")
+
+# Shared memory header: version (odd while a write is in progress), payload length
+HEADER = struct.Struct("<QI")
+# Last bytes of the shared memory, written by the reading end: request count (odd while written), language code asked for
+CONTROL = struct.Struct("<Q16s")
+# Per board: version, 24 hourly counts, number of airlines, length of the string block
+BOARD_HEADER = struct.Struct("<Q24IHI")
+# Per airline: flights count, latest scheduled time, has a recent movement, its scheduled and actual times,
+# then its delay stats in DELAY_FIELDS order (a count of 0 meaning none)
+AIRLINE = struct.Struct("<Iq?qqIfffff")
+DELAY_FIELDS = ("count", "on_time", "mean", "p50", "p90", "p99")
+NO_DELAYS = dict.fromkeys(DELAY_FIELDS, 0)
+# Per rolling window, in ROLLING_WINDOWS order: movements, on-time %, mean delay, p50 and p90 delays (minutes)
+ROLLING = struct.Struct("<Iffff")
+ROLLING_FIELDS = ("movements", "on_time", "mean_delay", "p50", "p90")
+STRINGS_PER_AIRLINE = 5
+# Per board breakdown: number of airlines, countries and statuses, of non-empty route and status cells, length of the names block
+BREAKDOWN_HEADER = struct.Struct("<HHHIII")
+ROUTE_CELL = np.dtype([("airline", "<u2"), ("country", "<u2"), ("hour", "u1"), ("flights", "<u4")])
+STATUS_CELL = np.dtype([("airline", "<u2"), ("status", "<u2"), ("flights", "<u4")])
+
+
+def empty_board():
+    """Returns the snapshot of a board nothing was published for yet."""
+
+    return {"version": 0, "hours": [0] * 24, "airlines": [], "rolling": {name: empty_stats() for name, _ in ROLLING_WINDOWS},
+            "breakdown": Breakdown.empty()}
+
+
+def encode_breakdown(breakdown):
+    """
+    Packs a Breakdown: a BREAKDOWN_HEADER, the NUL separated airline,
+    country and status names, then the non-empty cells of its route cube
+    and status table as ROUTE_CELL and STATUS_CELL records.
+    """
+
+    routes     = breakdown.routes
+    status     = breakdown.status
+    route_rows = np.nonzero(routes)
+    cells      = np.empty(len(route_rows[0]), dtype=ROUTE_CELL)
+    cells["airline"], cells["country"], cells["hour"] = route_rows
+    cells["flights"] = routes[route_rows]
+    status_rows      = np.nonzero(status)
+    statuses         = np.empty(len(status_rows[0]), dtype=STATUS_CELL)
+    statuses["airline"], statuses["status"] = status_rows
+    statuses["flights"] = status[status_rows]
+
+    block = "\0".join(breakdown.airlines + breakdown.countries + breakdown.statuses).encode("utf-8")
+
+    return b"".join((BREAKDOWN_HEADER.pack(len(breakdown.airlines), len(breakdown.countries), len(breakdown.statuses), len(cells), len(statuses), len(block)),
+                     block, cells.tobytes(), statuses.tobytes()))
+
+
+def decode_breakdown(buffer, offset):
+    """Unpacks a Breakdown written by encode_breakdown at offset, returns it and the offset after it."""
+
+    airlines, countries, statuses, route_cells, status_cells, length = BREAKDOWN_HEADER.unpack_from(buffer, offset)
+    offset  += BREAKDOWN_HEADER.size
+    names    = str(buffer[offset:offset + length], "utf-8").split("\0") if airlines + countries + statuses else []
+    offset  += length
+    cells    = np.frombuffer(buffer, dtype=ROUTE_CELL, count=route_cells, offset=offset)
+    offset  += cells.nbytes
+    counts   = np.frombuffer(buffer, dtype=STATUS_CELL, count=status_cells, offset=offset)
+    offset  += counts.nbytes
+
+    routes = np.zeros((airlines, countries, 24), dtype=np.int32)
+    routes[cells["airline"], cells["country"], cells["hour"]] = cells["flights"]
+    status = np.zeros((airlines, statuses), dtype=np.int32)
+    status[counts["airline"], counts["status"]] = counts["flights"]
+
+    return Breakdown(names[:airlines], names[airlines:airlines + countries], names[airlines + countries:], routes, status), offset
+
+
+def encode_snapshot(snapshot):
+    """
+    Packs a snapshot into its compact binary layout.
+
+    Per board, in BOARDS order: a BOARD_HEADER, one ROLLING record per
+    rolling window, one AIRLINE record per airline, then one UTF-8 block
+    of NUL separated strings, five per airline (airline, flight number,
+    and the recent movement's flight number, status and country, empty
+    when there is none), then its breakdown (see encode_breakdown).
+    Strings go in a single block so decoding is one decode and one split
+    per board.
+
+    Args:
+        snapshot: {"depart": board, "arrival": board}, a board being a dict
+            with "version", "hours" (24 counts), "airlines" (AirlineSummary
+            list, busiest first), "rolling" (stats by window name, see
+            RollingWindow.summary) and "breakdown" (see breakdown.Breakdown).
+
+    Returns:
+        The encoded bytes.
+    """
+
+    out = []
+    for type in BOARDS:
+        board   = snapshot[type]
+        records = []
+        strings = []
+        for summary in board["airlines"]:
+            recent = summary.recent or EMPTY_RECENT
+            records.append(AIRLINE.pack(
+                summary.flightsCountered,
+                summary.scheduledTime,
+                summary.recent is not None,
+                recent.scheduledTime,
+                recent.actualTime,
+                *((summary.delays or NO_DELAYS)[field] for field in DELAY_FIELDS),
+            ))
+            strings += (summary.airline, summary.flightNumber, recent.flightNumber, recent.status, recent.country)
+
+        block = "\0".join(strings).encode("utf-8")
+        out.append(BOARD_HEADER.pack(board["version"], *board["hours"], len(records), len(block)))
+        out += [ROLLING.pack(*(board["rolling"][name][field] for field in ROLLING_FIELDS)) for name, _ in ROLLING_WINDOWS]
+        out += records
+        out.append(block)
+        out.append(encode_breakdown(board["breakdown"]))
+
+    return b"".join(out)
+
+
+def decode_snapshot(buffer):
+    """
+    Unpacks bytes written by encode_snapshot.
+
+    Args:
+        buffer: The encoded bytes (or a memoryview of them).
+
+    Returns:
+        The snapshot dict.
+    """
+
+    snapshot = dict()
+    offset   = 0
+    for type in BOARDS:
+        fields  = BOARD_HEADER.unpack_from(buffer, offset)
+        offset += BOARD_HEADER.size
+        rolling = dict()
+        for name, _ in ROLLING_WINDOWS:
+            rolling[name] = dict(zip(ROLLING_FIELDS, ROLLING.unpack_from(buffer, offset)))
+            offset       += ROLLING.size
+        count   = fields[25]
+        records = [AIRLINE.unpack_from(buffer, offset + index * AIRLINE.size) for index in range(count)]
+        offset += count * AIRLINE.size
+        strings = str(buffer[offset:offset + fields[26]], "utf-8").split("\0")
+        offset += fields[26]
+        breakdown, offset = decode_breakdown(buffer, offset)
+
+        airlines = []
+        for index, (flights, scheduled, has_recent, recent_scheduled, recent_actual, *delays) in enumerate(records):
+            names  = strings[index * STRINGS_PER_AIRLINE:(index + 1) * STRINGS_PER_AIRLINE]
+            recent = Flight(names[2], recent_scheduled, recent_actual, names[0], names[3], names[4]) if has_recent else None
+            delays = dict(zip(DELAY_FIELDS, delays)) if delays[0] else None
+            airlines.append(AirlineSummary(names[0], flights, names[1], scheduled, recent, delays))
+
+        snapshot[type] = {"version": fields[0], "hours": list(fields[1:25]), "airlines": airlines, "rolling": rolling, "breakdown": breakdown}
+
+    return snapshot
+
+
+class SnapshotChannel():
+    """
+    Single-slot "latest snapshot" channel over multiprocessing.shared_memory.
+
+    The producer overwrites the slot, it never waits for the consumer and
+    nothing piles up if the GUI stalls. The consumer reads without blocking
+    and gets None when the version did not change since its last read.
+    Writes are guarded seqlock style: the version is odd while a write is in
+    progress and the reader retries when it saw an odd or moving version.
+
+    The last CONTROL.size bytes go the other way: the reading end asks the
+    producer for the language names are shown in, guarded the same way.
+
+    Attributes:
+        name: Name of the shared memory block, hand it to the other process.
+        size: Size of the shared memory block in bytes.
+        version: Version of the last snapshot written or read by this end.
+        requests: Count of the last language request written or taken by this end.
+    """
+
+    def __init__(self, name=None, size=1 << 20) -> None:
+        """
+        Creates a new channel, or attaches to an existing one when name is given.
+
+        Args:
+            name: Name of an existing channel, None creates one.
+            size: Size in bytes of a new channel.
+        """
+
+        self.owner   = name is None
+        self.shm     = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.name    = self.shm.name
+        self.size     = self.shm.size
+        self.version  = 0
+        self.requests = 0
+        if self.owner:
+            HEADER.pack_into(self.shm.buf, 0, 0, 0)
+            CONTROL.pack_into(self.shm.buf, self.size - CONTROL.size, 0, b"")
+
+    def publish(self, data):
+        """
+        Overwrites the slot with new snapshot bytes. Only one process may publish.
+
+        Args:
+            data: Encoded snapshot, see encode_snapshot.
+        """
+
+        if HEADER.size + len(data) + CONTROL.size > self.size:
+            raise ValueError("snapshot of %d bytes does not fit a %d bytes channel" % (len(data), self.size))
+
+        buf           = self.shm.buf
+        self.version += 1
+        HEADER.pack_into(buf, 0, 2 * self.version - 1, len(data))
+        buf[HEADER.size:HEADER.size + len(data)] = data
+        HEADER.pack_into(buf, 0, 2 * self.version, len(data))
+
+    def read(self, retries=100):
+        """
+        Returns the latest snapshot bytes if they changed since the last read.
+
+        Args:
+            retries: How many torn reads to retry before giving up for this frame.
+
+        Returns:
+            The snapshot bytes, or None when nothing new was published.
+        """
+
+        buf = self.shm.buf
+        for _ in range(retries):
+            sequence, length = HEADER.unpack_from(buf, 0)
+            if sequence == 2 * self.version:
+                return None
+            if sequence % 2:
+                time.sleep(0)
+                continue
+
+            data = bytes(buf[HEADER.size:HEADER.size + length])
+            if HEADER.unpack_from(buf, 0)[0] == sequence:
+                self.version = sequence // 2
+                return data
+
+        return None
+
+    def request_language(self, lanCode):
+        """
+        Asks the producer to show names in another language. Only one process may ask.
+
+        Args:
+            lanCode: The language code, e.g. "ar".
+        """
+
+        buf            = self.shm.buf
+        offset         = self.size - CONTROL.size
+        self.requests += 1
+        code           = lanCode.encode("ascii")
+        CONTROL.pack_into(buf, offset, 2 * self.requests - 1, code)
+        CONTROL.pack_into(buf, offset, 2 * self.requests, code)
+
+    def requested_language(self):
+        """
+        Takes the language last asked for with request_language.
+
+        Returns:
+            The language code, None when nothing new was asked since the last call.
+        """
+
+        buf    = self.shm.buf
+        offset = self.size - CONTROL.size
+        for _ in range(100):
+            sequence, code = CONTROL.unpack_from(buf, offset)
+            if sequence == 2 * self.requests:
+                return None
+            if sequence % 2 == 0 and CONTROL.unpack_from(buf, offset)[0] == sequence:
+                self.requests = sequence // 2
+                return code.rstrip(b"\0").decode("ascii")
+            time.sleep(0)
+
+        return None
+
+    def close(self):
+        """Detaches from the channel, the creating end also frees it."""
+
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class SnapshotReader():
+    """
+    Consumer side cache of a SnapshotChannel, shared by every panel of the GUI.
+
+    Bytes are decoded once per published version, however many panels ask.
+
+    Attributes:
+        channel: The SnapshotChannel read from.
+        snapshot: The last decoded snapshot.
+        read_at: UNIX time the last new snapshot was read, None before the first.
+        skipped: Snapshots published but overwritten before they were read.
+    """
+
+    def __init__(self, channel) -> None:
+        self.channel  = channel
+        self.snapshot = {type: empty_board() for type in BOARDS}
+        self.read_at  = None
+        self.skipped  = 0
+
+    def latest(self):
+        """Returns the latest snapshot, reading the channel without blocking."""
+
+        version = self.channel.version
+        data    = self.channel.read()
+        if data is not None:
+            self.snapshot  = decode_snapshot(data)
+            self.read_at   = time.time()
+            self.skipped  += max(self.channel.version - version - 1, 0)
+
+        return self.snapshot
@@ -0,0 +1,251 @@
+from scripts.localization import key_names
+from scripts.models import DIRECTIONS, QATAR_UTC_OFFSET, Flight, make_summary
+
+
+def flight_key(flight):
+    """Returns the key identifying a flight across polls: flight number + scheduled time."""
+
+    return (flight["flightNumber"], flight["scheduledTime"])
+
+
+class Delta():
+    """
+    What one poll changed in a FlightStateStore.
+
+    Attributes:
+        inserted: Keys of flights that were not on the board before.
+        changed: Keys of flights whose airline, status, actual time or country (a diversion) moved.
+        removed: Keys of flights that left the board.
+        airlines: Airlines whose count, latest flight or most recent movement moved.
+        moved: (key, old actual time, new actual time) of every flight whose
+            actual time was set or moved, 0 standing for none. Flights that
+            leave the board are not in it: they moved, they did not unmove.
+        statuses: (key, old status, new status) of every flight already on
+            the board whose status changed, key (KEY_LANGUAGE) names.
+        hours_changed: True when the hourly movement counts moved.
+    """
+
+    def __init__(self) -> None:
+        self.inserted      = []
+        self.changed       = []
+        self.removed       = []
+        self.airlines      = set()
+        self.moved         = []
+        self.statuses      = []
+        self.hours_changed = False
+
+    def __bool__(self):
+        return bool(self.inserted or self.changed or self.removed)
+
+
+class FlightStateStore():
+    """
+    Flight-keyed state of one board, updated incrementally between polls.
+
+    Every new payload is diffed against the previous one and the per-airline
+    counts, the hourly movement buckets and the latest / most recent flight
+    are only touched for inserted, changed or removed flights, so a quiet
+    poll costs one dict lookup per flight and no aggregation at all.
+
+    Flights are told apart and grouped by their KEY_LANGUAGE names, so the
+    aggregates do not depend on the language names are shown in: airlines
+    are keyed by key name, summaries carry the name of the current language.
+
+    Attributes:
+        type: Type of flight data, either "depart" or "arrival".
+        flights: Current Flight by flight key, built once when a flight is inserted or changes.
+        signatures: (airline, status, raw actual time, country) per flight key, the
+            fields the aggregates depend on, interned key names.
+        counts: Number of flights per airline.
+        hour_counts: 24 hourly counts of actual movements in Asia/Qatar time.
+        latest: Key of the latest scheduled flight per airline.
+        recent: Key of the most recent actual movement per airline.
+    """
+
+    def __init__(self, type) -> None:
+        """
+        Initializes a FlightStateStore instance.
+
+        Args:
+            type: Type of flight data, either "depart" or "arrival".
+        """
+
+        self.type        = type
+        self.actual_key  = DIRECTIONS[type][0]
+        self.country_key = DIRECTIONS[type][1]
+        self.flights     = dict()
+        self.signatures  = dict()
+        self.by_airline  = dict()
+        self.counts      = dict()
+        self.hour_counts = [0] * 24
+        self.latest      = dict()
+        self.recent      = dict()
+
+    def apply(self, flights):
+        """
+        Diffs a new "flights" list against the current state and updates the aggregates.
+
+        Args:
+            flights: The "flights" list of a webservice payload.
+
+        Returns:
+            The Delta of this poll.
+        """
+
+        delta       = Delta()
+        dirty       = set()
+        seen        = set()
+        signatures  = self.signatures
+        actual_key  = self.actual_key
+        country_key = self.country_key
+
+        for flight in flights:
+            # Raw fields only: a flight that did not move costs one lookup and one compare.
+            # Normalized like Flight.from_record interns them, or the stored signature would never match
+            lang      = key_names(flight["lang"])
+            key       = (flight["flightNumber"], flight["scheduledTime"])
+            signature = (lang.get("airlineName") or "", lang.get("flightStatus") or "", flight.get(actual_key), lang.get(country_key) or "")
+            seen.add(key)
+
+            previous = signatures.get(key)
+            if previous == signature:
+                continue
+            if previous is None:
+                self.__insert__(key, flight, signature, delta)
+                delta.inserted.append(key)
+                if signature[2]:
+                    delta.moved.append((key, 0, int(signature[2])))
+                continue
+            if previous[1] != signature[1]:
+                delta.statuses.append((key, previous[1], signature[1]))
+            if previous[2] != signature[2]:
+                delta.moved.append((key, int(previous[2]) if previous[2] else 0, int(signature[2]) if signature[2] else 0))
+            if previous[0] == signature[0]:
+                self.__replace__(key, flight, previous, signature, delta, dirty)
+                delta.changed.append(key)
+            else:
+                self.__remove__(key, delta, dirty)
+                self.__insert__(key, flight, signature, delta)
+                delta.changed.append(key)
+
+        if len(seen) != len(signatures):
+            for key in [key for key in signatures if key not in seen]:
+                self.__remove__(key, delta, dirty)
+                delta.removed.append(key)
+
+        for airline in dirty:
+            self.__refresh_airline__(airline)
+
+        return delta
+
+    def __insert__(self, key, flight, signature, delta):
+        actual = int(signature[2]) if signature[2] else 0
+
+        # The interned names are kept, not the strings of this payload
+        record               = self.flights[key] = Flight.from_record(flight, self.type)
+        airline              = record.airline_key
+        self.signatures[key] = (airline, record.status_key, signature[2], record.country_key)
+        self.by_airline.setdefault(airline, set()).add(key)
+        self.counts[airline] = self.counts.get(airline, 0) + 1
+        delta.airlines.add(airline)
+
+        latest = self.latest.get(airline)
+        if latest is None or (int(key[1]), key[0]) > (int(latest[1]), latest[0]):
+            self.latest[airline] = key
+
+        if actual:
+            self.hour_counts[(actual + QATAR_UTC_OFFSET) // 3600 % 24] += 1
+            delta.hours_changed = True
+
+            recent = self.recent.get(airline)
+            if recent is None or (actual, key) > (int(self.signatures[recent][2]), recent):
+                self.recent[airline] = key
+
+    def __remove__(self, key, delta, dirty):
+        airline, _, actual, _ = self.signatures.pop(key)
+        actual                = int(actual) if actual else 0
+
+        del self.flights[key]
+        self.by_airline[airline].discard(key)
+        self.counts[airline] -= 1
+        delta.airlines.add(airline)
+
+        # Only losing the current latest / most recent flight needs a rescan of the airline
+        if self.latest.get(airline) == key:
+            del self.latest[airline]
+            dirty.add(airline)
+        if self.recent.get(airline) == key:
+            del self.recent[airline]
+            dirty.add(airline)
+
+        if actual:
+            self.hour_counts[(actual + QATAR_UTC_OFFSET) // 3600 % 24] -= 1
+            delta.hours_changed = True
+
+    def __replace__(self, key, flight, previous, signature, delta, dirty):
+        """Updates a flight that stayed with the same airline: count and latest flight cannot move."""
+
+        airline  = previous[0]
+        old      = int(previous[2]) if previous[2] else 0
+        actual   = int(signature[2]) if signature[2] else 0
+
+        record               = self.flights[key] = Flight.from_record(flight, self.type)
+        self.signatures[key] = (airline, record.status_key, signature[2], record.country_key)
+        delta.airlines.add(airline)
+
+        if old != actual:
+            delta.hours_changed = True
+            if old:
+                self.hour_counts[(old + QATAR_UTC_OFFSET) // 3600 % 24] -= 1
+            if actual:
+                self.hour_counts[(actual + QATAR_UTC_OFFSET) // 3600 % 24] += 1
+
+            recent = self.recent.get(airline)
+            if recent == key and actual < old:
+                del self.recent[airline]
+                dirty.add(airline)
+            elif actual and (recent is None or (actual, key) > (int(self.signatures[recent][2]), recent)):
+                self.recent[airline] = key
+
+    def __refresh_airline__(self, airline):
+        """Recomputes the latest and most recent flight of an airline that lost one of them."""
+
+        keys = self.by_airline[airline]
+        if not keys:
+            del self.by_airline[airline]
+            del self.counts[airline]
+            self.latest.pop(airline, None)
+            self.recent.pop(airline, None)
+            return
+
+        signatures           = self.signatures
+        self.latest[airline] = max(keys, key=lambda key: (int(key[1]), key[0]))
+        moved                = [key for key in keys if signatures[key][2]]
+        if moved:
+            self.recent[airline] = max(moved, key=lambda key: (int(signatures[key][2]), key))
+
+    def top_airlines(self, n):
+        """Returns the key names of the n airlines with the most flights, busiest first."""
+
+        return sorted(self.counts, key=self.counts.get, reverse=True)[:n]
+
+    def summaries(self, airlines):
+        """
+        Builds the per-airline summaries the plots consume.
+
+        Args:
+            airlines: Key names of the airlines to summarize.
+
+        Returns:
+            A dict mapping each airline key name to its summary (see
+            make_summary), named in the current language.
+        """
+
+        flights_data = dict()
+        for airline in airlines:
+            recent                = self.recent.get(airline)
+            recent                = self.flights[recent] if recent else None
+            latest                = self.flights[self.latest[airline]]
+            flights_data[airline] = make_summary(latest.airline, self.counts[airline], latest, recent)
+
+        return flights_data
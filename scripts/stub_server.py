@@ -0,0 +1,206 @@
+import argparse
+import asyncio
+import hashlib
+import json
+
+from aiohttp import web
+
+from scripts.synthetic import make_payload
+
+
+class StubFidsServer():
+    """
+    Local stand-in for the FIDS webservices, for tests and benchmarks.
+
+    Serves POST <prefix>departures and <prefix>arrivals with synthetic
+    payloads, honouring the "limit", "startTime" and "endTime" body fields
+    like the real endpoints. Latency and failures can be injected, and
+    ETag / If-None-Match revalidation can be turned on.
+
+    Attributes:
+        flights: Synthetic flight list per board ("depart" / "arrival").
+        delay: Seconds to wait before answering.
+        fail_every: Answer HTTP 503 to every Nth request, 0 never fails.
+        etag: Send an ETag and answer 304 to a matching If-None-Match.
+        requests: Number of requests received.
+        bytes_sent: Body bytes sent.
+        url: Base URL to hand to FlightsManager as fids_url, set by start().
+    """
+
+    def __init__(self, flights_per_board=3500, delay=0, fail_every=0, seed=0, prefix="/webservices/fids/", etag=False) -> None:
+        """
+        Initializes a StubFidsServer instance.
+
+        Args:
+            flights_per_board: How many synthetic flights each board holds.
+            delay: Seconds to wait before answering.
+            fail_every: Answer HTTP 503 to every Nth request, 0 never fails.
+            seed: Seed of the synthetic payloads.
+            prefix: URL path the boards are served under.
+            etag: Send an ETag and answer 304 to a matching If-None-Match.
+        """
+
+        self.flights    = {
+            "depart": make_payload(flights_per_board, "depart", seed)["flights"],
+            "arrival": make_payload(flights_per_board, "arrival", seed + 1)["flights"],
+        }
+        self.delay      = delay
+        self.fail_every = fail_every
+        self.prefix     = prefix
+        self.etag       = etag
+        self.requests   = 0
+        self.bytes_sent = 0
+        self.url        = None
+        self.runner     = None
+
+    def app(self):
+        """Returns the aiohttp application serving both boards."""
+
+        app = web.Application()
+        app.router.add_post(self.prefix + "departures", self.__board_handler__("depart"))
+        app.router.add_post(self.prefix + "arrivals", self.__board_handler__("arrival"))
+
+        return app
+
+    def __board_handler__(self, type):
+        async def handler(request):
+            self.requests += 1
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            if self.fail_every and self.requests % self.fail_every == 0:
+                raise web.HTTPServiceUnavailable()
+
+            body = json.loads(await request.text() or "{}")
+            raw  = json.dumps({"flights": self.select(type, body)}).encode()
+
+            headers = dict()
+            if self.etag:
+                headers["ETag"] = '"%s"' % hashlib.blake2b(raw, digest_size=16).hexdigest()
+                if request.headers.get("If-None-Match") == headers["ETag"]:
+                    return web.Response(status=304, headers=headers)
+
+            self.bytes_sent += len(raw)
+
+            return web.Response(body=raw, content_type="application/json", headers=headers)
+
+        return handler
+
+    def select(self, type, body):
+        """
+        Returns the flights of a board matching a request body.
+
+        Args:
+            type: Type of flight data, either "depart" or "arrival".
+            body: Decoded request body with optional "limit", "startTime" and "endTime" (ms).
+        """
+
+        start   = body.get("startTime")
+        end     = body.get("endTime")
+        flights = self.flights[type]
+        if start is not None and end is not None:
+            start   = start // 1000
+            end     = end // 1000
+            flights = [flight for flight in flights if start <= int(flight["scheduledTime"]) < end]
+
+        return flights[:body.get("limit", len(flights))]
+
+    async def start(self, host="127.0.0.1", port=0):
+        """
+        Starts serving in the running event loop.
+
+        Args:
+            host: Interface to bind.
+            port: Port to bind, 0 picks a free one.
+
+        Returns:
+            The base URL of the boards.
+        """
+
+        self.runner = web.AppRunner(self.app())
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+
+        self.url = "http://%s:%d%s" % (host, self.runner.addresses[0][1], self.prefix)
+
+        return self.url
+
+    async def stop(self):
+        """Stops serving."""
+
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+class WebhookReceiver():
+    """
+    Local stand-in for a webhook endpoint, for notifications.WebhookSink in tests and benchmarks.
+
+    Accepts POSTs of JSON lists on its path and keeps every item, answering
+    204 No Content like many real endpoints do.
+
+    Attributes:
+        received: Every item posted, in arrival order.
+        requests: Number of POSTs received.
+        url: URL to hand to a WebhookSink, set by start().
+    """
+
+    def __init__(self, path="/hook") -> None:
+        self.path     = path
+        self.received = []
+        self.requests = 0
+        self.url      = None
+        self.runner   = None
+
+    def app(self):
+        """Returns the aiohttp application of the endpoint."""
+
+        app = web.Application()
+        app.router.add_post(self.path, self.__handler__)
+
+        return app
+
+    async def __handler__(self, request):
+        self.requests += 1
+        items          = json.loads(await request.text())
+        self.received += items
+
+        return web.Response(status=204)
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Starts serving in the running event loop and returns the endpoint URL."""
+
+        self.runner = web.AppRunner(self.app())
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+
+        self.url = "http://%s:%d%s" % (host, self.runner.addresses[0][1], self.path)
+
+        return self.url
+
+    async def stop(self):
+        """Stops serving."""
+
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stub of the Hamad airport FIDS webservices.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--flights", type=int, default=3500, help="synthetic flights per board")
+    parser.add_argument("--delay", type=float, default=0, help="seconds before each answer")
+    parser.add_argument("--fail-every", type=int, default=0, help="answer 503 to every Nth request")
+    parser.add_argument("--etag", action="store_true", help="send ETags and answer 304 when unchanged")
+    args = parser.parse_args()
+
+    server = StubFidsServer(args.flights, args.delay, args.fail_every, etag=args.etag)
+    web.run_app(server.app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import random
+import datetime
+import pytz
+
+
+AIRLINES = [
+    "Qatar Airways", "Emirates", "Turkish Airlines", "British Airways", "Lufthansa",
+    "Oman Air", "Saudia", "Etihad Airways", "flydubai", "IndiGo", "Air India",
+    "Pakistan International", "Kuwait Airways", "Gulf Air", "Royal Jordanian",
+    "EgyptAir", "Singapore Airlines", "Cathay Pacific", "KLM", "Air France",
+]
+
+COUNTRIES = [
+    "United Kingdom", "India", "Pakistan", "Egypt", "Turkey", "Germany", "France",
+    "United Arab Emirates", "Saudi Arabia", "Oman", "Kuwait", "Bahrain", "Jordan",
+    "Singapore", "Hong Kong", "Netherlands", "United States", "Kenya", "Nepal",
+]
+
+STATUSES = ["Scheduled", "On Time", "Delayed", "Boarding", "Departed", "Landed", "Cancelled"]
+
+# Relative flights per scheduled hour (Asia/Qatar) of a hub working in waves: dense banks around 02:00, 08:00 and
+# 19:00, next to nothing in the early morning
+HUB_WAVES = [8, 10, 12, 9, 2, 1, 1, 4, 10, 11, 7, 3, 2, 2, 3, 4, 6, 9, 12, 12, 9, 6, 5, 6]
+
+
+def day_start(day=None):
+    """
+    Returns midnight of the given day in Asia/Qatar as a UNIX timestamp.
+
+    Args:
+        day: A datetime.date, defaults to today in Asia/Qatar.
+
+    Returns:
+        Midnight of that day in seconds.
+    """
+
+    tz = pytz.timezone('Asia/Qatar')
+    if day is None:
+        day = datetime.datetime.now(tz=tz).date()
+    start = tz.localize(datetime.datetime(day.year, day.month, day.day))
+
+    return int(start.timestamp())
+
+
+def make_flight(rng, type, start, span=86400):
+    """
+    Builds one FIDS-shaped flight record.
+
+    Args:
+        rng: A random.Random instance.
+        type: Type of flight data, either "depart" or "arrival".
+        start: Window start as a UNIX timestamp in seconds.
+        span: Window length in seconds.
+
+    Returns:
+        A flight dict shaped like the ones in the webservice "flights" list.
+    """
+
+    airline   = AIRLINES[min(int(rng.expovariate(0.25)), len(AIRLINES) - 1)]
+    country   = rng.choice(COUNTRIES)
+    status    = rng.choice(STATUSES)
+    scheduled = start + rng.randrange(span)
+    actual    = None
+    if status in ("Departed", "Landed", "Delayed"):
+        actual = str(scheduled + rng.randrange(-600, 3600))
+
+    country_key = "destinationCountry" if type == "depart" else "originCountry"
+    flight = {
+        "flightNumber": "%s%d" % (airline[:2].upper(), rng.randrange(1, 9999)),
+        "scheduledTime": str(scheduled),
+        "actualTimeOfDep": actual if type == "depart" else None,
+        "actualTimeOfArr": actual if type != "depart" else None,
+        "lang": {
+            "en": {"airlineName": airline, "flightStatus": status, country_key: country},
+            "ar": {"airlineName": "ar:" + airline, "flightStatus": "ar:" + status, country_key: "ar:" + country},
+        },
+    }
+
+    return flight
+
+
+def make_payload(count, type="depart", seed=0, start=None, span=86400):
+    """
+    Builds a synthetic webservice payload for benchmarks and the stub server.
+
+    Args:
+        count: Number of flight records.
+        type: Type of flight data, either "depart" or "arrival".
+        seed: Seed so runs are reproducible.
+        start: Window start as a UNIX timestamp in seconds, defaults to today.
+        span: Window length in seconds.
+
+    Returns:
+        A dict with a "flights" list.
+    """
+
+    rng   = random.Random(seed)
+    start = day_start() if start is None else start
+
+    return {"flights": [make_flight(rng, type, start, span) for _ in range(count)]}
+
+
+def simulate_day(count, type="depart", seed=0, interval=10, start=None, weights=None):
+    """
+    Simulates the polls of one board over a day, flights moving as time passes.
+
+    Every flight gets a delay; from an hour before its scheduled time it
+    shows "On Time" or "Delayed", then "Departed" / "Landed" with its actual
+    time once that time is reached, a few are cancelled. Polls share the
+    records of flights that did not change, like successive decoded
+    payloads would compare.
+
+    Args:
+        count: Number of flights on the board.
+        type: Type of flight data, either "depart" or "arrival".
+        seed: Seed so runs are reproducible.
+        interval: Seconds between two polls.
+        start: Midnight of the simulated day as a UNIX timestamp, defaults to today.
+        weights: Relative flights per scheduled hour, e.g. HUB_WAVES, None spreads them evenly.
+
+    Yields:
+        (poll time, "flights" list) pairs, from midnight to the next one.
+    """
+
+    rng         = random.Random(seed)
+    start       = day_start() if start is None else start
+    actual_key  = "actualTimeOfDep" if type == "depart" else "actualTimeOfArr"
+    country_key = "destinationCountry" if type == "depart" else "originCountry"
+    moved       = "Departed" if type == "depart" else "Landed"
+
+    def record(number, airline, country, scheduled, status, actual):
+        return {
+            "flightNumber": number,
+            "scheduledTime": str(scheduled),
+            "actualTimeOfDep": None,
+            "actualTimeOfArr": None,
+            actual_key: str(actual) if actual else None,
+            "lang": {
+                "en": {"airlineName": airline, "flightStatus": status, country_key: country},
+                "ar": {"airlineName": "ar:" + airline, "flightStatus": "ar:" + status, country_key: "ar:" + country},
+            },
+        }
+
+    flights = []
+    events  = []
+    for index in range(count):
+        airline   = AIRLINES[min(int(rng.expovariate(0.25)), len(AIRLINES) - 1)]
+        country   = rng.choice(COUNTRIES)
+        number    = "%s%d" % (airline[:2].upper(), index)
+        if weights is None:
+            scheduled = start + rng.randrange(86400)
+        else:
+            scheduled = start + rng.choices(range(24), weights)[0] * 3600 + rng.randrange(3600)
+        delay     = int(rng.expovariate(1 / 900)) - 300
+        flights.append(record(number, airline, country, scheduled, "Scheduled", None))
+        if rng.random() < 0.02:
+            events.append((scheduled - 3600, index, record(number, airline, country, scheduled, "Cancelled", None)))
+            continue
+        events.append((scheduled - 3600, index, record(number, airline, country, scheduled, "Delayed" if delay > 900 else "On Time", None)))
+        events.append((scheduled + delay, index, record(number, airline, country, scheduled, moved, scheduled + delay)))
+    events.sort(key=lambda event: event[0])
+
+    applied = 0
+    for poll in range(86400 // interval):
+        now = start + poll * interval
+        if applied < len(events) and events[applied][0] <= now:
+            flights = list(flights)
+            while applied < len(events) and events[applied][0] <= now:
+                flights[events[applied][1]] = events[applied][2]
+                applied += 1
+        yield now, flights